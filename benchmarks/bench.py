@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+Time the main operations of yatta on synthetic logs, and compare them
+with a baseline.
+
+Logs of a day, a month and two years are generated by synthetic.py.
+For each of them, the script times Logs.load, Context.filter_time,
+group_category, group_by("CD"), show_total, print_one_time_line,
+Logs.append of all the logs to a new file, and the build and range
+totals of a DurationIndex.
+
+Times are the best of several runs, with the categories already cached.
+Each one is divided by the time of a fixed pure Python loop, measured
+right after it, so that the comparison with the baseline does not
+depend on the machine nor on the load of the machine when it ran.
+The script fails if an operation is more than --tolerance slower,
+three times in a row.
+
+    python benchmarks/bench.py                  # compare with baseline.json
+    python benchmarks/bench.py --save           # store a new baseline
+    python benchmarks/bench.py -s day -s month  # only the small logs
+"""
+
+import contextlib
+import io
+import json
+import platform
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, Optional, Tuple
+
+import click
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.context import Context
+from src.core import DAY, LogEntry, Logs
+from src.durations import DurationIndex
+from src.show import print_one_time_line, show_total
+from synthetic import SIZES, synthetic_log
+
+BASELINE = Path(__file__).parent / "baseline.json"
+CONFIG = ROOT / "data" / "config.py"
+# Differences smaller than this are noise
+MIN_DIFFERENCE = 0.005
+
+
+def best(func: Callable, setup: Optional[Callable] = None, min_time=0.5, min_runs=3, max_runs=20) -> float:
+    """Return the shortest time of func(setup()), over at least [min_runs] runs and [min_time] seconds."""
+
+    times = []
+    while len(times) < max_runs and (len(times) < min_runs or sum(times) < min_time):
+        arg = setup() if setup else None
+        start = perf_counter()
+        func(arg) if setup else func()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def calibrate() -> float:
+    """Time a fixed amount of pure Python work, to compare machines and loads."""
+
+    def work():
+        d = {}
+        for i in range(200_000):
+            d[i % 1000] = d.get(i % 1000, 0) + i * i
+        return sorted(str(v) for v in d.values())
+
+    return best(work, min_runs=5)
+
+
+def quiet(func: Callable) -> Callable:
+    """Run [func] without printing."""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+    return run
+
+
+def regressed(result: Tuple[float, float], expected: Optional[list], tolerance: float) -> bool:
+    """Whether [result] is more than [tolerance] slower than the [expected] one of the baseline."""
+    if expected is None:
+        return False
+    t, calibration = result
+    expected = expected[0] * calibration / expected[1]
+    return t > expected * (1 + tolerance) and t - expected > MIN_DIFFERENCE
+
+
+def bench_size(ctx: Context, days: int, baseline: Dict[str, list], tolerance: float) -> Dict[str, Tuple[float, float]]:
+    """Return the time of each operation, and the calibration time measured with it.
+
+    Operations that look slower than in the [baseline] are measured
+    again, since the load of the machine varies. Without a baseline,
+    every operation is measured three times."""
+    with tempfile.TemporaryDirectory() as tmp:
+        file = Path(tmp) / "log"
+        file.write_text(synthetic_log(days))
+        out = Path(tmp) / "out"
+
+        logs = Logs.load(file)
+        span = logs[-1].end - logs[0].start
+        start, end = logs[0].start + span / 4, logs[-1].end - span / 4
+        cats = ctx.group_category(logs)
+        index = DurationIndex(ctx, logs)
+        # A hundred ranges of a day, over the whole log
+        ranges = [(logs[0].start + i * span / 100, logs[0].start + i * span / 100 + DAY) for i in range(100)]
+
+        def copies():
+            out.unlink(missing_ok=True)
+            # Logs.append changes the end of the logs it merges
+            return [LogEntry.from_micros(log.start_us, log.klass, log.name, log.end_us) for log in logs]
+
+        def append(entries):
+            with Logs(file=out) as written:
+                for log in entries:
+                    written.append(log)
+
+        benchmarks = {
+            "load": (lambda: Logs.load(file), None),
+            "filter_time": (lambda: list(ctx.filter_time(logs, start, end)), None),
+            "group_category": (lambda: ctx.group_category(logs), None),
+            "group_by_CD": (lambda: ctx.group_by(logs, "CD"), None),
+            "show_total": (quiet(lambda: show_total(cats)), None),
+            "print_one_time_line": (quiet(lambda: print_one_time_line(ctx, logs)), None),
+            "append": (append, copies),
+            "duration_index": (lambda: DurationIndex(ctx, logs), None),
+            "range_totals": (lambda: [index.totals(a, b) for a, b in ranges], None),
+        }
+        results = {}
+        for name, (func, setup) in benchmarks.items():
+            for _ in range(3):
+                result = best(func, setup), calibrate()
+                if name not in results or result[0] / result[1] < results[name][0] / results[name][1]:
+                    results[name] = result
+                # A new baseline keeps the best of three measures
+                if baseline and not regressed(results[name], baseline.get(name), tolerance):
+                    break
+        return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """Print the results next to the baseline, and return whether one regressed."""
+
+    print(f"{'':>10} {'':<20} {'time':>9}  {'baseline':>9}  relative to the baseline")
+    failed = False
+    for size, times in results["times"].items():
+        for name, (t, calibration) in times.items():
+            expected = baseline["times"].get(size, {}).get(name)
+            if expected is None:
+                print(f"{size:>10} {name:<20} {t * 1000:7.1f}ms  (not in the baseline)")
+                continue
+            slower = regressed((t, calibration), expected, tolerance)
+            failed |= slower
+            # The time the baseline would take on this machine now
+            expected = expected[0] * calibration / expected[1]
+            ratio = t / expected
+            status = "REGRESSION" if slower else "faster" if ratio < 1 - tolerance else ""
+            print(f"{size:>10} {name:<20} {t * 1000:7.1f}ms  {expected * 1000:7.1f}ms  {ratio:5.2f}x  {status}")
+    return failed
+
+
+@click.command()
+@click.option("--size", "-s", "sizes", multiple=True, type=click.Choice(list(SIZES)),
+              help="Sizes of logs to benchmark, all by default.")
+@click.option("--save", is_flag=True, help="Store the results as the new baseline.")
+@click.option("--baseline", default=BASELINE.as_posix(), type=Path, help="Baseline to compare with.")
+@click.option("--tolerance", default=0.3, help="Slowdown allowed before failing, 0.3 is 30%.")
+@click.option("--output", "-o", type=Path, help="Also write the results to this json file.")
+def main(sizes, save, baseline, tolerance, output):
+    with contextlib.redirect_stdout(io.StringIO()):
+        ctx = Context.load(CONFIG)
+
+    old = json.loads(baseline.read_text()) if baseline.exists() and not save else {"times": {}}
+    results = {
+        "python": platform.python_version(),
+        # size -> operation -> [seconds, seconds of the calibration loop]
+        "times": {size: bench_size(ctx, SIZES[size], old["times"].get(size, {}), tolerance)
+                  for size in sizes or SIZES},
+    }
+
+    if output:
+        output.write_text(json.dumps(results, indent=2))
+    if save:
+        baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print("Baseline saved to", baseline)
+        return
+
+    sys.exit(compare(results, old, tolerance))
+
+
+if __name__ == '__main__':
+    main()
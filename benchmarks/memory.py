@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Measure the memory taken by the logs of a synthetic year.
+
+The log is generated by synthetic.py, so runs can be compared.
+The script reports the memory of the loaded logs, per entry, and the
+memory allocated to clamp all of them with Context.filter_time.
+
+    python benchmarks/memory.py [--days 365] [--binary]
+"""
+
+import gc
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+import click
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.context import Context
+from src.core import Logs
+from src.store import convert
+from synthetic import synthetic_log
+
+
+def measure(func):
+    """Return the result of func(), the memory it still holds, its peak and the time it took."""
+    gc.collect()
+    tracemalloc.start()
+    start = perf_counter()
+    result = func()
+    duration = perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, duration
+
+
+@click.command()
+@click.option("--days", default=365, help="Days of logs to generate.")
+@click.option("--binary", is_flag=True, help="Load the logs from a binary store instead of the text log.")
+def main(days, binary):
+    with tempfile.TemporaryDirectory() as tmp:
+        file = Path(tmp) / "log"
+        file.write_text(synthetic_log(days))
+        if binary:
+            convert(file, Path(tmp) / "log.d")
+            file = Path(tmp) / "log.d"
+
+        logs, held, peak, duration = measure(lambda: Logs.load(file))
+        n = len(logs)
+        print(f"{n} logs loaded in {duration:.2f}s")
+        print(f"  held  {held / 2 ** 20:7.1f} MiB  {held / n:6.0f} B/log")
+        print(f"  peak  {peak / 2 ** 20:7.1f} MiB")
+
+        clamped, held, peak, duration = measure(
+            lambda: list(Context.filter_time(logs, datetime.min, datetime.max)))
+        print(f"{len(clamped)} logs clamped in {duration:.2f}s")
+        print(f"  held  {held / 2 ** 20:7.1f} MiB  {held / n:6.0f} B/log")
+
+
+if __name__ == '__main__':
+    main()
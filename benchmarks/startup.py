@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Measure the startup time of the reporting commands, and check that
+they never talk to the window manager.
+
+Each command runs in a fresh interpreter with an audit hook that records
+every subprocess and every unix socket connection. The script fails if
+any of the reporting commands does one of them.
+
+    python benchmarks/startup.py [--runs N]
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import click
+
+ROOT = Path(__file__).parent.parent
+
+BOOTSTRAP = """
+import json, sys
+
+events = []
+def hook(event, args):
+    if event == "subprocess.Popen" or event == "socket.connect" and isinstance(args[1], str):
+        events.append([event, str(args[1])])
+sys.addaudithook(hook)
+
+sys.argv = ["yatta.py"] + json.loads(sys.argv[1])
+try:
+    from src.cli import yatta
+    yatta()
+finally:
+    print("\\nAUDIT", json.dumps(events))
+"""
+
+LOG = """---
+2024-01-01T10:00:00
+terminator
+nvim
+2024-01-01T10:30:00
+---
+2024-01-01T10:30:00
+firefox
+Youtube - Mozilla Firefox
+2024-01-01T11:00:00
+"""
+
+
+def run(args):
+    """Run yatta with [args], return the wall time and the audited events."""
+    start = perf_counter()
+    out = subprocess.run([sys.executable, "-c", BOOTSTRAP, json.dumps(args)],
+                         cwd=ROOT, capture_output=True, text=True)
+    duration = perf_counter() - start
+
+    audit = [line for line in out.stdout.splitlines() if line.startswith("AUDIT ")]
+    if not audit:
+        raise RuntimeError(f"yatta {' '.join(args)} failed:\n{out.stderr}")
+    return duration, json.loads(audit[-1][len("AUDIT "):])
+
+
+@click.command()
+@click.option("--runs", "-n", default=5, help="Number of runs of each command.")
+def main(runs):
+    with tempfile.TemporaryDirectory() as tmp:
+        log = Path(tmp) / "log"
+        log.write_text(LOG)
+
+        commands = [
+            ["--help"],
+            ["query", "total", "--range", "all", "--logfile", str(log)],
+            ["query", "list", "--range", "all", "--logfile", str(log)],
+            ["list-cat", "--logfile", str(log)],
+            ["convert", "--logfile", str(log), str(Path(tmp) / "log.d")],
+        ]
+
+        failed = False
+        for args in commands:
+            times = []
+            for _ in range(runs):
+                duration, events = run(args)
+                times.append(duration)
+
+            status = "ok" if not events else "TOUCHES THE WM: " + ", ".join(e[1] for e in events)
+            failed |= bool(events)
+            print(f"{statistics.median(times) * 1000:7.1f}ms  yatta {' '.join(args[:2]):<14} {status}")
+
+    sys.exit(failed)
+
+
+if __name__ == '__main__':
+    main()
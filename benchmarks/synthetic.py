@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Generate realistic logs, deterministically.
+
+The day is simulated like `yatta start` samples it, once per second:
+the user goes from one activity to the next (coding, reading docs,
+watching videos, chatting, mails, being away), and inside an activity
+the title of the window changes as files, tabs and messages are opened.
+Each log lasts a whole number of seconds, until the window changes,
+like the logs merged by Logs.merge.
+
+The same seed and number of days always give the same log.
+
+    python benchmarks/synthetic.py --days 30 > log
+"""
+
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, Tuple
+
+import click
+
+# Number of days of the sizes used by the benchmarks
+SIZES = {"day": 1, "month": 30, "two-years": 730}
+
+FILES = ["src/core.py", "src/cli.py", "src/context.py", "src/show.py", "readme.md", "notes.md",
+         "mandelbrot.rs", "fractal.glsl", "ifs.py", "thesis.tex", "config.yatta", "Cargo.toml"]
+DOCS = ["datetime", "asyncio", "array", "mmap", "struct", "pathlib", "itertools", "re",
+        "Rust std", "numpy.ndarray", "pygame.Surface", "click"]
+VIDEOS = ["Vol Libre, an amazing CG film", "Lecture 12: L systems", "lofi hip hop radio",
+          "The Mandelbrot set explained", "Numberphile - Hausdorff dimension", "Cooking pasta"]
+CONTACTS = ["Alice", "Bob", "Team yatta", "Family", "EPFL students"]
+SUBJECTS = ["Meeting tomorrow", "Re: exercises", "Your order has shipped", "Logement FMEL", "sncf e-billet"]
+
+# (weight, mean minutes of the activity, mean seconds between title changes, window)
+Window = Callable[[random.Random], Tuple[str, str]]
+ACTIVITIES: List[Tuple[int, float, float, Window]] = [
+    (30, 45, 80, lambda rng: ("terminator", f"nvim {rng.choice(FILES)}")),
+    (10, 30, 120, lambda rng: ("code", f"{rng.choice(FILES)} - yatta - Visual Studio Code")),
+    (15, 15, 40, lambda rng: ("firefox", f"{rng.choice(DOCS)} — Documentation — Mozilla Firefox")),
+    (10, 25, 400, lambda rng: ("firefox", f"{rng.choice(VIDEOS)} - YouTube — Mozilla Firefox")),
+    (12, 8, 25, lambda rng: ("telegram-desktop", f"Telegram ({rng.randint(0, 12)}) - {rng.choice(CONTACTS)}")),
+    (6, 6, 60, lambda rng: ("thunderbird", f"{rng.choice(SUBJECTS)} - Courrier - Mozilla Thunderbird")),
+    (4, 20, 300, lambda rng: ("xaos", f"XaoS - mandelbrot {rng.randint(1, 40)}")),
+    (8, 20, 1e9, lambda rng: ("", "")),
+]
+WEIGHTS = [a[0] for a in ACTIVITIES]
+
+
+def generate(days: int, seed=1, start=datetime(2023, 1, 2)) -> Iterator[Tuple[datetime, str, str, datetime]]:
+    """Yield (start, class, name, end) for [days] days of activity."""
+
+    rng = random.Random(seed)
+    last = None
+    for day in range(days):
+        # Awake from about 8am to about midnight
+        t = start + timedelta(days=day, hours=8, seconds=rng.randint(-3600, 3600))
+        night = t + timedelta(hours=16, seconds=rng.randint(-3600, 3600))
+        # The sampler ticks at the same fraction of each second
+        t += timedelta(microseconds=rng.randint(0, 999999))
+
+        while t < night:
+            _, minutes, churn, window = rng.choices(ACTIVITIES, WEIGHTS)[0]
+            klass, name = window(rng)
+            if (klass, name) == last:
+                continue
+            activity_end = t + timedelta(seconds=max(1, round(rng.expovariate(1 / (60 * minutes)))))
+            while t < activity_end:
+                seconds = max(1, round(rng.expovariate(1 / churn)))
+                end = min(t + timedelta(seconds=seconds), activity_end)
+                yield t, klass, name, end
+                t, last = end, (klass, name)
+                new = window(rng)
+                while new == (klass, name) and name:
+                    new = window(rng)
+                klass, name = new
+
+
+def synthetic_log(days: int, seed=1) -> str:
+    """Return a text log of [days] days of activity."""
+    return "".join(f"---\n{s.isoformat()}\n{k}\n{n}\n{e.isoformat()}\n" for s, k, n, e in generate(days, seed))
+
+
+@click.command()
+@click.option("--days", default=30, help="Days of logs to generate.")
+@click.option("--seed", default=1, help="Seed of the random generator.")
+def main(days, seed):
+    print(synthetic_log(days, seed), end="")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,11 @@
 """
 User configuration should define categories and a function
-called [categorize] that takes a LogEntry and return its category
+called [categorize] that takes a LogEntry and return its category.
+
+Instead of the function, one can define RULES, the path to a rules
+file (see src/rules.py), and optionally the DEFAULT category of logs
+that match no rule. The rule engine can also be used in the function
+like below.
 
 Two categories are always defined, AFK and UNCAT,they can be found with
 >>> from src.core import LogEntry, Category, AFK, UNCAT
@@ -18,17 +23,20 @@ they want.
 A LOCK_EVERY_15 list of categories can be defined
 and the GUI will lock the computer every 15 minutes
 of use of those categories.
+
+Categories are cached if CACHE_KEY gives the fields of the logs
+that [categorize] depends on. Logs for which the optional [no_cache]
+function returns True are always categorized again.
 """
 
-import re
 from pathlib import Path
 from time import sleep
-from typing import List, Tuple, Union
 import subprocess
 
 import pygame
 
 from src.core import LogEntry, Category, AFK, UNCAT
+from src.rules import RuleEngine
 
 # Categories
 CODE = Category("Coding", 0xffffff)
@@ -47,70 +55,27 @@ SPRIG = Category("SPRIG", 0x62388b)
 
 RULES_FILE = Path(__file__).with_suffix(".yatta")
 
-def load_rules() -> List[Tuple[Category, Union[str, re.Pattern]]]:
-    cats = {k: v for k, v in globals().items() if k.isupper() and isinstance(v, Category)}
-    file = RULES_FILE.read_text().splitlines()
-
-    rules = []
-    last_cat = None
-    for line in file:
-        stripped = line.strip()
-        if stripped.startswith("#") or not stripped:
-            continue
-
-        if line.startswith(" "):  # rule
-            assert last_cat, "The rule is not in a category"
-
-            # find if there is a type
-            t, _, rule = stripped.partition(" ")
-            rule = rule.strip()
-            flags = re.IGNORECASE
-            if t.lower() in ("r", "e"):
-                if t.isupper():
-                    flags ^= re.IGNORECASE
+name_rules = RuleEngine.load(RULES_FILE, globals())
 
-                t = t.lower()
-                if t == "r":  # rule is a regex
-                    pass
-                # elif t == "e":  # rule is a conjunction
-                #     rule = t.split("&")
-            else:
-                rules.append((last_cat, stripped.casefold()))
-                continue
+ZOOM = '"zoom", "zoom"'
 
-            rules.append((last_cat, re.compile(rule, flags)))
-        else:  # Category
-            last_cat = cats[stripped.strip(":")]
+CACHE_KEY = ("name", "klass")
 
-    return rules
+def no_cache(log: LogEntry) -> bool:
+    # Zoom depends on the time
+    return log.klass == ZOOM
 
-
-name_rules = load_rules()
-
-def categorize(log: LogEntry, __cache={}) -> Category:
-    as_tuple = (log.start, log.end, log.name, log.klass)
-    if as_tuple in __cache:
-        return __cache[as_tuple]
-
-    cat = _categorize(log)
-    __cache[as_tuple] = cat
-    return cat
-
-def _categorize(log: LogEntry) -> Category:
+def categorize(log: LogEntry) -> Category:
     # Categorizing vim uses
     if log.name == "nvim":
         return CODE
 
-    if log.klass == '"zoom", "zoom"':
+    if log.klass == ZOOM:
         return categorize_zoom(log)
 
-    name = log.name.casefold()
-    for cat, pattern in name_rules:
-        if isinstance(pattern, str):
-            if pattern in name:
-                return cat
-        elif re.search(pattern, log.name):
-            return cat
+    cat = name_rules.match(log.name)
+    if cat is not None:
+        return cat
 
     class_contains_map = {
         "telegram": CHAT,
@@ -0,0 +1,137 @@
+"""
+This module defines an array view of a list of logs, to compute
+the total time per group with vectorized reductions instead of
+building lists of logs for each group.
+
+It uses numpy when it is installed (pip install yatta[fast]),
+and falls back to plain Python loops otherwise.
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Union, TYPE_CHECKING
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from src.core import Category, LogEntry
+
+if TYPE_CHECKING:
+    from src.context import Context
+
+__all__ = ["LogArray", "HAS_NUMPY"]
+
+HAS_NUMPY = np is not None
+
+DAY_MICROS = 24 * 3600 * 10 ** 6
+# Days start at 4am, like start_of_day
+DAY_SHIFT = 4 * 3600 * 10 ** 6
+EPOCH_DAY = date(1970, 1, 1)
+
+Totals = Union[float, Dict[object, "Totals"]]
+
+
+class LogArray:
+    """Columns of start, end, category code and day code of logs."""
+
+    def __init__(self, logs: Iterable[LogEntry], ctx: "Context"):
+        starts, ends, cats = [], [], []
+        codes: Dict[Category, int] = {}
+        for log in logs:
+            starts.append(log.start_us)
+            ends.append(log.end_us)
+            cats.append(codes.setdefault(ctx.get_cat(log), len(codes)))
+
+        self.categories: List[Category] = list(codes)
+
+        if HAS_NUMPY:
+            self.starts = np.array(starts, dtype=np.int64)
+            self.ends = np.array(ends, dtype=np.int64)
+            self.cats = np.array(cats, dtype=np.int64)
+            self.days = (self.starts - DAY_SHIFT) // DAY_MICROS
+        else:
+            self.starts, self.ends, self.cats = starts, ends, cats
+            self.days = [(s - DAY_SHIFT) // DAY_MICROS for s in starts]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def durations(self):
+        """Duration of each log in seconds."""
+        if HAS_NUMPY:
+            return (self.ends - self.starts) / 1e6
+        return [(e - s) / 1e6 for s, e in zip(self.starts, self.ends)]
+
+    def _keys(self, classification):
+        """Return the code of each log and the key of each code."""
+        if classification == "C":
+            return self.cats, self.categories
+        elif classification == "D":
+            if HAS_NUMPY:
+                first = int(self.days.min()) if len(self) else 0
+                n = int(self.days.max()) - first + 1 if len(self) else 0
+                return self.days - first, [EPOCH_DAY + timedelta(days=first + d) for d in range(n)]
+            first = min(self.days, default=0)
+            n = max(self.days, default=0) - first + 1 if self.days else 0
+            return [d - first for d in self.days], [EPOCH_DAY + timedelta(days=first + d) for d in range(n)]
+
+        raise ValueError(f"'{classification}' is not a valid classification. "
+                         f"Use:"
+                         f"\n - C for categories"
+                         f"\n - D for days")
+
+    def totals(self, classifications: str) -> Totals:
+        """Return the total seconds of the logs grouped by [classifications].
+
+        The result has the same nesting as Context.group_by, but each
+        list of logs is replaced by its total duration. Empty groups
+        are omitted."""
+
+        durations = self.durations()
+        if not classifications:
+            return float(sum(durations))
+
+        # One flat code per combination of keys
+        code = np.zeros(len(self), dtype=np.int64) if HAS_NUMPY else [0] * len(self)
+        all_keys = []
+        for classification in classifications:
+            codes, keys = self._keys(classification)
+            all_keys.append(keys)
+            if HAS_NUMPY:
+                code = code * len(keys) + codes
+            else:
+                code = [c * len(keys) + k for c, k in zip(code, codes)]
+
+        size = 1
+        for keys in all_keys:
+            size *= len(keys)
+
+        if HAS_NUMPY:
+            sums = np.bincount(code, weights=durations, minlength=size)
+            present = np.bincount(code, minlength=size) > 0
+        else:
+            sums = [0.0] * size
+            present = [False] * size
+            for c, d in zip(code, durations):
+                sums[c] += d
+                present[c] = True
+
+        result = {}
+        for flat in (range(size) if not HAS_NUMPY else np.flatnonzero(present)):
+            if not present[flat]:
+                continue
+            # Unflatten the code into the key of each level
+            path = []
+            rest = int(flat)
+            for keys in reversed(all_keys):
+                rest, i = divmod(rest, len(keys))
+                path.append(keys[i])
+            path.reverse()
+
+            group = result
+            for key in path[:-1]:
+                group = group.setdefault(key, {})
+            group[path[-1]] = float(sums[flat])
+
+        return result
@@ -0,0 +1,142 @@
+"""
+This module defines the query cache, which keeps the totals of the
+logs of past segments on disk, so that repeated reports only read the
+logs of the segment that is still written.
+
+Segments are the shards of src.shards: the days of a text log or
+the monthly files of a binary store. The totals of a segment are
+keyed by the hash of its bytes, the version of the config and the
+filters of the query, so editing a past day or changing the rules
+computes it again.
+"""
+
+import json
+import os
+from datetime import date, datetime
+from functools import partial
+from hashlib import blake2b
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from src.arrays import Totals
+from src.context import Context
+from src.core import Category
+from src.rollup import DayTotals, regroup
+from src.search import Pattern
+from src.shards import read_source, run, segment_totals, segments
+from src.utils import from_micros, to_micros
+
+__all__ = ["QueryCache"]
+
+
+class QueryCache:
+    """Totals of each day and category of the logs of past segments."""
+
+    MAX_ENTRIES = 4096
+    # Changed when the entries get other fields, so that old ones are not used
+    FORMAT = b"2"
+
+    def __init__(self, path: Path, ctx: Context):
+        self.path = Path(path)
+        self.ctx = ctx
+        # key -> {"start", "end", "first", "last", "count", "added", "days": {day: {category: seconds}}}
+        self.entries: Dict[str, dict] = {}
+        self.colors: Dict[str, int] = {}
+        self.hits = self.misses = 0
+        self._changed = False
+
+    @classmethod
+    def open(cls, logfile: Path, ctx: Context) -> "QueryCache":
+        cache = cls(Path(str(logfile) + ".qcache"), ctx)
+        try:
+            data = json.loads(cache.path.read_text())
+            cache.entries = data["entries"]
+            cache.colors = data["colors"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return cache
+
+    def save(self):
+        if not self._changed:
+            return
+        # Forget the oldest entries
+        entries = sorted(self.entries.items(), key=lambda kv: kv[1]["added"])[-self.MAX_ENTRIES:]
+        data = {"colors": self.colors, "entries": dict(entries)}
+        try:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(data))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # Read only directory, the totals will be computed again
+
+    def _key(self, data: bytes, filters) -> str:
+        h = blake2b(data, digest_size=16)
+        h.update(self.FORMAT)
+        h.update(self.ctx.version)
+        h.update(repr(filters).encode())
+        return h.hexdigest()
+
+    def _category(self, name) -> Category:
+        try:
+            return self.ctx.categories[name]
+        except KeyError:
+            return Category(name, self.colors.get(name, 0x808080))
+
+    def totals(self, logfile: Path, start: datetime, end: datetime, classifications: str,
+               pattern: Union[str, Pattern, None] = None, category: Optional[str] = None, keep_afk=False,
+               jobs=1) -> Tuple[Totals, Optional[datetime], Optional[datetime], int]:
+        """Return the same as Context.group_totals on the logs of [logfile]
+        between start and end, filtered like `yatta query`, with the first
+        start, last end and count of these logs.
+
+        [classifications] can use only C and D. The segments that are
+        not cached are computed by [jobs] processes."""
+
+        filters = (pattern, category, keep_afk)
+        now = to_micros(datetime.now())
+
+        results = []
+        missing = []
+        for source, is_last in segments(logfile, start, end):
+            data = None if is_last else read_source(source)
+            key = None if is_last else self._key(data, filters)
+            entry = self.entries.get(key)
+            if entry is not None and to_micros(start) <= entry["start"] and entry["end"] <= to_micros(end):
+                # The whole segment is in the range, so the logs were not clamped
+                self.hits += 1
+                results.append(entry)
+            else:
+                # Workers read the file themselves rather than receive the bytes
+                missing.append((len(results), key, (source, data if jobs == 1 else None)))
+                results.append(None)
+
+        computed = run(self.ctx, partial(segment_totals, start=start, end=end, filters=filters),
+                       [item for _, _, item in missing], jobs)
+        for (i, key, _), entry in zip(missing, computed):
+            results[i] = entry
+            self.colors.update(entry["colors"])
+            if key is not None and entry["days"]:
+                self.misses += 1
+                if to_micros(start) <= entry["start"] and entry["end"] <= to_micros(end):
+                    self.entries[key] = dict(entry, added=now)
+                    self._changed = True
+
+        days: Dict[date, DayTotals] = {}
+        first = last = None
+        count = 0
+        for entry in results:
+            if entry["count"]:
+                # Segments come in order
+                first = entry["first"] if first is None else first
+                last = entry["last"]
+                count += entry["count"]
+            for day, cats in entry["days"].items():
+                total = days.setdefault(date.fromisoformat(day), {})
+                for name, secs in cats.items():
+                    cat = self._category(name)
+                    total[cat] = total.get(cat, 0) + secs
+
+        self.save()
+        if not count:
+            return regroup(days, classifications), None, None, 0
+        return regroup(days, classifications), from_micros(first), from_micros(last), count
@@ -1,15 +1,27 @@
+import asyncio
+import functools
+import os
+import re
 import subprocess
 from datetime import datetime, timedelta
 from pathlib import Path
 from time import time, sleep
+from typing import Optional
 
 from dateutil.relativedelta import *
 import click
 
+from src.cache import QueryCache
 from src.context import Context
-from src.core import AFK, Logs, LogEntry, DAY, UNCAT
-from src.show import print_group_logs, print_labels, print_time_line, print_legend, show_total, show_grouped, ViewTypes
-from src.utils import start_of_day
+from src.core import AFK, Category, Logs, LogEntry, LogWriter, DAY, UNCAT
+from src.metrics import MetricsExporter, TrackerMetrics, parse, quantile, read_metrics
+from src.profiling import Profiler
+from src.search import Pattern, search
+from src.segments import PERIODS, SegmentedLog
+from src.shards import categories as shard_categories, run, segments
+from src.tracker import Tracker
+from src.show import group_logs, print_groups, print_labels, print_time_line, print_legend, show_total, show_grouped, ViewTypes
+from src.utils import notify, start_of_day
 
 DATA_DIR = Path(__file__).parent.parent / "data"
 LOG = DATA_DIR / "log"
@@ -45,6 +57,58 @@ config_option = click.option(
 )
 
 time_step_option = click.option("--time-step", "-t", default=1, help="Seconds between window title check")
+JOBS_HELP = "Processes that read and categorize the logs, 0 for one per CPU."
+jobs_option = click.option("--jobs", "-j", default=1, type=click.IntRange(0), help=JOBS_HELP)
+# Lists and timelines need the logs in order, only the totals are computed by shard
+query_jobs_option = click.option("--jobs", "-j", default=1, type=click.IntRange(0),
+                                 help=JOBS_HELP + " Only for the total view grouped by C and/or D.")
+
+
+def writer_options(command):
+    """Options of the LogWriter of commands that record logs."""
+    command = click.option("--flush-every", default=10.0, help="Seconds between writes to the log file.")(command)
+    command = click.option("--fsync/--no-fsync", default=False, help="Sync the log file to the disk after each write.")(command)
+    command = click.option("--rotate", type=click.Choice(list(PERIODS)), default=None,
+                           help="Create the log as a directory with one file per day or month.")(command)
+    return command
+
+metrics_option = click.option("--metrics", type=Path, default=None,
+                              help="Where the health metrics of the recording are exported, a Unix socket if it "
+                                   "ends in .sock. Defaults to the log file followed by .metrics.")
+
+
+def metrics_path(logfile: Path, metrics: Optional[Path]) -> Path:
+    return metrics if metrics is not None else Path(str(logfile) + ".metrics")
+
+
+def profile_options(command):
+    """Options to profile a command, which receives a [profiler] for its stages."""
+
+    @functools.wraps(command)
+    def profiled(*args, profile, profile_output, **kwargs):
+        with Profiler(kwargs.get("ctx"), profile, profile_output) as profiler:
+            return command(*args, profiler=profiler, **kwargs)
+
+    profiled = click.option("--profile-output", type=Path, default=None,
+                            help="Also write a profile of the whole run: a Chrome trace if it ends in .json, "
+                                 "a pstats file of cProfile otherwise.")(profiled)
+    profiled = click.option("--profile", is_flag=True,
+                            help="Print the time, logs and categorizations of each stage to stderr.")(profiled)
+    return profiled
+
+
+def open_writer(logfile: Path, flush_every, fsync, rotate):
+    """Return the writer of the log, after creating it as a segmented log if asked."""
+
+    if rotate and not SegmentedLog.is_segmented(logfile):
+        if logfile.exists() and (not logfile.is_file() or logfile.stat().st_size):
+            raise click.ClickException(f"{logfile} is not a segmented log. Use `yatta split` to convert it.")
+        logfile.unlink(missing_ok=True)
+        SegmentedLog.create(logfile, rotate)
+    try:
+        return LogWriter.open(logfile, flush_every, fsync=fsync)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
 
 
 class DateRangeType(click.ParamType):
@@ -114,6 +178,23 @@ class DateRangeType(click.ParamType):
                  )
 
 
+class Span:
+    """Iterate over logs, and remember the first start, last end and count."""
+
+    def __init__(self, logs):
+        self.logs = logs
+        self.start = self.end = None
+        self.count = 0
+
+    def __iter__(self):
+        for log in self.logs:
+            if self.start is None:
+                self.start = log.start
+            self.end = log.end
+            self.count += 1
+            yield log
+
+
 class ViewTypeType(click.ParamType):
     name = "View"
 
@@ -134,43 +215,219 @@ def yatta():
 
 
 @yatta.command()
+@click.option("--binary", "-b", "directory", type=Path, default=None,
+              help="Write the logs to this binary store instead of replacing the log.")
+@jobs_option
+@logfile_option
+@config_option
+def compress(ctx, logfile, directory, jobs):
+    """Merge the adjacent logs of the same window.
+
+    The log is rewritten to a temporary file, checked, then atomically
+    replaces the log. With --binary, a binary store is written instead,
+    with the categories given by the config, and the log is kept."""
+
+    from src.compact import compact
+
+    try:
+        lock = LogWriter.acquire(logfile)
+    except RuntimeError as e:
+        raise click.ClickException(f"{e} Stop it before compressing the log.")
+
+    # The segments of a segmented log are compressed one by one
+    if SegmentedLog.is_segmented(logfile) and directory is None:
+        log = SegmentedLog.open(logfile)
+        files = [(log.path(name), name) for name in log.segments if log.path(name).exists()]
+    else:
+        log = None
+        files = [(logfile, None)]
+
+    try:
+        for file, name in files:
+            # Into a directory, the logs become a binary store, otherwise they keep their format
+            stats = compact(ctx, file, dest=directory, binary=True if directory is not None else None,
+                            jobs=jobs or os.cpu_count())
+            print(name or "", stats)
+            if name is not None and "checksum" in log.segments[name]:
+                log.seal(name)
+        if log is not None:
+            # Like compact does for a single file
+            for suffix in (".rollup", ".qcache"):
+                Path(str(logfile) + suffix).unlink(missing_ok=True)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        lock.close()
+
+
+@yatta.command()
+@click.argument("directory", type=Path, default=LOG.with_suffix(".d").as_posix())
+@logfile_option
+@config_option
+def convert(ctx, logfile, directory):
+    """Convert the text log file into a binary store.
+
+    The store has one compact file per month, and can be used in place
+    of the text log with --logfile DIRECTORY. The categories given by
+    the config are stored too."""
+
+    from src.store import convert as convert_log
+
+    months = convert_log(logfile, directory, ctx)
+    for month, logs in months.items():
+        print(month, ":", len(logs), "logs")
+
+
+@yatta.command()
+@click.argument("directory", type=Path)
+@click.option("--period", "-p", type=click.Choice(list(PERIODS)), default="month", help="Time covered by each file.")
+@logfile_option
+def split(logfile, directory, period):
+    """Split the text log into a segmented log, with one file per day or month.
+
+    Readers only open the files of the time range they read. Record
+    into the segmented log with --logfile DIRECTORY."""
+
+    from src.segments import split as split_log
+
+    if directory.exists():
+        raise click.ClickException(f"{directory} already exists.")
+    log = split_log(Logs.stream(logfile), directory, period)
+    for name, seg in log.segments.items():
+        print(name, ":", seg.get("count", "open"), "logs")
+
+
+@yatta.command("segments")
 @logfile_option
-def compress(logfile):
-    logs = Logs.load(logfile)
+def list_segments(logfile):
+    """List the files of a segmented log, and check them against the manifest."""
+
+    if not SegmentedLog.is_segmented(logfile):
+        raise click.ClickException(f"{logfile} is not a segmented log.")
+    log = SegmentedLog.open(logfile)
+    for name, seg in log.segments.items():
+        status = {None: "recording", True: "ok", False: "modified"}[log.check(name)]
+        print(f"{name:>10}  {seg.get('count', '?'):>7} logs  {status}")
+
+
+@yatta.command()
+@click.argument("directory", type=Path, default=LOG.with_suffix(".d").as_posix())
+@config_option
+def recategorize(ctx, directory):
+    """Update the categories stored in a binary store.
 
-    compressed = Logs(file=LOG.with_suffix(".compressed"))
+    Only the months categorized with another version of the config are updated."""
 
-    for log in logs:
-        compressed.append(log)
+    from src.store import BinaryStore
+
+    BinaryStore(directory).recategorize(ctx, lambda path: print("Updated", path.stem))
 
 
 @yatta.command()
 @time_step_option
+@click.option("--range", "-r", default="0", type=DateRangeType(), help="Time range of the summary printed at start, -1 for all time.")
+@writer_options
+@metrics_option
 @logfile_option
 @config_option
-def start(ctx: Context, logfile, time_step):
+def start(ctx: Context, logfile, time_step, range, flush_every, fsync, rotate, metrics):
     """Record active windows forever.
 
-    If you start the recording twice, it will corrupt the log file."""
+    The log is locked while it is recorded, so it cannot be recorded twice."""
+
+    writer = open_writer(logfile, flush_every, fsync, rotate)
 
-    logs = Logs.load(logfile)
+    # The summary is computed while reading, without keeping the logs
+    uncategorised = {}
 
-    categ = ctx.group_category(logs)
-    print_group_logs(categ.get(UNCAT), [])
-    show_total(categ)
+    def collect_uncategorised(logs):
+        for log in logs:
+            if ctx.get_cat(log) == UNCAT:
+                group_logs([log], uncategorised)
+            yield log
 
-    logs.watch_apps()
+    summary = ctx.filter_time(Logs.stream(logfile, *range), *range)
+    totals = ctx.group_totals(collect_uncategorised(summary), "C")
+    print_groups(uncategorised)
+    if totals:
+        show_total(totals)
+
+    # The new logs may merge with the last ones of the current day
+    logs = Logs.load(logfile, start_of_day(datetime.now()), None)
+    logs.writer = writer
+
+    tracker = Tracker(logs, time_step, metrics=TrackerMetrics())
+    exporter = MetricsExporter(tracker.metrics, metrics_path(logfile, metrics)).start()
+    try:
+        asyncio.run(tracker.run())
+    finally:
+        exporter.stop()
+        if tracker.missed:
+            print(tracker.missed, "ticks were missed")
+        notify('Yatta stopped', 'Active window monitoring has stopped.')
 
 
 @yatta.command()
+@writer_options
+@metrics_option
+@profile_options
 @logfile_option
 @config_option
-def gui(ctx, logfile):
-    logs = Logs.load(logfile)
+def gui(ctx, logfile, flush_every, fsync, rotate, metrics, profiler):
+    writer = open_writer(logfile, flush_every, fsync, rotate)
+    # The gui only shows the durations of the current day
+    with profiler.stage("Logs.load") as stats:
+        logs = Logs.load(logfile, start_of_day(datetime.now()), None)
+        stats.entries += len(logs)
+    logs.writer = writer
 
     from src.gui import Gui
 
-    Gui(ctx, logs).run()
+    tracked = TrackerMetrics()
+    exporter = MetricsExporter(tracked, metrics_path(logfile, metrics)).start()
+    try:
+        Gui(ctx, logs, profiler, tracked).run()
+    finally:
+        exporter.stop()
+        notify('Yatta stopped', 'Active window monitoring has stopped.')
+
+
+@yatta.command()
+@click.option("--raw", is_flag=True, help="Print the metrics in the text format of Prometheus.")
+@metrics_option
+@logfile_option
+def stats(logfile, metrics, raw):
+    """Show the health of the recording: latencies, skipped ticks and merges."""
+
+    path = metrics_path(logfile, metrics)
+    try:
+        text = read_metrics(path)
+    except OSError as e:
+        raise click.ClickException(f"No metrics at {path}, is yatta recording? ({e})")
+    if raw:
+        print(text, end="")
+        return
+
+    samples = parse(text)
+    age = time() - samples["yatta_metrics_timestamp_seconds"]
+    print("Recording since", datetime.fromtimestamp(samples["yatta_start_time_seconds"]).replace(microsecond=0),
+          f"(metrics from {age:.0f}s ago)")
+    ticks = samples["yatta_ticks_total"]
+    print(f"Ticks: {ticks:.0f}, skipped {samples['yatta_ticks_skipped_total']:.0f}, "
+          f"failed samples {samples['yatta_sample_errors_total']:.0f}")
+    print(f"Logs: {samples['yatta_logs_total']:.0f}, merged {samples['yatta_logs_merged_total']:.0f} "
+          f"({samples['yatta_merge_ratio']:.1%})")
+    for title, name in [("Sample", "yatta_sample_seconds"), ("Drift", "yatta_tick_drift_seconds"),
+                        ("Write", "yatta_write_seconds"), ("Stored", "yatta_store_seconds"),
+                        ("Sinks", "yatta_sink_seconds")]:
+        count = samples.get(f"{name}_count", 0)
+        mean = samples[f"{name}_sum"] / count if count else 0
+        p50, p99 = (quantile(samples, name, q) * 1000 for q in (0.5, 0.99))
+        print(f"{title:>6}: {count:.0f} measures, mean {mean * 1000:.2f}ms, p50 <= {p50:g}ms, p99 <= {p99:g}ms")
+    # Metrics of a yatta that predates the pipeline have no backpressure
+    print(f"Backpressure: sampling blocked {samples.get('yatta_blocked_seconds_total', 0):.2f}s, "
+          f"backlog up to {samples.get('yatta_backlog_max', 0):.0f}, "
+          f"dropped by sinks {samples.get('yatta_sink_dropped_total', 0):.0f}")
 
 
 @yatta.command()
@@ -179,6 +436,8 @@ def gui(ctx, logfile):
 @click.option("--range", "-r", default="0", type=DateRangeType(), help="Time range for the logs, -1 for all time.")
 @click.option("--category", "-c", help="Search only in this category")
 @click.option("--pattern", "-p", help="Should contain this pattern")
+@click.option("--regex", is_flag=True, help="The pattern is a regular expression, searched in the names.")
+@click.option("--ignore-case", "-i", is_flag=True, help="Search the pattern without case.")
 @click.option("--keep-afk", help="Don't exclude AFK logs")
 # @click.option("--by-category", "-C", default=False, is_flag=True, help="Whether to print results by category")
 # @click.option("--total", "-T", default=False, is_flag=True, help="Print only total values, not log entries")
@@ -186,9 +445,12 @@ def gui(ctx, logfile):
 @click.option("--time-line-thresold", "-D", default=15,
               help="Minimum seconds of activity to show data on the timeline.")
 @click.option("--group-by", "--by", "-b", default="", help="How to group logs before showing. Substring of 'CD'.")
+@query_jobs_option
+@profile_options
 @logfile_option
 @config_option
-def query(graph_kind, ctx: Context, logfile, pattern, range, category, time_line_thresold, group_by, keep_afk):
+def query(graph_kind, ctx: Context, logfile, pattern, regex, ignore_case, range, category, time_line_thresold,
+          group_by, keep_afk, jobs, profiler):
     """Get informations about time spent.
 
     graph-kind is the visualisation method and can be one of:
@@ -197,16 +459,57 @@ def query(graph_kind, ctx: Context, logfile, pattern, range, category, time_line
      - timeline: print logs in a timeline (you probably want to use --by D)
 
     Lowercase options are for filterning, and uppercase are to control the display format."""
-    logs = Logs.load(logfile)
 
-    # Filter the logs
-    logs = ctx.filter_time(logs, *range, True)
+    if pattern and (regex or ignore_case):
+        try:
+            pattern = Pattern(pattern, ignore_case, regex)
+        except re.error as e:
+            raise click.BadParameter(str(e), param_hint="--pattern")
+
+    if graph_kind == ViewTypes.TOTAL and set(group_by) <= set("CD"):
+        # Totals of past days are cached, only the current one is computed
+        with profiler.stage("QueryCache.totals"):
+            cache = QueryCache.open(logfile, ctx)
+            grouped, first, last, count = cache.totals(logfile, *range, group_by, pattern, category, bool(keep_afk),
+                                                       jobs or os.cpu_count())
+        if not count:
+            print("No matching logs")
+            quit(1)
+        print("From", first, "to", last, ":", count, "logs")
+        with profiler.stage("show_grouped"):
+            show_grouped(ctx, grouped, graph_kind, time_line_thresold=time_line_thresold)
+        return
+
+    if jobs != 1:
+        raise click.BadParameter("only the total view grouped by C and D runs in parallel.", param_hint="--jobs")
+
     if pattern:
-        logs = ctx.filter_pattern(logs, pattern)
+        # Only the days where a name matches are read
+        if isinstance(pattern, str):
+            pattern = Pattern(pattern)
+        logs = profiler.iterate("search", search(logfile, pattern, *range))
+    else:
+        logs = profiler.iterate("Logs.stream", Logs.stream(logfile, *range))
+
+    # Filter the logs
+    logs = profiler.iterate("filter_time", ctx.filter_time(logs, *range, True))
     if category:
-        logs = ctx.filter_category(logs, category)
+        logs = profiler.iterate("filter_category", ctx.filter_category(logs, category))
     if not keep_afk:
-        logs = ctx.exclude_categories(logs, AFK)
+        logs = profiler.iterate("exclude_categories", ctx.exclude_categories(logs, AFK))
+
+    if graph_kind == ViewTypes.LIST and not group_by:
+        # Only the totals of each window are kept, not the logs
+        span = Span(logs)
+        with profiler.stage("group_logs"):
+            groups = group_logs(span)
+        if not span.count:
+            print("No matching logs")
+            quit(1)
+        print("From", span.start, "to", span.end, ":", span.count, "logs")
+        with profiler.stage("print_groups", len(groups)):
+            print_groups(groups)
+        return
 
     logs = list(logs)
 
@@ -217,19 +520,33 @@ def query(graph_kind, ctx: Context, logfile, pattern, range, category, time_line
         print("From", logs[0].start, "to", logs[-1].end, ":", len(logs), "logs")
 
     # Classify them
-    grouped = ctx.group_by(logs, group_by)
+    if graph_kind == ViewTypes.TOTAL:
+        with profiler.stage("group_totals", len(logs)):
+            grouped = ctx.group_totals(logs, group_by)
+    else:
+        with profiler.stage("group_by", len(logs)):
+            grouped = ctx.group_by(logs, group_by)
 
     # Display the groups
-    show_grouped(ctx, grouped, graph_kind, time_line_thresold=time_line_thresold)
+    with profiler.stage("show_grouped", len(logs)):
+        show_grouped(ctx, grouped, graph_kind, time_line_thresold=time_line_thresold)
 
 @yatta.command("list-cat")
+@jobs_option
+@profile_options
 @logfile_option
 @config_option
-def list_cat(ctx, logfile):
-    logs = Logs.load(logfile)
-
+def list_cat(ctx, logfile, jobs, profiler):
     cats = set()
-    for log in logs:
-        cats.add(ctx.get_cat(log))
+    if jobs == 1:
+        with profiler.stage("get_cat"):
+            for log in profiler.iterate("Logs.stream", Logs.stream(logfile)):
+                cats.add(ctx.get_cat(log))
+    else:
+        # Each process categorizes some of the days
+        items = [(source, None) for source, _ in segments(logfile)]
+        with profiler.stage("shards.run", len(items)):
+            for colors in run(ctx, shard_categories, items, jobs or os.cpu_count()):
+                cats.update(ctx.categories.get(name, Category(name, color)) for name, color in colors.items())
 
     print(*cats, sep="\n")
@@ -0,0 +1,271 @@
+"""
+This module compacts a log: adjacent entries are merged with the same
+rules as Logs.merge, and the result atomically replaces the log.
+
+The log is read shard by shard (see src.shards), possibly in several
+processes, so that memory stays bounded by the size of a shard. Each
+shard is merged on its own. Only its first and last entries may still
+merge with the neighbouring shards, so they are stitched together in
+order, and the rest of the shard is written as is.
+
+The output is written next to the destination, read again to check
+that it holds the entries that were written, and only then replaces it.
+"""
+
+import os
+import shutil
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from src.context import Context
+from src.core import LogEntry, Logs
+from src.shards import Source, imap, load_source, segments
+from src.store import BinaryStore, SUFFIX, month_key, write_segment
+
+__all__ = ["CompactStats", "merged", "compact"]
+
+BLOCK_SIZE = 1 << 20
+
+# The first and last entries of a merged shard, and the ones in between,
+# already formatted as text, or kept as entries for a binary store
+Piece = Tuple[LogEntry, Union[str, List[LogEntry]], Optional[LogEntry], int, int, int]
+
+
+@dataclass
+class CompactStats:
+    """What was read and written by compact."""
+
+    read: int = 0
+    written: int = 0
+    # Microseconds covered by the entries written
+    total: int = 0
+    first: int = 0
+    last: int = 0
+    size_before: int = 0
+    size_after: int = 0
+
+    def add(self, log: LogEntry):
+        if not self.written:
+            self.first = log.start_us
+        self.written += 1
+        self.total += log.end_us - log.start_us
+        self.last = log.end_us
+
+    def __str__(self):
+        return (f"{self.read} logs merged into {self.written}, "
+                f"{self.size_before / 2 ** 20:.1f} MiB -> {self.size_after / 2 ** 20:.1f} MiB")
+
+
+def merged(logs: Iterable[LogEntry]) -> Iterator[LogEntry]:
+    """Yield the logs merged like Logs.merge, each once its end is known.
+
+    The logs are modified in place."""
+
+    last = None
+    for log in logs:
+        if last is not None:
+            if Logs.continues(last, log):
+                if last.name == log.name and last.klass == log.klass:
+                    last.end_us = max(last.end_us, log.end_us)
+                    continue
+                last.end_us = log.start_us
+            yield last
+        last = log
+    if last is not None:
+        yield last
+
+
+def format_log(log: LogEntry) -> str:
+    """Return the log as it is written in a text log by LogWriter."""
+    return f"---\n{log.start.isoformat()}\n{log.klass}\n{log.name}\n{log.end.isoformat()}\n"
+
+
+def compact_shard(ctx: Context, source: Source, binary: bool) -> Optional[Piece]:
+    """Merge the logs of a shard.
+
+    Returns its first and last entries, the entries in between, formatted
+    as text unless [binary], the number of logs read, and the number of
+    entries in between and the microseconds they cover."""
+
+    logs = load_source(source)
+    read = len(logs)
+    logs = list(merged(logs))
+    if not logs:
+        return None
+
+    head, body = logs[0], logs[1:-1]
+    tail = logs[-1] if len(logs) > 1 else None
+    total = sum(log.end_us - log.start_us for log in body)
+    return head, body if binary else "".join(map(format_log, body)), tail, read, len(body), total
+
+
+class TextOutput:
+    """Write logs to a text log file, in large blocks."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, "w", buffering=BLOCK_SIZE)
+
+    def write(self, log: LogEntry):
+        self._file.write(format_log(log))
+
+    def write_body(self, body: str):
+        self._file.write(body)
+
+    def close(self):
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
+
+
+class StoreOutput:
+    """Write logs to a binary store, one month in memory at a time."""
+
+    def __init__(self, path: Path, ctx: Optional[Context]):
+        self.path = path
+        self.ctx = ctx
+        self.month = None
+        self.logs: List[LogEntry] = []
+        self.done = set()
+        path.mkdir()
+
+    def write(self, log: LogEntry):
+        month = month_key(log.start)
+        if month != self.month:
+            self._flush()
+            if month in self.done:
+                raise ValueError(f"The logs of {month} are not in order.")
+            self.month = month
+        self.logs.append(log)
+
+    def write_body(self, body: List[LogEntry]):
+        for log in body:
+            self.write(log)
+
+    def _flush(self):
+        if self.logs:
+            write_segment(self.path / (self.month + SUFFIX), self.logs, self.ctx)
+            self.done.add(self.month)
+            self.logs = []
+
+    def close(self):
+        self._flush()
+
+    def abort(self):
+        self.logs = []
+
+
+def _size(path: Path) -> int:
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.glob("*" + SUFFIX))
+    return path.stat().st_size
+
+
+def _remove(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+        path.with_name(path.name + ".idx").unlink(missing_ok=True)
+
+
+def verify(path: Path, stats: CompactStats):
+    """Check that [path] contains the entries counted in [stats]."""
+
+    check = CompactStats()
+    for log in Logs.stream(path):
+        check.add(log)
+    expected = (stats.written, stats.total, stats.first, stats.last)
+    found = (check.written, check.total, check.first, check.last)
+    if found != expected:
+        raise ValueError(f"The compacted log does not match what was written: "
+                         f"(count, microseconds, first start, last end) is {found} instead of {expected}.")
+
+
+def _replace(tmp: Path, dest: Path):
+    """Move [tmp] to [dest], replacing it."""
+
+    if tmp.is_dir():
+        # Directories cannot be replaced in one step, the old one is kept until the new one is in place
+        old = dest.with_name(dest.name + ".old")
+        _remove(old)
+        if dest.exists():
+            os.rename(dest, old)
+        os.rename(tmp, dest)
+        _remove(old)
+    else:
+        # The index of the output is still valid, since os.replace keeps the inode
+        index = tmp.with_name(tmp.name + ".idx")
+        if index.exists():
+            os.replace(index, dest.with_name(dest.name + ".idx"))
+        os.replace(tmp, dest)
+
+
+def compact(ctx: Context, logfile: Path, dest: Optional[Path] = None, binary: Optional[bool] = None,
+            jobs=1) -> CompactStats:
+    """Merge the adjacent logs of [logfile] and write them to [dest], which is replaced.
+
+    [dest] defaults to [logfile]. The output is a binary store if [binary],
+    by default if [logfile] is one, and the categories given by [ctx]
+    are stored in it. The shards of [logfile] are merged by [jobs] processes."""
+
+    logfile = Path(logfile)
+    dest = logfile if dest is None else Path(dest)
+    if binary is None:
+        binary = BinaryStore.is_store(logfile)
+    if dest.exists() and binary != dest.is_dir():
+        raise ValueError(f"Cannot replace {dest} with a {'binary store' if binary else 'text log'}.")
+
+    stats = CompactStats(size_before=_size(logfile))
+    tmp = dest.with_name(dest.name + ".tmp")
+    _remove(tmp)
+    output = StoreOutput(tmp, ctx) if binary else TextOutput(tmp)
+
+    try:
+        pending = None
+        sources = [source for source, _ in segments(logfile)]
+        for piece in imap(ctx, partial(compact_shard, binary=binary), sources, jobs):
+            if piece is None:
+                continue
+            head, body, tail, read, count, total = piece
+            stats.read += read
+
+            # The first entry of the shard may merge with the last of the previous one
+            if pending is not None:
+                *done, head = merged([pending, head])
+                for log in done:
+                    output.write(log)
+                    stats.add(log)
+            if tail is None:
+                pending = head
+                continue
+
+            output.write(head)
+            stats.add(head)
+            if count:
+                output.write_body(body)
+                stats.written += count
+                stats.total += total
+            pending = tail
+
+        if pending is not None:
+            output.write(pending)
+            stats.add(pending)
+        output.close()
+
+        verify(tmp, stats)
+        stats.size_after = _size(tmp)
+        _replace(tmp, dest)
+    except BaseException:
+        output.abort()
+        _remove(tmp)
+        raise
+
+    # Totals and segments that were folded from the old log are recomputed
+    for suffix in (".rollup", ".qcache"):
+        Path(str(dest) + suffix).unlink(missing_ok=True)
+
+    return stats
@@ -6,12 +6,19 @@ information.
 """
 
 from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from operator import attrgetter
 from datetime import datetime, timedelta
-from typing import Dict, List, Callable, Iterator, Tuple
+from pathlib import Path
+from threading import Thread
+from typing import Dict, List, Callable, Iterator, Optional, Tuple, Union
 
-from src.core import Category, LogEntry, DAY
-from src.utils import start_of_day
+from src.arrays import LogArray, Totals
+from src.core import AFK, Category, LogEntry, DAY, UNCAT
+from src.rules import RuleEngine
+from src.search import Pattern, matcher
+from src.utils import start_of_day, to_micros, LRUCache
 
 LogList = List[LogEntry]
 LogIterator = Iterator[LogEntry]
@@ -19,10 +26,24 @@ LogIterator = Iterator[LogEntry]
 
 @dataclass
 class Context:
-    get_cat: Callable[[LogEntry], Category]
+    categorize: Callable[[LogEntry], Category]
     shortcuts: Callable
     path: str = ""
     lock15: tuple = ()
+    # The fields of LogEntry that categorize depends on.
+    # Categories are cached only if this is given.
+    cache_key: Tuple[str, ...] = ()
+    # Logs for which categorize must always be called
+    no_cache: Callable[[LogEntry], bool] = lambda log: False
+    cache_size: int = 4096
+    # Hash of the config and its rules. Categories stored with logs
+    # are used only if they were computed with the same version.
+    version: bytes = b""
+    categories: Dict[str, Category] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.cache = LRUCache(self.cache_size)
+        self._key = attrgetter(*self.cache_key) if self.cache_key else None
 
     @classmethod
     def load(cls, path):
@@ -34,28 +55,88 @@ class Context:
         globs = {"__file__": path}
         exec(compiled, globs)
 
-        try:
+        if "categorize" in globs:
             categorize = globs["categorize"]
-        except KeyError:
+        elif "RULES" in globs:
+            # A rules file relative to the config
+            rules = Path(path).parent / globs["RULES"]
+            categorize = RuleEngine.load(rules, globs, globs.get("DEFAULT", UNCAT))
+        else:
             print(globs)
-            raise KeyError(f"No function [categorize] in {path}.")
+            raise KeyError(f"No function [categorize] nor RULES file in {path}.")
 
         shortcuts = globs.get("shortcuts", lambda e: 0)
         lock15 = globs.get("LOCK_EVERY_15", ())
 
-        return cls(categorize, shortcuts, path, lock15)
+        # The rule engine only looks at the name
+        default_key = ("name",) if isinstance(categorize, RuleEngine) else ()
+        cache_key = tuple(globs.get("CACHE_KEY", default_key))
+        no_cache = globs.get("no_cache", lambda log: False)
+        cache_size = globs.get("CACHE_SIZE", 4096)
 
-    def reload(self):
+        version = blake2b(code.encode(), digest_size=16)
+        for value in [categorize, *globs.values()]:
+            if isinstance(value, RuleEngine):
+                version.update(value.source.encode())
+        categories = {str(c): c for c in [AFK, UNCAT, *globs.values()] if isinstance(c, Category)}
+
+        return cls(categorize, shortcuts, path, lock15, cache_key, no_cache, cache_size,
+                   version.digest(), categories)
+
+    def reload(self, store: Optional[Path] = None) -> Optional[Thread]:
+        """Load the config again.
+
+        If [store] is a binary store, the categories stored in its
+        segments are updated in a background thread, which is returned."""
         assert self.path, "Cannot reload context without path"
 
         new = self.load(self.path)
-        self.get_cat = new.get_cat
+        self.categorize = new.categorize
         self.shortcuts = new.shortcuts
         self.lock15 = new.lock15
+        self.cache_key = new.cache_key
+        self.no_cache = new.no_cache
+        self.cache_size = new.cache_size
+        self.version = new.version
+        self.categories = new.categories
+        self.__post_init__()
+
+        from src.store import BinaryStore
+        if store is None or not BinaryStore.is_store(store):
+            return None
+        # Segments are replaced atomically, so the thread can be stopped anytime
+        thread = Thread(target=BinaryStore(store).recategorize, args=(self,), name="yatta-recategorize", daemon=True)
+        thread.start()
+        return thread
+
+    def get_cat(self, log: LogEntry) -> Category:
+        """Return the category of a log, with the categorize function of the config.
+
+        The category stored with the log is used if it is up to date.
+        Only logs read from a binary store have one, the others go
+        through the cache."""
+
+        stored = log.stored_cat
+        if stored is not None and stored[0] == self.version and stored[1] in self.categories:
+            return self.categories[stored[1]]
+
+        if self._key is None or self.no_cache(log):
+            return self.categorize(log)
+
+        key = self._key(log)
+        cat = self.cache.get(key)
+        if cat is None:
+            cat = self.categorize(log)
+            self.cache[key] = cat
+        return cat
 
     @staticmethod
-    def tot_secs(logs: LogList) -> float:
-        """Return the total duration of all logs."""
+    def tot_secs(logs: Union[LogList, float]) -> float:
+        """Return the total duration of all logs.
+
+        [logs] can also be a total already computed by group_totals."""
+        if isinstance(logs, (int, float)):
+            return logs
         return sum(log.duration for log in logs)
 
     def group_category(self, logs: LogList) -> Dict[Category, List[LogEntry]]:
@@ -70,6 +151,8 @@ class Context:
     def sort_categories(self, cats: Dict[Category, LogList], best=None, reverse=False) -> List[Tuple[Category, LogList]]:
         """Return a list of categories and logs sorted by total time.
 
+        The values of [cats] can also be totals from group_totals.
+
         If [best] is given, return only the [best] categories with the most time."""
 
         cats = sorted(cats.items(), key=lambda x: self.tot_secs(x[1]), reverse=not reverse)
@@ -86,8 +169,9 @@ class Context:
         If [clamp] is True, each log is clamped to the interval,
         otherwise they can have a part outside [start, end]."""
 
+        start, end = to_micros(start), to_micros(end)
         for log in logs:
-            intersected = log.intersected(start, end)
+            intersected = log.intersected_us(start, end)
 
             if intersected is not None:
                 if clamp:
@@ -97,7 +181,18 @@ class Context:
 
     @staticmethod
     def filter_pattern(logs: LogIterator, name_pattern=None, class_pattern=None) -> LogIterator:
-        """Yield all logs containing name_pattern or class_pattern in their name/class."""
+        """Yield all logs containing name_pattern or class_pattern in their name/class.
+
+        The patterns can also be a Pattern of src.search, for case
+        insensitive searches and regular expressions."""
+
+        if isinstance(name_pattern, Pattern) or isinstance(class_pattern, Pattern):
+            name_match, class_match = matcher(name_pattern), matcher(class_pattern)
+            for log in logs:
+                if name_match is not None and name_match(log.name) \
+                        or class_match is not None and class_match(log.klass):
+                    yield log
+            return
 
         for log in logs:
             if name_pattern is not None and name_pattern in log.name \
@@ -140,6 +235,13 @@ class Context:
 
         yield from Context.filter_time(logs, day, day + DAY)
 
+    def group_totals(self, logs: LogIterator, classifications: str) -> Totals:
+        """Return the total seconds of the logs grouped like group_by.
+
+        The result has the same structure as group_by but with a number
+        instead of each list of logs, and is computed on arrays."""
+        return LogArray(logs, self).totals(classifications)
+
     def group_by(self, logs: LogIterator, classifications: str):
         if not classifications:
             return list(logs)
@@ -1,51 +1,103 @@
-import subprocess
+import os
+from sys import intern
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from time import time, sleep
-from typing import Optional, Callable, List, NoReturn
-import warnings
+from pathlib import Path
+from time import time
+from typing import Optional, Callable, Iterator, List, Tuple
 
-from src.utils import sec2str, contrast, fmt, notify
+from src.samplers import Sampler, get_sampler
+from src.utils import MICRO, sec2str, contrast, fmt, from_micros, lock, to_micros
 
 SEC = timedelta(seconds=1)
 MIN = timedelta(minutes=1)
 HOUR = timedelta(hours=1)
 DAY = timedelta(days=1)
+SEC_US = SEC // MICRO
 
 
-ON_SWAY = subprocess.run("swaymsg -t get_tree", shell=True, text=True).returncode == 0
-ON_XORG = subprocess.run("xprop -root", shell=True, text=True).returncode == 0
+class LogEntry:
+    """A window that was focused from start to end.
 
-if not ON_SWAY and not ON_XORG:
-    warnings.warn("Neither sway nor xorg is detected, other window managers are not yet supported to get the active window. The gui will not show anything.")
+    Bounds are stored as microseconds since EPOCH in start_us and
+    end_us, and start and end are datetimes computed on access, so that
+    an entry takes little memory. Names and classes read from the logs
+    are interned, so all the entries of a window share them."""
 
+    __slots__ = ("start_us", "end_us", "klass", "name", "stored_cat")
 
-@dataclass
-class LogEntry:
-    start: datetime
-    klass: str
-    name: str
-    end: datetime
+    def __init__(self, start: datetime, klass: str, name: str, end: datetime,
+                 stored_cat: Optional[Tuple[bytes, str]] = None):
+        self.start_us = to_micros(start)
+        self.end_us = to_micros(end)
+        self.klass = klass
+        self.name = name
+        # (config version, category name) stored with the log, see Context.get_cat
+        self.stored_cat = stored_cat
+
+    @classmethod
+    def from_micros(cls, start_us: int, klass: str, name: str, end_us: int,
+                    stored_cat: Optional[Tuple[bytes, str]] = None) -> "LogEntry":
+        log = cls.__new__(cls)
+        log.start_us = start_us
+        log.end_us = end_us
+        log.klass = klass
+        log.name = name
+        log.stored_cat = stored_cat
+        return log
+
+    @property
+    def start(self) -> datetime:
+        return from_micros(self.start_us)
+
+    @start.setter
+    def start(self, value: datetime):
+        self.start_us = to_micros(value)
+
+    @property
+    def end(self) -> datetime:
+        return from_micros(self.end_us)
+
+    @end.setter
+    def end(self, value: datetime):
+        self.end_us = to_micros(value)
+
+    def __eq__(self, other):
+        if not isinstance(other, LogEntry):
+            return NotImplemented
+        return (self.start_us, self.klass, self.name, self.end_us) == \
+               (other.start_us, other.klass, other.name, other.end_us)
+
+    __hash__ = None  # Entries are mutable
+
+    def __repr__(self):
+        return f"LogEntry(start={self.start!r}, klass={self.klass!r}, name={self.name!r}, end={self.end!r})"
 
     def __str__(self):
         return f"{sec2str(self.duration)}: {self.klass} || {self.name}"
 
     @property
     def duration(self) -> float:
-        return (self.end - self.start).total_seconds()
+        return (self.end_us - self.start_us) / 1e6
 
     def intersected(self, start, end) -> Optional["LogEntry"]:
         """Return a log entry contained in the interval [start, end].
 
-        Return None if the intersection is empty"""
+        Return None if the intersection is empty. When the log is already
+        inside the interval, it is returned as is, so the result must
+        not be modified."""
+        return self.intersected_us(to_micros(start), to_micros(end))
+
+    def intersected_us(self, start_us: int, end_us: int) -> Optional["LogEntry"]:
+        """Same as intersected, with bounds in microseconds since EPOCH."""
 
-        if self.start >= start:
-            start = self.start
-        if self.end <= end:
-            end = self.end
+        if self.start_us >= start_us and self.end_us <= end_us:
+            return self if self.start_us < self.end_us else None
 
-        if start < end:
-            return LogEntry(start, self.klass, self.name, end)
+        start_us = max(start_us, self.start_us)
+        end_us = min(end_us, self.end_us)
+        if start_us < end_us:
+            return LogEntry.from_micros(start_us, self.klass, self.name, end_us, self.stored_cat)
         else:
             return None
 
@@ -68,96 +120,178 @@ class LogEntry:
         lines = log.splitlines()
         assert len(lines) in (3, 4), lines
 
-        start = datetime.fromisoformat(lines[0])
-        return cls(
-            datetime.fromisoformat(lines[0]),
-            lines[1],
-            lines[2],
-            start + SEC if len(lines) == 3 else datetime.fromisoformat(lines[3])
+        start = to_micros(datetime.fromisoformat(lines[0]))
+        return cls.from_micros(
+            start,
+            intern(lines[1]),
+            intern(lines[2]),
+            start + SEC_US if len(lines) == 3 else to_micros(datetime.fromisoformat(lines[3]))
         )
 
     @classmethod
-    def get_log(cls, time_step=1) -> "LogEntry":
-        if ON_SWAY:
-            a = subprocess.check_output("swaymsg -t get_tree | jq -r '.. | select(.type?) | select(.focused) | .name, .app_id'", shell=True, text=True).splitlines()
-            
-            wm_name = a[0]
-            wm_class = a[1]
-
-        elif ON_XORG:
-            a = subprocess.check_output("xprop -id $(xdotool getwindowfocus) -notype WM_NAME WM_CLASS", shell=True, text=True).splitlines()
-
-            wm_name = a[0].partition(" = ")[2][1:-1]
-            wm_class = a[1].partition(" = ")[2]
-        else:
-            raise NotImplementedError("This window manager is not supported.")
+    def get_log(cls, time_step=1, sampler: Optional[Sampler] = None) -> "LogEntry":
+        """Return a log for the focused window, lasting [time_step] seconds.
+
+        The window is given by the [sampler], or by a new sampler
+        for the current window manager."""
+
+        if sampler is None:
+            sampler = get_sampler(events=False)
+        wm_class, wm_name = sampler.window()
 
         start = datetime.now()
         return cls(
             start,
-            wm_class,
-            wm_name,
+            intern(wm_class),
+            intern(wm_name),
             start + SEC * time_step,
         )
 
 
-class Logs(list):
-    DELTA = SEC
+class LogWriter:
+    """Append logs to a text log file through one buffered handle.
 
-    def __init__(self, *args, file=None):
-        super().__init__(*args)
-        self.first = True
-        self.file = file
-        self._stop = False
+    Lines are written to the file every [flush_every] seconds or
+    [flush_lines] lines, and synced to disk if [fsync] is True.
 
-    def stop(self):
-        """Stop the app monitoring."""
-        self._stop = True
+    The end of a log is only known when the next one starts, so after
+    each flush, the end of the current log is also saved in a small
+    marker file next to the log. If yatta stops without closing the
+    writer, the marker is used to end the last log on the next start.
 
-    def watch_apps(self, step=1, callback: Optional[Callable[[LogEntry], None]]=None) -> NoReturn:
-        """Check for the active windows undefinetly.
+    The writer holds an exclusive lock on the log until it is closed,
+    so that two recordings never write to the same log."""
 
-        [time_step] is the duration to sleep between checks.
-        [callback] is called every time a log entry is created,
-            with the entry as only parameter."""
+    def __init__(self, file: Path, flush_every=10.0, flush_lines=64, fsync=False, lock=True):
+        self.file = Path(file)
+        self.marker = self.file.with_name(self.file.name + ".end")
+        self.flush_every = flush_every
+        self.flush_lines = flush_lines
+        self.fsync = fsync
 
-        assert self.file
-        assert step >= 1
+        self.current: Optional[LogEntry] = None
+        self._buffer: List[str] = []
+        self._last_flush = time()
+        self._handle = None
+        self._lock = self.acquire(self.file) if lock else None
 
+        self.recover()
+
+    @classmethod
+    def open(cls, file: Path, flush_every=10.0, flush_lines=64, fsync=False):
+        """Return a writer for [file], which can be a text log or a segmented log."""
+        from src.segments import SegmentedLog, SegmentWriter
+        if SegmentedLog.is_segmented(file):
+            return SegmentWriter(file, flush_every, flush_lines, fsync)
+        return cls(file, flush_every, flush_lines, fsync)
+
+    @staticmethod
+    def acquire(file: Path):
+        """Take the lock of the log at [file], and return the file that holds it.
+
+        Raises RuntimeError if the log is already recorded."""
         try:
-            self._watch_apps(step, callback)
-        except BaseException:
-            raise
-        finally:
-            notify('Yatta stopped', 'Active window monitoring has stopped.')
-
-    def _watch_apps(self, time_step, callback):
-        last = time()
-        self._stop = False
-        while not self._stop:
-            try:
-                log = LogEntry.get_log(time_step)
-            except subprocess.CalledProcessError as e:
-                print(e)
-            else:
-                self.append(log)
-                if callback:
-                    callback(log)
+            return lock(Path(str(file) + ".lock"))
+        except BlockingIOError:
+            raise RuntimeError(f"{file} is already recorded by another yatta.") from None
 
-            time_taken = time() - last
+    def recover(self):
+        """End the last log of the file with the marker, if it was not closed."""
 
-            # for instance lid closed
-            if time_taken >= time_step:
-                last = time()
-                print("skip")
-                continue
+        try:
+            end = self.marker.read_text().strip()
+        except FileNotFoundError:
+            return
+        if not self.file.exists():
+            self.marker.unlink()
+            return
+
+        with open(self.file, "rb") as f:
+            f.seek(max(f.seek(0, os.SEEK_END) - 4096, 0))
+            tail = f.read().decode(errors="replace")
+        last = tail.rpartition("---\n")[2].splitlines()
+
+        # Only the start, class and name of the last log were written
+        if len(last) == 3 and end and datetime.fromisoformat(end) > datetime.fromisoformat(last[0]):
+            with open(self.file, "a") as f:
+                f.write(end + "\n")
+        self.marker.unlink()
+
+    def write(self, log: LogEntry):
+        """Start a new log, and end the current one."""
+        if self.current is not None:
+            self._buffer.append(self.current.end.isoformat())
+        self._buffer += ["---", log.start.isoformat(), log.klass, log.name]
+        self.current = log
+        self.tick()
+
+    def tick(self):
+        """Flush the buffer if needed. To be called when the current log is extended."""
+        if len(self._buffer) >= self.flush_lines or time() - self._last_flush >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self._handle is None:
+            self._handle = open(self.file, "a")
+
+        if self._buffer:
+            self._handle.write("\n".join(self._buffer) + "\n")
+            self._buffer.clear()
+            self._handle.flush()
+            if self.fsync:
+                os.fsync(self._handle.fileno())
+
+        # Write-ahead the end of the current log, in case we are killed
+        if self.current is not None:
+            with open(self.marker, "w") as f:
+                f.write(self.current.end.isoformat())
+
+        self._last_flush = time()
+
+    def close(self):
+        """Write the end of the last log and release the file."""
+        # Nothing is written if no log was
+        if self._handle is not None or self.current is not None:
+            if self.current is not None:
+                self._buffer.append(self.current.end.isoformat())
+                self.current = None
+            self.flush()
+            self._handle.close()
+            self._handle = None
+            self.marker.unlink(missing_ok=True)
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+
+class Logs(list):
+    DELTA = SEC
 
-            # This keeps the average between calls exactly time_step
-            last += time_step
-            sleep(time_step - time_taken)
+    def __init__(self, *args, file=None):
+        super().__init__(*args)
+        self.file = file
+        self.writer: Optional[LogWriter] = None
+        # Called with (log, previous_end) when a log is added or its end changes
+        self.listeners: List[Callable[[LogEntry, datetime], None]] = []
 
     @classmethod
-    def load(cls, file):
+    def load(cls, file, start=None, end=None):
+        """Load the logs stored in [file].
+
+        If [start] or [end] is given, only the logs that may overlap
+        [start, end] are loaded, thanks to the time index of the file.
+        The logs are not clamped to the interval."""
+
+        if file.is_dir():
+            from src.segments import SegmentedLog
+            from src.store import BinaryStore
+            if SegmentedLog.is_segmented(file):
+                return SegmentedLog.open(file).load(start, end)
+            return BinaryStore(file).load(start, end)
+        if start is not None or end is not None:
+            from src.index import load_range
+            return load_range(file, start, end)
+
         txt = file.read_text()
         txt = txt[4:]  # Remove the first line of ---
         if txt:
@@ -165,20 +299,53 @@ class Logs(list):
                         for lines in txt.split("---\n") if lines], file=file)
         return cls(file=file)
 
+    @staticmethod
+    def stream(file, start=None, end=None) -> Iterator[LogEntry]:
+        """Yield the logs stored in [file] without keeping them in memory.
+
+        The file is read by chunks, so memory does not grow with
+        the history. [start] and [end] work like in load."""
+
+        if file.is_dir():
+            from src.segments import SegmentedLog
+            from src.store import BinaryStore
+            if SegmentedLog.is_segmented(file):
+                return SegmentedLog.open(file).stream(start, end)
+            return BinaryStore(file).stream(start, end)
+        from src.index import iter_range
+        return iter_range(file, start, end)
+
     def append(self, log: LogEntry):
-        """Append a log to the list and sync the file where they are stored."""
-        if self.first:
+        """Append a log to the list and sync the file where they are stored.
+
+        The file is written by a LogWriter, and close() must be called
+        once no more logs are appended."""
+
+        if self.file and self.writer is None:
+            self.writer = LogWriter.open(self.file)
+
+        if self.writer is None:
+            self.merge(log)
+        elif self.writer.current is None:
+            # We never merge with logs that are already stored
             list.append(self, log)
-            if self.file:
-                log.write_log(self.file)
+            self._extended(log, log.start_us)
+            self.writer.write(log)
+        elif self.merge(log):
+            self.writer.tick()
         else:
-            if not self.merge(log):
-                if self.file:
-                    # Write last line of last log
-                    self[-2].write_log(self.file, True)
-                    log.write_log(self.file)
+            self.writer.write(log)
 
-        self.first = False
+    def close(self):
+        """Write the end of the last log to the file."""
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def merge(self, log) -> bool:
         """Append a log to the list, and merge it with the previous one if possible.
@@ -189,22 +356,40 @@ class Logs(list):
 
         if not self:
             list.append(self, log)
+            Logs._extended(self, log, log.start_us)
             return False
 
         last = self[-1]
-        if abs(last.end - log.start) < self.DELTA:
+        previous_end = last.end_us
+        if Logs.continues(last, log):
             if last.name == log.name and last.klass == log.klass:
-                last.end = log.end
+                last.end_us = max(last.end_us, log.end_us)
+                Logs._extended(self, last, previous_end)
                 return True
             else:
-                last.end = log.start
+                # Logs starting before the end of the last one cut it
+                last.end_us = log.start_us
+                Logs._extended(self, last, previous_end)
 
         list.append(self, log)
+        Logs._extended(self, log, log.start_us)
         return False
 
-    def __del__(self):
-        if self.file and not self.first:
-            self[-1].write_log(self.file, True)
+    @classmethod
+    def continues(cls, last: LogEntry, log: LogEntry) -> bool:
+        """Whether [log] starts while [last] lasts or right after it, so that it extends or cuts it.
+
+        A log that starts before [last], after the clock went back, is
+        kept apart, so that [last] never gets a negative duration."""
+        return last.start_us <= log.start_us < last.end_us + cls.DELTA // MICRO
+
+    def _extended(self, log: LogEntry, previous_end_us: int):
+        """Tell the listeners that [log] now ends at log.end instead of [previous_end_us]."""
+        listeners = getattr(self, "listeners", None)
+        if listeners:
+            previous_end = from_micros(previous_end_us)
+            for listener in listeners:
+                listener(log, previous_end)
 
 
 @dataclass
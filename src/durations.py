@@ -0,0 +1,194 @@
+"""
+This module defines an index of the time spent in each category, to
+answer "how many seconds of X between t0 and t1" without going through
+the logs:
+
+    index = DurationIndex(ctx)
+    index.track(logs)  # Follows Logs.append and Logs.merge
+    index.total(start, end, category)
+    index.totals(start, end)  # {category: seconds}
+
+For each category, it keeps the start of its logs and the cumulative
+duration of its first k logs. The logs that start in a range are found
+by bisection, and their total is a difference of two cumulative sums.
+Only the log that starts before the range and the last one that starts
+in it are clamped to the range.
+
+The logs should not overlap, as Logs.merge makes them. A log that
+starts before the last one, when the clock goes back, goes in a small
+buffer that queries clamp log by log. When the buffer is full, it is
+merged into the arrays, which are rebuilt after its first log.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.context import Context
+from src.core import Category, LogEntry, Logs
+from src.utils import to_micros
+
+__all__ = ["DurationIndex"]
+
+
+class DurationIndex:
+    """Cumulative durations of time sorted logs, for each category."""
+
+    # Logs out of order kept aside before they are merged into the arrays
+    MAX_PENDING = 64
+
+    def __init__(self, ctx: Context, logs: Iterable[LogEntry] = ()):
+        self.ctx = ctx
+        self.starts = array("q")
+        self.ends = array("q")
+        # Category code of each log, and microseconds of the first k logs
+        self.codes = array("l")
+        self.cumulative = array("q", [0])
+        self.categories: List[Category] = []
+        # For each category code, the start of its logs and the microseconds of its first k logs
+        self.cat_starts: List[array] = []
+        self.cat_cumulative: List[array] = []
+        self._code: Dict[Category, int] = {}
+        # Logs that start before the last one of the arrays, with their category code
+        self._pending: List[Tuple[LogEntry, int]] = []
+        # The last log added, that merges extend, and its position in the arrays if it is not pending
+        self._last: Optional[LogEntry] = None
+        self._last_at: Optional[Tuple[int, int]] = None
+        for log in logs:
+            self.add(log)
+
+    def __len__(self):
+        return len(self.starts) + len(self._pending)
+
+    @staticmethod
+    def _append(starts: array, cumulative: array, start: int, duration: int) -> int:
+        """Append a log to [starts] and the [cumulative] durations, and return its position."""
+        # cumulative grows first, so that a reader in another thread never bisects past its end
+        cumulative.append(cumulative[-1] + duration)
+        starts.append(start)
+        return len(starts) - 1
+
+    @staticmethod
+    def _grow(cumulative: array, i: int, delta: int):
+        for k in range(i, len(cumulative)):
+            cumulative[k] += delta
+
+    def add(self, log: LogEntry):
+        """Index a log. It is cheaper when it starts after all the others."""
+
+        cat = self.ctx.get_cat(log)
+        code = self._code.get(cat)
+        if code is None:
+            code = self._code[cat] = len(self.categories)
+            self.categories.append(cat)
+            self.cat_starts.append(array("q"))
+            self.cat_cumulative.append(array("q", [0]))
+
+        self._last = log
+        if self.starts and log.start_us < self.starts[-1]:
+            # Only the last log can still change, so the others can be merged
+            if len(self._pending) >= self.MAX_PENDING:
+                self._merge()
+            self._pending.append((log, code))
+            self._last_at = None
+            return
+
+        duration = log.end_us - log.start_us
+        self.ends.append(log.end_us)
+        self.codes.append(code)
+        i = self._append(self.starts, self.cumulative, log.start_us, duration)
+        j = self._append(self.cat_starts[code], self.cat_cumulative[code], log.start_us, duration)
+        self._last_at = i, j
+
+    def _merge(self):
+        """Merge the pending logs into the arrays, rebuilding them after the first one."""
+
+        first = min(log.start_us for log, _ in self._pending)
+        lo = bisect_right(self.starts, first)
+        logs = sorted([*zip(self.starts[lo:], self.ends[lo:], self.codes[lo:]),
+                       *((log.start_us, log.end_us, code) for log, code in self._pending)])
+        self._pending = []
+        self.starts[lo:] = array("q", [start for start, _, _ in logs])
+        self.ends[lo:] = array("q", [end for _, end, _ in logs])
+        self.codes[lo:] = array("l", [code for _, _, code in logs])
+        self.cumulative[lo:] = array("q", accumulate((end - start for start, end, _ in logs),
+                                                     initial=self.cumulative[lo]))
+        for code, (starts, cumulative) in enumerate(zip(self.cat_starts, self.cat_cumulative)):
+            cat_lo = bisect_right(starts, first)
+            cat_logs = [(start, end) for start, end, c in logs if c == code]
+            starts[cat_lo:] = array("q", [start for start, _ in cat_logs])
+            cumulative[cat_lo:] = array("q", accumulate((end - start for start, end in cat_logs),
+                                                        initial=cumulative[cat_lo]))
+
+    def track(self, logs: Logs):
+        """Index [logs] and follow their changes."""
+        self.__init__(self.ctx, logs)
+        if self._extended not in logs.listeners:
+            logs.listeners.append(self._extended)
+
+    def untrack(self, logs: Logs):
+        """Stop following the changes of [logs]."""
+        if self._extended in logs.listeners:
+            logs.listeners.remove(self._extended)
+
+    def _extended(self, log: LogEntry, previous_end: datetime):
+        if log is not self._last:
+            self.add(log)
+            return
+        if self._last_at is None:
+            return  # Pending logs are clamped with their current end
+        # Only the last log changes, when it is merged or cut
+        i, j = self._last_at
+        delta = log.end_us - self.ends[i]
+        self.ends[i] = log.end_us
+        self._grow(self.cumulative, i + 1, delta)
+        self._grow(self.cat_cumulative[self.codes[i]], j + 1, delta)
+
+    def _bounds(self, start: Optional[datetime], end: Optional[datetime]):
+        first = to_micros(start) if start is not None else -2 ** 63
+        last = to_micros(end) if end is not None else 2 ** 63 - 1
+        return first, last, bisect_left(self.starts, first), bisect_left(self.starts, last)
+
+    def _clamped(self, first: int, last: int, lo: int, hi: int):
+        """Yield the code and microseconds to add for the logs at the boundaries of the range,
+        and for the pending logs."""
+        # The log that starts before the range may end in it
+        if lo > 0 and self.ends[lo - 1] > first:
+            yield self.codes[lo - 1], min(self.ends[lo - 1], last) - first
+        # The last log that starts in the range may end after it
+        if hi > lo and self.ends[hi - 1] > last:
+            yield self.codes[hi - 1], last - self.ends[hi - 1]
+        for log, code in self._pending:
+            micros = min(log.end_us, last) - max(log.start_us, first)
+            if micros > 0:
+                yield code, micros
+
+    def total(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              category: Optional[Category] = None) -> float:
+        """Return the seconds spent between [start] and [end], in [category] or in all of them."""
+
+        first, last, lo, hi = self._bounds(start, end)
+        if category is None:
+            micros = self.cumulative[hi] - self.cumulative[lo]
+            micros += sum(m for _, m in self._clamped(first, last, lo, hi))
+            return micros / 1e6
+
+        code = self._code.get(category)
+        if code is None:
+            return 0.0
+        starts, cumulative = self.cat_starts[code], self.cat_cumulative[code]
+        micros = cumulative[bisect_left(starts, last)] - cumulative[bisect_left(starts, first)]
+        micros += sum(m for c, m in self._clamped(first, last, lo, hi) if c == code)
+        return micros / 1e6
+
+    def totals(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[Category, float]:
+        """Return the seconds spent in each category between [start] and [end]."""
+
+        first, last, lo, hi = self._bounds(start, end)
+        micros = [cumulative[bisect_left(starts, last)] - cumulative[bisect_left(starts, first)]
+                  for starts, cumulative in zip(self.cat_starts, self.cat_cumulative)]
+        for code, m in self._clamped(first, last, lo, hi):
+            micros[code] += m
+        return {cat: m / 1e6 for cat, m in zip(self.categories, micros) if m > 0}
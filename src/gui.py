@@ -1,31 +1,63 @@
-import os
+import asyncio
 from collections import defaultdict
 from datetime import datetime
 from operator import itemgetter
+from queue import Empty, Full, Queue
 from threading import Thread
 from time import sleep
+from typing import Dict, List, Optional, Tuple
 
 import pygame
 from pygame import Vector2 as Vec
 
 from src.context import Context
-from src.core import AFK, DAY, LogEntry, Logs, UNCAT
-from src.utils import int_to_rgb, notify, sec2str, start_of_day
+from src.core import AFK, DAY, Category, LogEntry, Logs, UNCAT
+from src.durations import DurationIndex
+from src.metrics import TrackerMetrics
+from src.profiling import Profiler
+from src.rollup import DailyRollup
+from src.sinks import LockEnforcer, Notifier
+from src.tracker import Tracker
+from src.utils import int_to_rgb, sec2str, start_of_day
 
 
 class Gui:
     ROW_IDEAL_SIZE = 60
-    FPS = 1 / 3  # We don't need more than 3 FPS :P
+    FPS = 1 / 10  # Only the rows that changed are sent to the screen, so this is cheap
+    MAX_PENDING = 64  # Logs to draw that wait for the screen
 
-    def __init__(self, ctx: Context, logs: Logs):
+    def __init__(self, ctx: Context, logs: Logs, profiler: Optional[Profiler] = None,
+                 metrics: Optional[TrackerMetrics] = None):
         pygame.init()
 
         self.ctx = ctx
         self.logs = logs
+        self.profiler = profiler or Profiler(enabled=False)
+        self.metrics = metrics
         self.size = (200, 300)
+        with self.profiler.stage("DailyRollup.open"):
+            self.rollup = DailyRollup.open(logs.file, ctx)
+            self.rollup.track(logs)
+        # The notifications ask for the time of a category in a day
+        with self.profiler.stage("DurationIndex.track"):
+            self.index = DurationIndex(ctx)
+            self.index.track(logs)
         self.durs = defaultdict(int)
+        # Logs stored by the tracker, to draw
+        self.received: "Queue[LogEntry]" = Queue(self.MAX_PENDING)
+        # The logs are sampled and stored by the tracker in other threads,
+        # so that drawing and notifications never delay a sample
+        self.tracker = Tracker(logs, 1, metrics=metrics)
+        self.running = False
         self.next_day = start_of_day(datetime.now()) + DAY
 
+        # Rendered tile and its time text, for each category
+        self.tiles: Dict[Category, Tuple[str, pygame.Surface]] = {}
+        # The category and time text drawn on each row
+        self.shown: List[Optional[Tuple[Category, str]]] = []
+        # Rects of the screen to update on the next frame
+        self.dirty: List[pygame.Rect] = []
+
         self.display = self.get_display(self.size)
         pygame.display.set_caption("Yatta")
         self.font = pygame.font.SysFont("sourcecodeproforpowerline", 20, bold=True)
@@ -34,44 +66,106 @@ class Gui:
     def rows(self):
         return self.size[1] // self.ROW_IDEAL_SIZE or 1
 
+    @property
+    def row_height(self):
+        return self.size[1] // self.rows
+
     def get_display(self, size) -> pygame.Surface:
         self.size = size
-        return pygame.display.set_mode(self.size, pygame.RESIZABLE)
+        display = pygame.display.set_mode(self.size, pygame.RESIZABLE)
+        self.invalidate(display)
+        return display
+
+    def invalidate(self, display=None):
+        """Forget the tiles and redraw the whole screen on the next log."""
+        display = display or self.display
+        self.tiles.clear()
+        self.shown = []
+        display.fill(0)
+        self.dirty = [display.get_rect()]
 
     def run(self):
         self.compute_durs()
 
-        thread = Thread(target=self.logs.watch_apps, args=(1, self.draw))
+        tracker = self.tracker
+        tracker.add_sink(self.offer)
+        tracker.add_sink(Notifier(self.ctx, self.totals), blocking=True)
+        tracker.add_sink(LockEnforcer(self.ctx, self.totals), blocking=True)
+        thread = Thread(target=asyncio.run, args=(tracker.run(),), name="yatta-tracker")
         thread.start()
 
+        self.running = True
         try:
-            while thread.is_alive():
+            while self.running and thread.is_alive():
                 for event in pygame.event.get():
                     self.process_event(event)
 
+                # Only the last state of the screen matters
+                log = None
+                while not self.received.empty():
+                    log = self.received.get_nowait()
+                if log is not None:
+                    with self.profiler.stage("draw", 1):
+                        self.draw(log)
+
                 # If day changes, take the cats for the correct day
                 if datetime.now() >= self.next_day:
                     self.compute_durs()
                     self.next_day = start_of_day(datetime.now()) + DAY
-                    self.display.fill(0)
+                    self.invalidate()
 
-                pygame.display.update()
+                if self.dirty:
+                    with self.profiler.stage("display.update"):
+                        pygame.display.update(self.dirty)
+                    self.dirty = []
                 sleep(self.FPS)
-
-                # Note: we don't draw the screen here. It is redrawn only on new
-                # Log entries (callback of the thread)
         finally:
-            self.logs.stop()
+            tracker.stop()
+            thread.join()
+            if tracker.missed:
+                print(tracker.missed, "ticks were missed")
+
+    def offer(self, log: LogEntry):
+        """Queue a log to draw, dropping the oldest if the screen is behind."""
+        while True:
+            try:
+                self.received.put_nowait(log)
+                return
+            except Full:
+                # Only the last state of the screen matters
+                try:
+                    self.received.get_nowait()
+                    self.tracker.metrics.dropped += 1
+                except Empty:
+                    pass
+
+    def totals(self, start: datetime, end: datetime) -> Dict[Category, float]:
+        """The seconds of each category between [start] and [end], from the current index."""
+        # The store thread of the tracker changes the index
+        with self.tracker.lock:
+            return self.index.totals(start, end)
+
+    def reload(self):
+        """Reload the config, and rebuild the rollup and the index with its categories."""
+        # The store thread of the tracker runs the listeners of the logs with the config
+        with self.tracker.lock:
+            # The store next to the log, that `yatta recategorize` updates by default
+            self.ctx.reload(self.logs.file.with_suffix(".d") if self.logs.file else None)
+            self.rollup.untrack(self.logs)
+            self.rollup = DailyRollup.open(self.logs.file, self.ctx)
+            self.rollup.track(self.logs)
+            self.index.track(self.logs)
+            self.compute_durs()
 
     def process_event(self, event):
         if event.type == pygame.QUIT:
-            self.logs.stop()
+            self.running = False
         elif event.type == pygame.VIDEORESIZE:
             self.display = self.get_display(event.size)
         elif event.type == pygame.KEYDOWN:
             if event.key == pygame.K_r:
-                self.ctx.reload()
-                self.compute_durs()
+                self.reload()
+                self.invalidate()
             elif event.unicode.isdigit():
                 self.display = self.get_display((self.size[0], int(event.unicode) * self.ROW_IDEAL_SIZE))
 
@@ -83,7 +177,7 @@ class Gui:
         fg = int_to_rgb(cat.fg)
 
         # Background
-        drawing = pygame.Surface((self.size[0], self.size[1] // self.rows))
+        drawing = pygame.Surface((self.size[0], self.row_height))
         drawing.fill(bg)
         rect = drawing.get_rect()
 
@@ -99,38 +193,46 @@ class Gui:
 
         return drawing
 
+    def tile(self, cat, seconds) -> Tuple[str, pygame.Surface]:
+        """Return the time text and the tile of [cat], rendered only if the text changed."""
+        txt = sec2str(seconds)
+        cached = self.tiles.get(cat)
+        if cached is None or cached[0] != txt:
+            cached = self.tiles[cat] = txt, self.draw_cat(cat, seconds)
+        return cached
+
     def draw(self, log: LogEntry):
-        """Render the whole screen."""
+        """Render the rows that changed."""
 
-        self.display.fill(0)
         # The screen is drawn every time there is a new log entry
         # since there is no point in painting it more
         cat = self.ctx.get_cat(log)
 
         if cat is UNCAT:
             print(log)
-        self.durs[cat] += log.duration
-
-        # Send a notification every 15 minutes of an activity
-        if self.durs[cat] % (15 * 60) < 1:
-            notify(f"Déjà {self.durs[cat] // 60}min passées sur {cat}.")
-            if cat in self.ctx.lock15:
-                os.system("i3lock")
-
-        # Draw the current actvity on top
-        surf = self.draw_cat(cat, self.durs[cat])
-        self.display.blit(surf, (0, 0))
-
-        # Then the rest, sorted
-        bests = sorted(self.durs.items(), key=itemgetter(1), reverse=True)
-        bests = [x for x in bests if x[0] not in (cat, AFK)]
-
-        for i, (c, dur) in enumerate(bests):
-            surf = self.draw_cat(c, dur)
-            self.display.blit(surf, (0, self.size[1] // self.rows * (i + 1)))
+        # self.durs was updated by the rollup when the log was added
+
+        # The current actvity on top, then the rest, sorted.
+        # The durations are updated by the store thread of the tracker, so we use a copy.
+        with self.tracker.lock:
+            durs = self.durs.copy()
+        bests = sorted(durs.items(), key=itemgetter(1), reverse=True)
+        bests = [(cat, durs.get(cat, 0))] + [x for x in bests if x[0] not in (cat, AFK)]
+
+        height = self.row_height
+        rows = []
+        for i, (c, dur) in enumerate(bests[:self.rows]):
+            txt, surf = self.tile(c, dur)
+            rows.append((c, txt))
+            if i >= len(self.shown) or self.shown[i] != rows[-1]:
+                self.dirty.append(self.display.blit(surf, (0, height * i)))
+
+        # Rows that are not used anymore
+        for i in range(len(rows), len(self.shown)):
+            self.dirty.append(self.display.fill(0, (0, height * i, self.size[0], height)))
+        self.shown = rows
 
     def compute_durs(self):
-        """Populate the duration dict"""
-        cats = self.ctx.group_category(self.ctx.filter_today(self.logs))
-        self.durs.clear()
-        self.durs.update({c: self.ctx.tot_secs(ls) for c, ls in cats.items()})
+        """Use the durations of the current day, that the rollup keeps up to date."""
+        with self.tracker.lock:
+            self.durs = self.rollup.day(start_of_day(datetime.now()).date())
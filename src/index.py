@@ -0,0 +1,216 @@
+"""
+This module defines a sparse time index for the text log file.
+
+The index maps the start of every day to the byte offset of the
+first log starting after it, so that reading a time range only needs
+to decode the logs of the days in that range.
+It is stored next to the log, in a .idx file, and is updated
+incrementally as the log grows.
+"""
+
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+from src.core import LogEntry, Logs
+from src.utils import start_of_day, to_micros
+
+MAGIC = b"YATI"
+HEADER = struct.Struct("<4sxxxxQQQ")
+SEPARATOR = b"---\n"
+CHUNK_SIZE = 1 << 20
+
+
+class TimeIndex:
+    """Byte offsets of the first log of each day in a text log file."""
+
+    def __init__(self, file: Path, inode=0, scanned=0, days=(), offsets=()):
+        self.file = Path(file)
+        self.inode = inode
+        # Position after the last log start that was indexed
+        self.scanned = scanned
+        self.days = array("q", days)
+        self.offsets = array("q", offsets)
+
+    @property
+    def path(self) -> Path:
+        return self.file.with_name(self.file.name + ".idx")
+
+    @classmethod
+    def open(cls, file: Path) -> "TimeIndex":
+        """Load the index of [file], and bring it up to date."""
+
+        index = cls(file)
+        try:
+            data = index.path.read_bytes()
+            magic, inode, scanned, count = HEADER.unpack_from(data)
+            if magic == MAGIC:
+                cols = array("q")
+                cols.frombytes(data[HEADER.size:HEADER.size + 16 * count])
+                index = cls(file, inode, scanned, cols[:count], cols[count:])
+        except (OSError, struct.error, ValueError):
+            pass
+
+        if index.update():
+            index.save()
+        return index
+
+    def save(self):
+        data = HEADER.pack(MAGIC, self.inode, self.scanned, len(self.days))
+        data += (self.days + self.offsets).tobytes()
+        try:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # Read only directory, we will rebuild it next time
+
+    def update(self) -> bool:
+        """Index the logs appended since the last update.
+
+        The index is rebuilt from scratch if the file was replaced.
+        Returns whether anything changed."""
+
+        stat = self.file.stat()
+        if stat.st_ino != self.inode or stat.st_size < self.scanned:
+            self.inode = stat.st_ino
+            self.scanned = 0
+            del self.days[:]
+            del self.offsets[:]
+            if not stat.st_size:
+                return True
+        elif stat.st_size == self.scanned:
+            return False
+
+        with open(self.file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            self._scan(mm)
+        return True
+
+    def _scan(self, mm):
+        last_day = self.days[-1] if self.days else None
+        last_hour = None
+        pos = mm.find(SEPARATOR, self.scanned)
+        while pos >= 0:
+            line_start = pos + len(SEPARATOR)
+            line_end = mm.find(b"\n", line_start)
+            if line_end < 0:
+                break  # The log is being written
+
+            # Days change at most once per hour, no need to parse the rest
+            hour = mm[line_start:line_start + 13]
+            if hour != last_hour:
+                last_hour = hour
+                start = datetime.fromisoformat(mm[line_start:line_end].decode())
+                day = to_micros(start_of_day(start))
+                if last_day is None or day > last_day:
+                    self.days.append(day)
+                    self.offsets.append(pos)
+                    last_day = day
+
+            self.scanned = line_end + 1
+            pos = mm.find(SEPARATOR, self.scanned)
+
+    def span(self, start: Optional[datetime], end: Optional[datetime]) -> Tuple[int, Optional[int]]:
+        """Return the range of bytes that contain all logs overlapping [start, end].
+
+        The end of the range is None to mean the end of the file."""
+
+        first = 0
+        if start is not None and start > datetime.min:
+            i = bisect_left(self.days, to_micros(start_of_day(start)))
+            first = self.offsets[i] if i < len(self.days) else self.scanned
+
+        last = None
+        if end is not None and end < datetime.max:
+            i = bisect_left(self.days, to_micros(start_of_day(end)) + 1)
+            if i < len(self.days):
+                last = self.offsets[i]
+
+        return first, last
+
+
+def _decode(mm, first: int, last: int, chunk_size: int) -> Iterator[LogEntry]:
+    """Yield the logs between the bytes [first] and [last], decoding [chunk_size] bytes at a time."""
+
+    pos = first
+    while pos < last:
+        chunk_end = min(pos + chunk_size, last)
+        # Cut after the last complete entry of the chunk
+        cut = mm.rfind(SEPARATOR, pos + 1, chunk_end) if chunk_end < last else chunk_end
+        if cut <= pos:
+            cut = chunk_end  # An entry longer than a chunk
+            if cut < last:
+                cut = mm.find(SEPARATOR, cut)
+                cut = last if cut < 0 or cut > last else cut
+        for lines in mm[pos:cut].decode().split("---\n"):
+            if lines:
+                yield LogEntry.from_logfile(lines)
+        pos = cut
+
+
+def iter_range(file: Path, start: Optional[datetime] = None, end: Optional[datetime] = None,
+               chunk_size=CHUNK_SIZE) -> Iterator[LogEntry]:
+    """Yield the logs of [file] that may overlap [start, end], decoding
+    [chunk_size] bytes at a time.
+
+    Only the days in the range are read, the logs are not clamped."""
+
+    index = TimeIndex.open(file)
+    first, last = index.span(start, end)
+
+    with open(file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # The log running at [start] is the one just before
+            if first:
+                first = max(mm.rfind(SEPARATOR, 0, first), 0)
+            last = len(mm) if last is None else last
+            yield from _decode(mm, first, last, chunk_size)
+
+
+def iter_days(file: Path, days: Iterable[int], start: Optional[datetime] = None, end: Optional[datetime] = None,
+              chunk_size=CHUNK_SIZE) -> Iterator[LogEntry]:
+    """Yield the logs of [file] of the given [days] of its time index that may overlap [start, end].
+
+    Consecutive days are read together, the logs are not clamped."""
+
+    index = TimeIndex.open(file)
+    first = to_micros(start_of_day(start)) if start is not None and start > datetime.min else None
+    last = to_micros(start_of_day(end)) if end is not None and end < datetime.max else None
+
+    ranges = []
+    for day in days:
+        i = bisect_left(index.days, day)
+        if i == len(index.days) or index.days[i] != day:
+            continue
+        # The last log of the day before may overlap start
+        if first is not None and i + 1 < len(index.days) and index.days[i + 1] < first:
+            continue
+        if last is not None and day > last:
+            continue
+        begin = index.offsets[i]
+        stop = index.offsets[i + 1] if i + 1 < len(index.days) else None
+        if ranges and ranges[-1][1] == begin:
+            ranges[-1][1] = stop
+        else:
+            ranges.append([begin, stop])
+
+    if not ranges:
+        return
+    with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for begin, stop in ranges:
+            yield from _decode(mm, begin, len(mm) if stop is None else stop, chunk_size)
+
+
+def load_range(file: Path, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Logs:
+    """Load the logs of [file] that may overlap [start, end].
+
+    Only the days in the range are decoded, the logs are not clamped."""
+
+    return Logs(iter_range(file, start, end), file=file)
@@ -0,0 +1,219 @@
+"""
+This module defines the health metrics of the recording, so that the
+samples lost under load are counted instead of only printed:
+
+    yatta_sample_seconds         histogram of the time to get the focused window
+    yatta_tick_drift_seconds     histogram of how late the ticks happen
+    yatta_write_seconds          histogram of the time to append a log
+    yatta_store_seconds          histogram of the time from a sample until its log is stored
+    yatta_sink_seconds           histogram of the time from a sample until a sink handled it
+    yatta_ticks_total            samples attempted
+    yatta_ticks_skipped_total    ticks without a sample, as when the laptop sleeps
+    yatta_sample_errors_total    samples that failed
+    yatta_logs_total             logs appended
+    yatta_logs_merged_total      logs merged with the previous one
+    yatta_merge_ratio            merged logs / logs
+    yatta_blocked_seconds_total  time the sampling waited for the store stage
+    yatta_sink_dropped_total     logs that sinks which fell behind never saw
+    yatta_backlog_max            most logs waiting to be stored at once
+
+They are kept by the tracker and exported in the text format of
+Prometheus by a MetricsExporter, either in a file rewritten every few
+seconds, or through a Unix socket if its path ends in .sock.
+`yatta stats` reads them.
+"""
+
+import os
+import socket
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import perf_counter, time
+from typing import Dict, List, Tuple
+
+__all__ = ["Histogram", "TrackerMetrics", "MetricsExporter", "parse", "quantile", "read_metrics"]
+
+SOCKET_SUFFIX = ".sock"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass
+class Histogram:
+    """Counts of values below each bound, like a Prometheus histogram."""
+
+    name: str
+    help: str
+    buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    # One more count for the values above the last bound
+    counts: List[int] = field(default_factory=list)
+    sum: float = 0.0
+    count: int = 0
+
+    def __post_init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class TrackerMetrics:
+    """Rolling metrics of a recording, since it started."""
+
+    def __init__(self):
+        self.sample = Histogram("yatta_sample_seconds", "Time to get the focused window.")
+        self.drift = Histogram("yatta_tick_drift_seconds", "Delay between the scheduled and the actual ticks.")
+        self.write = Histogram("yatta_write_seconds", "Time to append a log and write it.")
+        # Latency of each stage of the pipeline of the tracker, since the sample
+        self.store = Histogram("yatta_store_seconds", "Time from a sample until its log is stored.")
+        self.sink = Histogram("yatta_sink_seconds", "Time from a sample until a sink handled its log.")
+        self.ticks = 0
+        self.skipped = 0
+        self.errors = 0
+        self.logs = 0
+        self.merged = 0
+        self.blocked = 0.0
+        self.dropped = 0
+        self.backlog = 0
+        self.start_time = time()
+
+    def append(self, logs, log):
+        """Append [log] to [logs], measuring how long it takes and whether it was merged."""
+        count = len(logs)
+        start = perf_counter()
+        logs.append(log)
+        self.write.observe(perf_counter() - start)
+        self.logs += 1
+        if len(logs) == count:
+            self.merged += 1
+
+    def render(self) -> str:
+        """Return the metrics in the text format of Prometheus."""
+
+        lines = []
+        for histogram in (self.sample, self.drift, self.write, self.store, self.sink):
+            lines += histogram.render()
+        values = [
+            ("yatta_ticks_total", "counter", "Samples attempted.", self.ticks),
+            ("yatta_ticks_skipped_total", "counter", "Ticks without a sample.", self.skipped),
+            ("yatta_sample_errors_total", "counter", "Samples that failed.", self.errors),
+            ("yatta_logs_total", "counter", "Logs appended.", self.logs),
+            ("yatta_logs_merged_total", "counter", "Logs merged with the previous one.", self.merged),
+            ("yatta_merge_ratio", "gauge", "Part of the logs merged with the previous one.",
+             self.merged / self.logs if self.logs else 0.0),
+            ("yatta_blocked_seconds_total", "counter", "Time the sampling waited for the store stage.", self.blocked),
+            ("yatta_sink_dropped_total", "counter", "Logs that sinks which fell behind never saw.", self.dropped),
+            ("yatta_backlog_max", "gauge", "Most logs waiting to be stored at once.", self.backlog),
+            ("yatta_start_time_seconds", "gauge", "Unix time when the recording started.", self.start_time),
+            ("yatta_metrics_timestamp_seconds", "gauge", "Unix time of these metrics.", time()),
+        ]
+        for name, kind, help, value in values:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Write [metrics] to [path] every [every] seconds, in a thread.
+
+    If [path] ends in .sock, it is a Unix socket that sends the metrics
+    to each connection instead."""
+
+    def __init__(self, metrics: TrackerMetrics, path: Path, every=10.0):
+        self.metrics = metrics
+        self.path = Path(path)
+        self.every = every
+        self._stop = threading.Event()
+        self._server = None
+        self._thread = threading.Thread(target=self._run, name="yatta-metrics", daemon=True)
+
+    @property
+    def is_socket(self) -> bool:
+        return self.path.suffix == SOCKET_SUFFIX
+
+    def start(self) -> "MetricsExporter":
+        if self.is_socket:
+            self.path.unlink(missing_ok=True)  # Left by a yatta that was killed
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(str(self.path))
+            self._server.listen()
+            self._server.settimeout(1)  # To notice stop()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop exporting. The file keeps the last metrics, the socket is removed."""
+        self._stop.set()
+        self._thread.join()
+        if self._server is not None:
+            self._server.close()
+            self.path.unlink(missing_ok=True)
+        else:
+            self.write()
+
+    def write(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(self.metrics.render())
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._server is None:
+                self.write()
+                self._stop.wait(self.every)
+                continue
+            try:
+                conn, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            with conn:
+                try:
+                    conn.sendall(self.metrics.render().encode())
+                except OSError:
+                    pass  # The reader left
+
+
+def read_metrics(path: Path) -> str:
+    """Return the metrics exported at [path], a file or a Unix socket."""
+
+    path = Path(path)
+    if path.suffix != SOCKET_SUFFIX:
+        return path.read_text()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(path))
+        chunks = []
+        while chunk := client.recv(1 << 16):
+            chunks.append(chunk)
+    return b"".join(chunks).decode()
+
+
+def parse(text: str) -> Dict[str, float]:
+    """Return the samples of metrics in the text format of Prometheus, by name with their labels."""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def quantile(samples: Dict[str, float], name: str, q: float) -> float:
+    """Return the upper bound of the bucket of the [q] quantile of the histogram [name] in [samples]."""
+    count = samples.get(f"{name}_count", 0)
+    buckets = sorted((float(key.split('"')[1]), value) for key, value in samples.items()
+                     if key.startswith(f"{name}_bucket{{"))
+    for bound, cumulative in buckets:
+        if cumulative >= q * count:
+            return bound
+    return float("inf")
@@ -0,0 +1,214 @@
+"""
+This module measures where the time of a command goes, stage by stage:
+
+    profiler = Profiler(ctx)
+    with profiler:
+        logs = profiler.iterate("Logs.stream", Logs.stream(file))
+        logs = profiler.iterate("filter_time", ctx.filter_time(logs, start, end))
+        with profiler.stage("group_by"):
+            grouped = ctx.group_by(list(logs), "CD")
+    profiler.report()
+
+Most stages are generators that pull from each other, so the time of
+a stage is its own time: the time spent in the stages it pulls from is
+not counted. Each stage also counts the entries it yields, and the
+calls to Context.get_cat and to the categorize function of the config
+that happen in it. Calls from other threads are counted in a stage of
+their own, and the workers of --jobs are not profiled. The report ends
+with the hits and evictions of the category cache of the Context.
+
+The whole run can also be saved as a pstats file of cProfile, or as a
+Chrome trace (to open in chrome://tracing or https://ui.perfetto.dev),
+where each stage is a row.
+
+A disabled profiler does nothing, so commands can always go through it.
+"""
+
+import cProfile
+import json
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import perf_counter
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+from src.context import Context
+
+__all__ = ["Profiler", "StageStats"]
+
+T = TypeVar("T")
+
+# Spans kept per stage for the trace, the gui enters its stages every frame
+MAX_SPANS = 10_000
+
+
+@dataclass
+class StageStats:
+    """What happened in one stage."""
+
+    name: str
+    calls: int = 0
+    entries: int = 0
+    # Seconds spent in the stage itself, and since it started until it ended
+    time: float = 0.0
+    first: Optional[float] = None
+    last: float = 0.0
+    get_cat: int = 0
+    categorize: int = 0
+    # (start, duration) of the last MAX_SPANS calls of a stage used as a context manager
+    spans: Deque[tuple] = field(default_factory=lambda: deque(maxlen=MAX_SPANS))
+
+
+class Profiler:
+    """Time and count the stages of a command. Does nothing unless [enabled]."""
+
+    def __init__(self, ctx: Optional[Context] = None, enabled=True, output: Optional[Path] = None):
+        self.ctx = ctx
+        self.enabled = enabled or output is not None
+        self.output = Path(output) if output is not None else None
+        self.stages: Dict[str, StageStats] = {}
+        # The stages running, and the time spent in the stages they called
+        self._stack: List[list] = []
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._thread = threading.get_ident()
+        self._start = self._end = 0.0
+
+    def __enter__(self) -> "Profiler":
+        if not self.enabled:
+            return self
+        if self.ctx is not None:
+            self._count(self.ctx, "get_cat")
+            self._count(self.ctx, "categorize")
+        if self.output is not None and self.output.suffix != ".json":
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if not self.enabled:
+            return
+        self._end = perf_counter()
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.output)
+        elif self.output is not None:
+            self.output.write_text(json.dumps(self.chrome_trace()))
+        if self.ctx is not None:
+            # Remove the counting wrappers, unless the config was reloaded since
+            self.ctx.__dict__.pop("get_cat", None)
+            categorize = self.ctx.categorize
+            self.ctx.categorize = getattr(categorize, "__wrapped__", categorize)
+        self.report()
+
+    def _count(self, ctx: Context, name: str):
+        func = getattr(ctx, name)
+
+        def counted(*args, **kwargs):
+            if threading.get_ident() != self._thread:
+                stats = self._get("other threads")
+            elif self._stack:
+                stats = self._stack[-1][0]
+            else:
+                return func(*args, **kwargs)
+            setattr(stats, name, getattr(stats, name) + 1)
+            return func(*args, **kwargs)
+
+        counted.__wrapped__ = func
+        setattr(ctx, name, counted)
+
+    def _get(self, name: str) -> StageStats:
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats(name)
+        return stats
+
+    def _enter(self, stats: StageStats) -> float:
+        start = perf_counter()
+        self._stack.append([stats, 0.0])
+        if stats.first is None:
+            stats.first = start
+        return start
+
+    def _exit(self, start: float) -> float:
+        end = perf_counter()
+        stats, inner = self._stack.pop()
+        elapsed = end - start
+        stats.time += elapsed - inner
+        stats.last = end
+        if self._stack:
+            self._stack[-1][1] += elapsed
+        return elapsed
+
+    def stage(self, name: str, entries=0):
+        """Context manager that times a stage that processes [entries] logs."""
+        if not self.enabled:
+            return nullcontext(StageStats(name))
+        return self._stage(name, entries)
+
+    @contextmanager
+    def _stage(self, name: str, entries: int):
+        stats = self._get(name)
+        stats.calls += 1
+        stats.entries += entries
+        start = self._enter(stats)
+        try:
+            yield stats
+        finally:
+            stats.spans.append((start, self._exit(start)))
+
+    def iterate(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """Return an iterator over [iterable] that times the stage that produces its items."""
+        if not self.enabled:
+            return iter(iterable)
+        return self._iterate(self._get(name), iter(iterable))
+
+    def _iterate(self, stats: StageStats, iterator: Iterator[T]) -> Iterator[T]:
+        stats.calls += 1
+        while True:
+            start = self._enter(stats)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._exit(start)
+            stats.entries += 1
+            yield item
+
+    def report(self, file=sys.stderr):
+        """Print the time and counts of each stage."""
+
+        print(f"{'stage':<24} {'calls':>6} {'entries':>9} {'get_cat':>9} {'categorize':>10} {'self time':>10}", file=file)
+        for stats in self.stages.values():
+            print(f"{stats.name:<24} {stats.calls:>6} {stats.entries:>9} {stats.get_cat:>9} {stats.categorize:>10} "
+                  f"{stats.time * 1000:>8.1f}ms", file=file)
+        total = self._end - self._start
+        staged = sum(stats.time for stats in self.stages.values())
+        print(f"{'outside stages':<24} {'':>6} {'':>9} {'':>9} {'':>10} {(total - staged) * 1000:>8.1f}ms", file=file)
+        print(f"{'total':<24} {'':>6} {'':>9} {'':>9} {'':>10} {total * 1000:>8.1f}ms", file=file)
+        if self.ctx is not None:
+            # Evictions mean that CACHE_SIZE of the config is too small
+            print("Category cache:", self.ctx.cache.stats(), file=file)
+        if self.output is not None:
+            print("Profile written to", self.output, file=file)
+
+    def chrome_trace(self) -> dict:
+        """Return the stages in the Chrome trace event format, one row per stage."""
+
+        def us(t):
+            return round((t - self._start) * 1e6, 1)
+
+        events = [{"name": "run", "ph": "X", "pid": 0, "tid": 0, "ts": 0, "dur": us(self._end)}]
+        for tid, stats in enumerate(self.stages.values(), 1):
+            events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": tid, "args": {"name": stats.name}})
+            args = {"entries": stats.entries, "get_cat": stats.get_cat, "categorize": stats.categorize,
+                    "self_ms": round(stats.time * 1000, 3)}
+            spans = stats.spans or ([(stats.first, stats.last - stats.first)] if stats.first is not None else [])
+            for start, duration in spans:
+                events.append({"name": stats.name, "ph": "X", "pid": 0, "tid": tid,
+                               "ts": us(start), "dur": round(duration * 1e6, 1), "args": args})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
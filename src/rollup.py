@@ -0,0 +1,174 @@
+"""
+This module defines the daily rollup: the total time spent in each
+category, for each day, saved next to the log.
+
+Complete days are folded once and saved, so the gui only needs to
+read the logs of the current day. The current day is kept
+up to date by following the appends to a Logs object.
+"""
+
+import json
+import os
+from collections import defaultdict
+from datetime import date, datetime
+from pathlib import Path
+from typing import Collection, Dict, Optional
+
+from src.arrays import Totals
+from src.context import Context
+from src.core import Category, DAY, LogEntry, Logs
+from src.utils import start_of_day
+
+__all__ = ["DailyRollup", "regroup"]
+
+DayTotals = Dict[Category, float]
+
+
+def regroup(days: Dict[date, DayTotals], classifications: str,
+            exclude: Collection = (), category: Optional[str] = None) -> Totals:
+    """Return the totals of each day and category grouped by [classifications], like Context.group_totals.
+
+    Categories in [exclude] are dropped, and if [category] is given only this one is kept."""
+
+    grouped = {} if classifications else 0.0
+    for day, cats in sorted(days.items()):
+        for cat, secs in cats.items():
+            if cat in exclude or category is not None and cat != category or secs <= 0:
+                continue
+            keys = [day if c == "D" else cat for c in classifications]
+            if not keys:
+                grouped += secs
+                continue
+            group = grouped
+            for key in keys[:-1]:
+                group = group.setdefault(key, {})
+            group[keys[-1]] = group.get(keys[-1], 0) + secs
+    return grouped
+
+
+class DailyRollup:
+    """Total seconds per day and per category."""
+
+    def __init__(self, path: Optional[Path], ctx: Context):
+        # Where it is saved, or None to keep it in memory
+        self.path = Path(path) if path is not None else None
+        self.ctx = ctx
+        # Every day that starts before [until] is complete in [days]
+        self.until = datetime.min
+        self.days: Dict[date, DayTotals] = {}
+        # The days after [until], from the logs that are followed
+        self.live: Dict[date, DayTotals] = defaultdict(lambda: defaultdict(float))
+
+    @classmethod
+    def open(cls, logfile: Optional[Path], ctx: Context) -> "DailyRollup":
+        """Load the rollup of [logfile] and fold the days completed since it was saved.
+
+        The rollup is rebuilt if the config changed. Logs without a file,
+        like the ones of a binary store, get a rollup that is only in
+        memory and only knows the days of the logs it tracks."""
+
+        if logfile is None:
+            return cls(None, ctx)
+
+        rollup = cls(Path(str(logfile) + ".rollup"), ctx)
+        try:
+            data = json.loads(rollup.path.read_text())
+            if data["version"] == ctx.version.hex():
+                colors = data["colors"]
+                rollup.until = datetime.fromisoformat(data["until"])
+                rollup.days = {
+                    date.fromisoformat(day): {rollup._category(name, colors): secs for name, secs in cats.items()}
+                    for day, cats in data["days"].items()
+                }
+        except (OSError, ValueError, KeyError):
+            pass
+
+        rollup.catch_up(logfile)
+        return rollup
+
+    def _category(self, name, colors) -> Category:
+        try:
+            return self.ctx.categories[name]
+        except KeyError:
+            return Category(name, colors.get(name, 0x808080))
+
+    def save(self):
+        if self.path is None:
+            return
+        cats = {c for day in self.days.values() for c in day}
+        data = {
+            "version": self.ctx.version.hex(),
+            "until": self.until.isoformat(),
+            "colors": {c.name: c.color for c in cats},
+            "days": {day.isoformat(): {c.name: secs for c, secs in cats.items()}
+                     for day, cats in self.days.items()},
+        }
+        try:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(data))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # Read only directory, we will catch up next time
+
+    def _fold(self, days: Dict[date, DayTotals], log: LogEntry, start: datetime, end: datetime, sign=1):
+        """Add the time of [log] between start and end, split by days."""
+        if start >= end:
+            return
+        cat = self.ctx.get_cat(log)
+        while start < end:
+            day = start_of_day(start)
+            next_day = day + DAY
+            cats = days.setdefault(day.date(), defaultdict(float))
+            cats[cat] = cats.get(cat, 0) + sign * (min(end, next_day) - start).total_seconds()
+            start = next_day
+
+    def catch_up(self, logfile: Path):
+        """Fold all the days that are complete."""
+
+        today = start_of_day(datetime.now())
+        if self.until >= today:
+            return
+
+        start = None if self.until == datetime.min else self.until
+        for log in Logs.load(logfile, start, today):
+            self._fold(self.days, log, max(log.start, self.until), min(log.end, today))
+        self.until = today
+        self.save()
+
+    def track(self, logs: Logs):
+        """Compute the current day from [logs] and follow their changes.
+
+        [logs] must contain all the logs since the start of the current day."""
+
+        self.live.clear()
+        for log in logs:
+            self._fold(self.live, log, max(log.start, self.until), log.end)
+        if self._extended not in logs.listeners:
+            logs.listeners.append(self._extended)
+
+    def untrack(self, logs: Logs):
+        """Stop following the changes of [logs]."""
+        if self._extended in logs.listeners:
+            logs.listeners.remove(self._extended)
+
+    def _extended(self, log: LogEntry, previous_end: datetime):
+        if previous_end <= log.end:
+            self._fold(self.live, log, max(previous_end, self.until), log.end)
+        else:
+            self._fold(self.live, log, max(log.end, self.until), previous_end, -1)
+
+        # The previous days are complete
+        today = start_of_day(log.end)
+        if today > self.until:
+            for day in [d for d in self.live if d < today.date()]:
+                self.days[day] = dict(self.live.pop(day))
+            self.until = today
+            self.save()
+
+    def day(self, day: date) -> DayTotals:
+        """Return the total seconds of each category in [day].
+
+        For the current day, the dict is updated as the logs are."""
+        if day in self.days:
+            return self.days[day]
+        return self.live[day]
@@ -0,0 +1,172 @@
+"""
+This module defines the rule engine, that categorizes logs
+with the rules of a .yatta file instead of Python code.
+
+A rules file looks like this:
+
+    # Lines starting with a hash are ignored
+    CODE:
+        python
+     r  \\d{4}-q3.yaml
+    CHAT:
+        telegram
+
+Categories start with no space, and refer to the uppercase Category
+variables of the config. Rules start with at least one space, and are
+either a substring, matched case-insensitively, or a regex prefixed by
+r (case-insensitive) or R (case-sensitive). Rules are tried on the
+window name, and the first rule that matches, in file order, wins.
+
+All substrings are compiled into one Aho-Corasick automaton and all
+regexes into one alternation, so that finding the first rule that
+matches takes a single pass over the name, whatever the number of rules.
+"""
+
+import re
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from src.core import Category, LogEntry, UNCAT
+
+__all__ = ["RuleEngine", "parse_rules"]
+
+Rule = Union[str, re.Pattern]
+
+
+def parse_rules(text: str, categories: Dict[str, Category]) -> List[Tuple[Category, Rule]]:
+    """Return the rules of a .yatta file, in order.
+
+    Substrings are casefolded, and regexes are compiled."""
+
+    rules = []
+    last_cat = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("#") or not stripped:
+            continue
+
+        if line.startswith(" "):  # rule
+            assert last_cat, "The rule is not in a category"
+
+            # find if there is a type
+            t, _, rule = stripped.partition(" ")
+            rule = rule.strip()
+            if t.lower() in ("r", "e"):
+                flags = 0 if t.isupper() else re.IGNORECASE
+                rules.append((last_cat, re.compile(rule, flags)))
+            else:
+                rules.append((last_cat, stripped.casefold()))
+        else:  # Category
+            name = stripped.strip(":")
+            try:
+                last_cat = categories[name]
+            except KeyError:
+                raise KeyError(f"Unknown category {name} in the rules.") from None
+
+    return rules
+
+
+class _Automaton:
+    """Aho-Corasick automaton that finds the smallest id of the patterns in a text."""
+
+    def __init__(self, patterns: List[Tuple[str, int]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        # Smallest id of a pattern ending at each state, fail links included
+        self.best: List[float] = [float("inf")]
+
+        for pattern, id_ in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.best.append(float("inf"))
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.best[state] = min(self.best[state], id_)
+
+        # Breadth first, so that fail links point to states already done.
+        # Missing transitions are filled from the fail links, so that the
+        # search follows exactly one transition per character.
+        fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                fail[child] = self.goto[fail[state]].get(char, 0) if state else 0
+                self.best[child] = min(self.best[child], self.best[fail[child]])
+                queue.append(child)
+            if state:
+                for char, target in self.goto[fail[state]].items():
+                    self.goto[state].setdefault(char, target)
+
+    def search(self, text: str) -> float:
+        """Return the smallest id of a pattern in [text], or inf."""
+        goto, best = self.goto, self.best
+        found = float("inf")
+        state = 0
+        for char in text:
+            state = goto[state].get(char, 0)
+            if best[state] < found:
+                found = best[state]
+        return found
+
+
+class RuleEngine:
+    """Categorize logs with a list of rules.
+
+    The engine is callable, so it can be used as the categorize function of a config."""
+
+    def __init__(self, rules: List[Tuple[Category, Rule]], default: Category = UNCAT, source=""):
+        self.rules = rules
+        self.default = default
+        # The text of the rules, part of the version of the config
+        self.source = source
+
+        self._substrings = _Automaton([(r, i) for i, (_, r) in enumerate(rules) if isinstance(r, str)])
+        self._regexes = [(i, r) for i, (_, r) in enumerate(rules) if isinstance(r, re.Pattern)]
+        try:
+            if any(re.search(r"\\\d|\(\?P=", r.pattern) for _, r in self._regexes):
+                raise re.error("Backreferences would change meaning")
+            # Scoped flags, so that every regex keeps its own case sensitivity
+            self._any_regex = re.compile("|".join(
+                f"(?{'i' if r.flags & re.IGNORECASE else '-i'}:{r.pattern})" for _, r in self._regexes
+            )) if self._regexes else None
+        except re.error:
+            # Some regex cannot be embedded, like one with global flags
+            self._any_regex = re.compile("")
+
+    @classmethod
+    def load(cls, path, categories: Dict[str, Category], default: Category = UNCAT) -> "RuleEngine":
+        """Load the rules of a .yatta file.
+
+        [categories] maps the names used in the file to categories,
+        and can be the globals() of the config."""
+
+        categories = {k: v for k, v in categories.items() if isinstance(v, Category)}
+        text = Path(path).read_text()
+        return cls(parse_rules(text, categories), default, text)
+
+    def match(self, name: str) -> Optional[Category]:
+        """Return the category of the first rule that matches [name], or None."""
+
+        first = self._substrings.search(name.casefold())
+
+        # The alternation tells in one search whether any regex matches,
+        # which is rarely the case. Then only the regexes before the
+        # first substring that matched need to be tried, in order.
+        if self._any_regex is not None and self._any_regex.search(name):
+            for i, regex in self._regexes:
+                if i > first:
+                    break
+                if regex.search(name):
+                    first = i
+                    break
+
+        if first == float("inf"):
+            return None
+        return self.rules[first][0]
+
+    def __call__(self, log: LogEntry) -> Category:
+        cat = self.match(log.name)
+        return self.default if cat is None else cat
@@ -0,0 +1,383 @@
+"""
+This module contains the samplers, which know the focused window.
+
+Event samplers keep a long lived connection to the window manager, and
+are notified when the focus or the title of the focused window changes.
+Polling samplers run a subprocess every time they are asked,
+and are used when no event sampler is available.
+
+The window manager is detected on the first call to get_sampler,
+so that commands that do not record anything never touch it.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import warnings
+from functools import lru_cache
+from threading import Condition, Thread
+from typing import List, Optional, Tuple, Type
+
+__all__ = ["Sampler", "PollSampler", "EventSampler", "SwaySampler", "XorgSampler", "SwayPollSampler", "XorgPollSampler",
+           "BACKENDS", "detect", "get_sampler"]
+
+Window = Tuple[str, str]
+"""The class and name of a window."""
+
+
+class Sampler:
+    """Base class of the window manager backends."""
+
+    @classmethod
+    def available(cls) -> bool:
+        """Whether this backend can be used in the current session."""
+        raise NotImplementedError
+
+    def start(self) -> "Sampler":
+        return self
+
+    def window(self) -> Window:
+        """Return the class and name of the focused window."""
+        raise NotImplementedError
+
+    def wait(self, timeout: float) -> bool:
+        """Wait at most [timeout] seconds for the focused window to change
+        since the last call to window().
+
+        Returns whether the window changed. Samplers that are not notified
+        of changes return False right away."""
+        return False
+
+    async def window_async(self) -> Window:
+        """Same as window(), without blocking the event loop."""
+        return await asyncio.to_thread(self.window)
+
+    async def wait_async(self, timeout: float) -> bool:
+        """Same as wait(), without blocking the event loop.
+
+        Samplers that are not notified of changes sleep for [timeout]."""
+        await asyncio.sleep(max(timeout, 0))
+        return False
+
+    def close(self):
+        pass
+
+
+class PollSampler(Sampler):
+    """Run a shell command every time, and parse its output."""
+
+    COMMAND = ""
+
+    def window(self) -> Window:
+        return self.parse(subprocess.check_output(self.COMMAND, shell=True, text=True))
+
+    async def window_async(self) -> Window:
+        proc = await asyncio.create_subprocess_shell(self.COMMAND, stdout=subprocess.PIPE)
+        out, _ = await proc.communicate()
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, self.COMMAND, out)
+        return self.parse(out.decode())
+
+    def parse(self, output: str) -> Window:
+        raise NotImplementedError
+
+
+class SwayPollSampler(PollSampler):
+    """Ask swaymsg for the whole tree every time."""
+
+    COMMAND = "swaymsg -t get_tree | jq -r '.. | select(.type?) | select(.focused) | .name, .app_id'"
+
+    @classmethod
+    def available(cls) -> bool:
+        return shutil.which("swaymsg") is not None and subprocess.run(
+            ["swaymsg", "-t", "get_version"], capture_output=True).returncode == 0
+
+    def parse(self, output: str) -> Window:
+        a = output.splitlines()
+        return a[1], a[0]
+
+
+class XorgPollSampler(PollSampler):
+    """Ask xprop for the properties of the focused window every time."""
+
+    COMMAND = "xprop -id $(xdotool getwindowfocus) -notype WM_NAME WM_CLASS"
+
+    @classmethod
+    def available(cls) -> bool:
+        return shutil.which("xprop") is not None and subprocess.run(
+            ["xprop", "-root", "_NET_ACTIVE_WINDOW"], capture_output=True).returncode == 0
+
+    def parse(self, output: str) -> Window:
+        a = output.splitlines()
+        return a[1].partition(" = ")[2], a[0].partition(" = ")[2][1:-1]
+
+
+class EventSampler(Sampler):
+    """Keep track of the focused window in a background thread."""
+
+    def __init__(self):
+        self._window: Window = ("", "")
+        self._version = self._seen = 0
+        self._changed = Condition()
+        self._closed = False
+        self._thread = Thread(target=self._listen, daemon=True)
+
+    def start(self) -> "Sampler":
+        self._window = self._query()
+        self._thread.start()
+        return self
+
+    def window(self) -> Window:
+        """Return the class and name of the focused window."""
+        if not self._thread.is_alive() and not self._closed:
+            raise ConnectionError(f"{type(self).__name__} lost the connection to the window manager.")
+        with self._changed:
+            self._seen = self._version
+            return self._window
+
+    def wait(self, timeout: float) -> bool:
+        """Wait at most [timeout] seconds for the focused window to change
+        since the last call to window().
+
+        Returns whether the window changed."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._version != self._seen, max(timeout, 0))
+
+    async def window_async(self) -> Window:
+        # Only reads the last window the thread received
+        return self.window()
+
+    async def wait_async(self, timeout: float) -> bool:
+        return await asyncio.to_thread(self.wait, timeout)
+
+    def close(self):
+        self._closed = True
+
+    def _update(self, window: Window):
+        with self._changed:
+            if window != self._window:
+                self._window = window
+                self._version += 1
+                self._changed.notify_all()
+
+    def _query(self) -> Window:
+        """Ask the window manager for the focused window."""
+        raise NotImplementedError
+
+    def _listen(self):
+        """Call _update for every change, until the sampler is closed."""
+        raise NotImplementedError
+
+
+class SwaySampler(EventSampler):
+    """Follow the focus through the sway IPC socket, with the i3 protocol."""
+
+    MAGIC = b"i3-ipc"
+    HEADER = struct.Struct("=6sII")
+    SUBSCRIBE = 2
+    GET_TREE = 4
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path or os.environ["SWAYSOCK"]
+        self.sock = self._connect()
+
+    @classmethod
+    def available(cls) -> bool:
+        return os.path.exists(os.environ.get("SWAYSOCK", ""))
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+    def _send(self, sock, kind, payload=b""):
+        sock.sendall(self.HEADER.pack(self.MAGIC, len(payload), kind) + payload)
+
+    def _recv(self, sock):
+        header = self._recv_exactly(sock, self.HEADER.size)
+        magic, length, kind = self.HEADER.unpack(header)
+        if magic != self.MAGIC:
+            raise ConnectionError("Invalid answer from sway.")
+        return kind, json.loads(self._recv_exactly(sock, length))
+
+    @staticmethod
+    def _recv_exactly(sock, size) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Sway closed the connection.")
+            data += chunk
+        return data
+
+    @staticmethod
+    def _as_window(node) -> Window:
+        # Same output as the former `jq -r '.name, .app_id'`
+        app_id = node.get("app_id")
+        return "null" if app_id is None else app_id, node.get("name") or ""
+
+    @classmethod
+    def _focused(cls, node) -> Optional[dict]:
+        if node.get("focused"):
+            return node
+        for child in node.get("nodes", []) + node.get("floating_nodes", []):
+            focused = cls._focused(child)
+            if focused is not None:
+                return focused
+        return None
+
+    def _query(self) -> Window:
+        # The tree is requested on its own connection, so that
+        # it does not mix with the events.
+        with self._connect() as sock:
+            self._send(sock, self.GET_TREE)
+            _, tree = self._recv(sock)
+        focused = self._focused(tree)
+        return self._as_window(focused) if focused else ("", "")
+
+    def _listen(self):
+        self._send(self.sock, self.SUBSCRIBE, json.dumps(["window", "workspace"]).encode())
+        try:
+            while not self._closed:
+                kind, event = self._recv(self.sock)
+                if not kind & 0x80000000:
+                    continue  # The reply to the subscription
+
+                change = event.get("change")
+                if "container" in event:  # Window event
+                    container = event["container"]
+                    if change == "focus" or (change == "title" and container.get("focused")):
+                        self._update(self._as_window(container))
+                    elif change == "close" and container.get("focused"):
+                        self._update(("", ""))
+                elif change == "focus" and event.get("current", {}).get("focused"):
+                    # An empty workspace is focused
+                    self._update(self._as_window(event["current"]))
+        except (OSError, ValueError):
+            pass  # The thread stops, and window() reports it
+
+    def close(self):
+        super().close()
+        self.sock.close()
+
+
+class XorgSampler(EventSampler):
+    """Follow _NET_ACTIVE_WINDOW and the title of the active window through PropertyNotify events.
+
+    This needs the python-xlib package."""
+
+    def __init__(self):
+        from Xlib import X, display, error
+
+        super().__init__()
+        self.X = X
+        self.XError = error.XError
+        try:
+            self.display = display.Display()
+        except error.DisplayError as e:
+            raise ConnectionError(e)
+        self.root = self.display.screen().root
+        self.atoms = {name: self.display.intern_atom(name)
+                      for name in ("_NET_ACTIVE_WINDOW", "_NET_WM_NAME", "WM_NAME", "UTF8_STRING")}
+        self.active = None
+
+    @classmethod
+    def available(cls) -> bool:
+        try:
+            import Xlib
+        except ImportError:
+            return False
+        return bool(os.environ.get("DISPLAY"))
+
+    def _active_window(self):
+        prop = self.root.get_full_property(self.atoms["_NET_ACTIVE_WINDOW"], self.X.AnyPropertyType)
+        if not prop or not prop.value or not prop.value[0]:
+            return None
+        return self.display.create_resource_object("window", prop.value[0])
+
+    def _as_window(self, window) -> Window:
+        if window is None:
+            return "", ""
+        try:
+            prop = window.get_full_property(self.atoms["_NET_WM_NAME"], self.atoms["UTF8_STRING"])
+            if prop is None:
+                prop = window.get_full_property(self.atoms["WM_NAME"], self.X.AnyPropertyType)
+            name = prop.value if prop else b""
+            name = name.decode(errors="replace") if isinstance(name, bytes) else str(name)
+            # Same output as the former xprop call
+            klass = ", ".join(f'"{c}"' for c in window.get_wm_class() or ())
+        except self.XError:  # The window was closed
+            return "", ""
+        return klass, name
+
+    def _follow(self, window):
+        """Receive the title changes of [window] and not of the previous active window."""
+        if self.active is not None:
+            try:
+                self.active.change_attributes(event_mask=self.X.NoEventMask)
+            except self.XError:
+                pass  # It was probably closed
+        self.active = window
+        if window is not None:
+            window.change_attributes(event_mask=self.X.PropertyChangeMask)
+
+    def _query(self) -> Window:
+        self._follow(self._active_window())
+        return self._as_window(self.active)
+
+    def _listen(self):
+        self.root.change_attributes(event_mask=self.X.PropertyChangeMask)
+        while not self._closed:
+            event = self.display.next_event()
+            if event.type != self.X.PropertyNotify:
+                continue
+
+            if event.atom == self.atoms["_NET_ACTIVE_WINDOW"]:
+                self._follow(self._active_window())
+            elif event.atom not in (self.atoms["_NET_WM_NAME"], self.atoms["WM_NAME"]):
+                continue
+            self._update(self._as_window(self.active))
+
+    def close(self):
+        super().close()
+        self.display.close()
+
+
+BACKENDS: List[Type[Sampler]] = [SwaySampler, XorgSampler, SwayPollSampler, XorgPollSampler]
+"""Samplers tried in order by detect. New backends can be added here."""
+
+
+@lru_cache()
+def detect(events=True) -> Optional[Type[Sampler]]:
+    """Return the first available backend, or None.
+
+    If [events] is False, event samplers are skipped.
+    The result is cached, so the detection runs once per process."""
+
+    for backend in BACKENDS:
+        if (events or not issubclass(backend, EventSampler)) and backend.available():
+            return backend
+
+    warnings.warn("Neither sway nor xorg is detected, other window managers are not yet supported to get the active window. The gui will not show anything.")
+    return None
+
+
+def get_sampler(events=True) -> Sampler:
+    """Return a started sampler for the current window manager."""
+
+    backend = detect(events)
+    if backend is None:
+        raise NotImplementedError("This window manager is not supported.")
+
+    try:
+        return backend().start()
+    except OSError as e:
+        if not issubclass(backend, EventSampler):
+            raise
+        print(f"{backend.__name__} could not connect: {e}")
+        return get_sampler(events=False)
@@ -0,0 +1,297 @@
+"""
+This module searches logs by window name or class, without testing
+the pattern on every log.
+
+The distinct names and classes of a text log are kept in a trigram
+index, next to the log in a .names file, with the days (of the time
+index) where each of them appears. A search first finds the names that
+contain the trigrams of the pattern, tests the pattern only on them,
+and then only decodes the days where the matching names appear.
+Logs are then kept if their name is one of the matching names.
+
+Patterns are substrings, case insensitive or not, or regular
+expressions. Regular expressions are prefiltered with the literal
+substrings that all their matches contain, found with the private
+parser of the re module. If it ever changes, every name is tested.
+
+Like the time index, the name index is updated with the logs appended
+since it was saved, and rebuilt if the log was replaced.
+"""
+
+import json
+import mmap
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Union
+
+from src.core import LogEntry, Logs
+from src.index import SEPARATOR, iter_days
+from src.utils import start_of_day, to_micros
+
+__all__ = ["Pattern", "NameIndex", "matcher", "search"]
+
+FIELDS = ("name", "klass")
+
+
+@dataclass(frozen=True)
+class Pattern:
+    """A substring to search, or a regular expression if [regex]."""
+
+    text: str
+    ignore_case: bool = False
+    regex: bool = False
+
+    def __post_init__(self):
+        if self.regex:
+            re.compile(self.text)  # Raises re.error early
+
+    def matcher(self) -> Callable[[str], bool]:
+        """Return a function that tells whether a string matches."""
+        if self.regex:
+            return re.compile(self.text, re.IGNORECASE if self.ignore_case else 0).search
+        if self.ignore_case:
+            folded = self.text.casefold()
+            return lambda s: folded in s.casefold()
+        text = self.text
+        return lambda s: text in s
+
+    def literals(self) -> List[str]:
+        """Return casefolded substrings that every match contains."""
+        if not self.regex:
+            return [self.text.casefold()]
+        parse = _regex_parser()
+        if parse is None:
+            return []  # Every name is a candidate
+        try:
+            return [lit.casefold() for lit in _literals(parse(self.text))]
+        except Exception:
+            return []
+
+
+def matcher(pattern: Union[str, Pattern, None]) -> Optional[Callable[[str], bool]]:
+    """Return the matcher of a Pattern or a substring, or None if there is no pattern."""
+    if pattern is None:
+        return None
+    return (pattern if isinstance(pattern, Pattern) else Pattern(pattern)).matcher()
+
+
+@lru_cache(maxsize=None)
+def _regex_parser() -> Optional[Callable]:
+    """Return the parse function of the re module, or None if _literals cannot read its output."""
+    try:
+        from re import _parser as parser
+    except ImportError:
+        try:
+            import sre_parse as parser  # Before Python 3.11
+        except ImportError:
+            return None
+    # The parser is private, so check that _literals still understands it
+    checks = {"ab(cd)+e?f[gh]": ["ab", "cd", "f"], "ab|cd": []}
+    try:
+        if all(_literals(parser.parse(regex)) == literals for regex, literals in checks.items()):
+            return parser.parse
+    except Exception:
+        pass
+    return None
+
+
+def _literals(parsed) -> List[str]:
+    """Return the runs of literal characters that a parsed regex always matches."""
+
+    literals = []
+    run = ""
+    for op, arg in parsed:
+        name = str(op)
+        if name == "LITERAL":
+            run += chr(arg)
+            continue
+        literals.append(run)
+        run = ""
+        if name == "SUBPATTERN":
+            literals += _literals(arg[3])
+        elif name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT") and arg[0] >= 1:
+            literals += _literals(arg[2])
+    literals.append(run)
+    return [lit for lit in literals if lit]
+
+
+def trigrams(text: str) -> Set[str]:
+    """Return the casefolded trigrams of [text]."""
+    text = text.casefold()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NameIndex:
+    """Days where each name and class of a text log appears, and the trigrams of the names and classes."""
+
+    def __init__(self, file: Path):
+        self.file = Path(file)
+        self.inode = 0
+        # Position after the last log whose class and name were indexed
+        self.scanned = 0
+        self.strings: List[str] = []
+        # For each field and string, the days where it appears, as in TimeIndex.days
+        self.days: Dict[str, List[Set[int]]] = {field: [] for field in FIELDS}
+        self.trigrams: Dict[str, Set[int]] = {}
+        self._ids: Dict[str, int] = {}
+        self._last_day: Optional[int] = None
+
+    @property
+    def path(self) -> Path:
+        return self.file.with_name(self.file.name + ".names")
+
+    @classmethod
+    def open(cls, file: Path) -> "NameIndex":
+        """Load the index of [file], and bring it up to date."""
+
+        index = cls(file)
+        try:
+            data = json.loads(index.path.read_text())
+            index.inode, index.scanned, index._last_day = data["inode"], data["scanned"], data["last_day"]
+            index.strings = data["strings"]
+            index.days = {field: [set(days) for days in data["days"][field]] for field in FIELDS}
+            index.trigrams = {gram: set(ids) for gram, ids in data["trigrams"].items()}
+            index._ids = {s: i for i, s in enumerate(index.strings)}
+        except (OSError, ValueError, KeyError):
+            index = cls(file)
+
+        if index.update():
+            index.save()
+        return index
+
+    def save(self):
+        data = {
+            "inode": self.inode,
+            "scanned": self.scanned,
+            "last_day": self._last_day,
+            "strings": self.strings,
+            "days": {field: [sorted(days) for days in self.days[field]] for field in FIELDS},
+            "trigrams": {gram: sorted(ids) for gram, ids in self.trigrams.items()},
+        }
+        try:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(data))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # Read only directory, we will rebuild it next time
+
+    def update(self) -> bool:
+        """Index the logs appended since the last update.
+
+        The index is rebuilt from scratch if the file was replaced.
+        Returns whether anything changed."""
+
+        stat = self.file.stat()
+        if stat.st_ino != self.inode or stat.st_size < self.scanned:
+            self.__init__(self.file)
+            self.inode = stat.st_ino
+            if not stat.st_size:
+                return True
+        elif stat.st_size == self.scanned:
+            return False
+
+        with open(self.file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            self._scan(mm)
+        return True
+
+    def _id(self, string: str) -> int:
+        i = self._ids.get(string)
+        if i is None:
+            i = self._ids[string] = len(self.strings)
+            self.strings.append(string)
+            for field in FIELDS:
+                self.days[field].append(set())
+            for gram in trigrams(string):
+                self.trigrams.setdefault(gram, set()).add(i)
+        return i
+
+    def _scan(self, mm):
+        # The day of a log is the one of the time index: logs that go back
+        # in time are in the day of the log before them
+        last_day = self._last_day
+        last_hour = None
+        names, classes = self.days["name"], self.days["klass"]
+        ids: Dict[bytes, int] = {}
+        pos = mm.find(SEPARATOR, self.scanned)
+        while pos >= 0:
+            start_line = pos + len(SEPARATOR)
+            class_line = mm.find(b"\n", start_line) + 1
+            name_line = mm.find(b"\n", class_line) + 1 if class_line else 0
+            line_end = mm.find(b"\n", name_line) if name_line else -1
+            if line_end < 0:
+                break  # The log is being written
+
+            hour = mm[start_line:start_line + 13]
+            if hour != last_hour:
+                last_hour = hour
+                start = datetime.fromisoformat(mm[start_line:class_line - 1].decode())
+                day = to_micros(start_of_day(start))
+                if last_day is None or day > last_day:
+                    last_day = day
+
+            klass = mm[class_line:name_line - 1]
+            name = mm[name_line:line_end]
+            for field_days, value in ((classes, klass), (names, name)):
+                i = ids.get(value)
+                if i is None:
+                    i = ids[value] = self._id(value.decode())
+                field_days[i].add(last_day)
+
+            self.scanned = line_end + 1
+            pos = mm.find(SEPARATOR, self.scanned)
+        self._last_day = last_day
+
+    def search(self, pattern: Pattern, field="name") -> Set[str]:
+        """Return the names, or classes, that match [pattern]."""
+
+        candidates: Optional[Set[int]] = None
+        for literal in pattern.literals():
+            for gram in trigrams(literal):
+                ids = self.trigrams.get(gram, set())
+                candidates = ids if candidates is None else candidates & ids
+        if candidates is None:
+            # No trigram in the pattern, every string is a candidate
+            candidates = range(len(self.strings))
+
+        match = pattern.matcher()
+        days = self.days[field]
+        return {self.strings[i] for i in candidates if days[i] and match(self.strings[i])}
+
+    def days_of(self, strings: Iterable[str], field="name") -> List[int]:
+        """Return the days where any of [strings] appears, as in TimeIndex.days."""
+        days = set()
+        for string in strings:
+            i = self._ids.get(string)
+            if i is not None:
+                days |= self.days[field][i]
+        return sorted(days)
+
+
+def search(logfile: Path, pattern: Pattern, start: Optional[datetime] = None,
+           end: Optional[datetime] = None) -> Iterator[LogEntry]:
+    """Yield the logs of [logfile] whose name matches [pattern], and that may overlap [start, end].
+
+    Text logs and segmented logs are searched with their name index,
+    binary stores by testing each log."""
+
+    if logfile.is_dir():
+        from src.segments import SegmentedLog
+        if not SegmentedLog.is_segmented(logfile):
+            match = pattern.matcher()
+            yield from (log for log in Logs.stream(logfile, start, end) if match(log.name))
+            return
+        files = [path for path in SegmentedLog.open(logfile).overlapping(start, end) if path.exists()]
+    else:
+        files = [logfile]
+
+    for file in files:
+        index = NameIndex.open(file)
+        names = index.search(pattern)
+        if names:
+            for log in iter_days(file, index.days_of(names), start, end):
+                if log.name in names:
+                    yield log
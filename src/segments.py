@@ -0,0 +1,207 @@
+"""
+This module defines segmented logs: a text log split into one file
+per day or per month, in a directory with a manifest.
+
+    manifest.json   {"period": "day" or "month",
+                     "segments": {name: {"start", "end", "count", "checksum"}}}
+    2024-01.log     a text log, with its own time index
+
+A log goes in the segment of the day or month it starts in, with days
+starting at 4am like everywhere else. When the writer moves on to the
+next segment, the previous one is sealed: its end, its number of logs
+and the blake2b checksum of its bytes are stored in the manifest.
+The segment that is still written only has a start. Readers only open
+the segments whose bounds overlap the range they read.
+
+A segmented log is used like a text log, with --logfile DIRECTORY.
+"""
+
+import json
+import os
+from datetime import datetime
+from hashlib import blake2b
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from src.core import LogEntry, Logs, LogWriter
+from src.store import month_key
+from src.utils import start_of_day, to_micros
+
+__all__ = ["SegmentedLog", "SegmentWriter", "PERIODS", "split"]
+
+PERIODS = {
+    "day": lambda date: start_of_day(date).date().isoformat(),
+    "month": lambda date: month_key(start_of_day(date)),
+}
+
+
+class SegmentedLog:
+    """A directory of text log segments, one per day or month."""
+
+    MANIFEST = "manifest.json"
+    SUFFIX = ".log"
+
+    def __init__(self, directory: Path, period="month"):
+        assert period in PERIODS, period
+        self.directory = Path(directory)
+        self.period = period
+        # name -> {"start", and once sealed "end", "count", "checksum"}
+        self.segments: Dict[str, dict] = {}
+
+    @classmethod
+    def is_segmented(cls, path) -> bool:
+        return (Path(path) / cls.MANIFEST).exists()
+
+    @classmethod
+    def open(cls, directory: Path) -> "SegmentedLog":
+        data = json.loads((Path(directory) / cls.MANIFEST).read_text())
+        log = cls(directory, data["period"])
+        log.segments = dict(sorted(data["segments"].items()))
+        return log
+
+    @classmethod
+    def create(cls, directory: Path, period="month") -> "SegmentedLog":
+        log = cls(directory, period)
+        log.directory.mkdir(parents=True, exist_ok=True)
+        log.save()
+        return log
+
+    def save(self):
+        data = {"period": self.period, "segments": self.segments}
+        tmp = self.directory / (self.MANIFEST + ".tmp")
+        tmp.write_text(json.dumps(data, indent=1))
+        os.replace(tmp, self.directory / self.MANIFEST)
+
+    def name(self, date: datetime) -> str:
+        """Return the name of the segment of the logs that start at [date]."""
+        return PERIODS[self.period](date)
+
+    def path(self, name: str) -> Path:
+        return self.directory / (name + self.SUFFIX)
+
+    def overlapping(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Path]:
+        """Return the segments that may contain logs overlapping [start, end]."""
+
+        first = to_micros(start) if start is not None else None
+        last = to_micros(end) if end is not None else None
+        return [self.path(name) for name, seg in self.segments.items()
+                if (last is None or seg["start"] <= last)
+                and (first is None or seg.get("end") is None or seg["end"] >= first)]
+
+    def stream(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[LogEntry]:
+        """Yield the logs that may overlap [start, end], decoding only the segments that do."""
+        from src.index import iter_range
+        for path in self.overlapping(start, end):
+            if path.exists():
+                yield from iter_range(path, start, end)
+
+    def load(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Logs:
+        return Logs(self.stream(start, end), file=self.directory)
+
+    def add(self, name: str, start: int):
+        """Start a segment, whose first log starts at [start] microseconds."""
+        self.segments[name] = {"start": start}
+        self.segments = dict(sorted(self.segments.items()))
+        self.save()
+
+    def _summary(self, name: str) -> dict:
+        path = self.path(name)
+        count = end = 0
+        for log in Logs.stream(path):
+            count += 1
+            end = max(end, log.end_us)
+        checksum = blake2b(path.read_bytes(), digest_size=16).hexdigest()
+        return {"end": end, "count": count, "checksum": checksum}
+
+    def seal(self, name: str):
+        """Store the end, the number of logs and the checksum of a segment that is complete."""
+        if self.path(name).exists():
+            self.segments[name].update(self._summary(name))
+            self.save()
+
+    def unseal(self, name: str):
+        """Forget the end of a segment that is written again."""
+        self.segments[name] = {"start": self.segments[name]["start"]}
+        self.save()
+
+    def check(self, name: str) -> Optional[bool]:
+        """Whether the segment is the one described by the manifest, or None if it is not sealed."""
+        seg = self.segments[name]
+        if "checksum" not in seg:
+            return None
+        path = self.path(name)
+        return path.exists() and blake2b(path.read_bytes(), digest_size=16).hexdigest() == seg["checksum"]
+
+
+class SegmentWriter:
+    """Append logs to a segmented log, moving to a new segment when a
+    log starts in the next day or month.
+
+    It works like a LogWriter, and holds the lock of the whole directory."""
+
+    def __init__(self, directory: Path, flush_every=10.0, flush_lines=64, fsync=False):
+        self.log = SegmentedLog.open(directory)
+        self.options = (flush_every, flush_lines, fsync)
+        self.segment: Optional[str] = None
+        self.writer: Optional[LogWriter] = None
+        self._lock = LogWriter.acquire(self.log.directory)
+
+    @property
+    def current(self) -> Optional[LogEntry]:
+        return self.writer.current if self.writer is not None else None
+
+    def write(self, log: LogEntry):
+        """Start a new log, in a new segment if needed, and end the current one."""
+        name = self.log.name(log.start)
+        if name != self.segment:
+            self._rotate(name, log)
+        self.writer.write(log)
+
+    def _rotate(self, name: str, log: LogEntry):
+        if self.writer is not None:
+            self.writer.close()
+        # Seal the previous segment, and those left open if yatta was killed
+        for other, seg in self.log.segments.items():
+            if other != name and "checksum" not in seg:
+                LogWriter(self.log.path(other), *self.options, lock=False).close()  # Ends its last log
+                self.log.seal(other)
+
+        if name not in self.log.segments:
+            self.log.add(name, log.start_us)
+        elif "checksum" in self.log.segments[name]:
+            self.log.unseal(name)  # The clock went back
+        self.segment = name
+        self.writer = LogWriter(self.log.path(name), *self.options, lock=False)
+
+    def tick(self):
+        if self.writer is not None:
+            self.writer.tick()
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.segment = None
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+
+def split(logs: Iterator[LogEntry], directory: Path, period="month") -> SegmentedLog:
+    """Write [logs] to a new segmented log at [directory].
+
+    All the segments but the last one are sealed, since the recording
+    can go on in the last one."""
+
+    SegmentedLog.create(directory, period)
+    writer = SegmentWriter(directory, float("inf"), 4096)
+    try:
+        for log in logs:
+            writer.write(log)
+    finally:
+        writer.close()
+    return writer.log
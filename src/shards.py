@@ -0,0 +1,195 @@
+"""
+This module cuts the logs into shards and processes them, possibly in
+several processes.
+
+Shards are the days of a text log, found with its time index, the days
+of each file of a segmented log, or the monthly files of a binary
+store. A shard is described by its source, the path and byte range to
+read, so that worker processes read the logs themselves and only send
+back small results. Each worker loads the config with Context.load,
+since categorize functions are not picklable.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, Union
+
+from src.context import Context
+from src.core import AFK, LogEntry
+from src.index import TimeIndex
+from src.search import Pattern
+from src.segments import SegmentedLog
+from src.store import SUFFIX, BinaryStore, decode, month_key
+from src.utils import start_of_day, to_micros
+
+__all__ = ["Source", "Segment", "segments", "read_source", "load_source", "run", "imap", "segment_totals", "categories"]
+
+Source = Tuple[str, int, Optional[int]]
+"""The path of a file and the range of bytes of a shard. None is the end of the file."""
+
+Segment = Tuple[Source, bool]
+"""The source of a shard, and whether it is the last one, that is still written."""
+
+T = TypeVar("T")
+
+
+def text_segments(file: Path, start: datetime, end: datetime) -> Iterator[Segment]:
+    """Yield the days of a text log that may overlap [start, end]."""
+
+    index = TimeIndex.open(file)
+    days = index.days
+    first = to_micros(start_of_day(start)) if start > datetime.min else days[0] if days else 0
+    last = to_micros(start_of_day(end)) if end < datetime.max else days[-1] if days else 0
+
+    for i, day in enumerate(days):
+        # The last log of the day before may overlap start
+        if i + 1 < len(days) and days[i + 1] < first or day > last:
+            continue
+        is_last = i + 1 == len(days)
+        yield (str(file), index.offsets[i], None if is_last else index.offsets[i + 1]), is_last
+
+
+def store_segments(directory: Path, start: datetime, end: datetime) -> Iterator[Segment]:
+    """Yield the months of a binary store that may overlap [start, end]."""
+
+    segments = list(BinaryStore(directory).segments().items())
+    first = month_key(start) if start > datetime.min else ""
+    last = month_key(end) if end < datetime.max else "~"
+    for i, (month, path) in enumerate(segments):
+        next_month = segments[i + 1][0] if i + 1 < len(segments) else "~"
+        if next_month < first or month > last:
+            continue
+        yield (str(path), 0, None), i + 1 == len(segments)
+
+
+def segmented_segments(directory: Path, start: datetime, end: datetime) -> Iterator[Segment]:
+    """Yield the days of the segments of a segmented log that may overlap [start, end]."""
+
+    paths = SegmentedLog.open(directory).overlapping(start, end)
+    for i, path in enumerate(paths):
+        if path.exists():
+            for source, is_last in text_segments(path, start, end):
+                yield source, is_last and i + 1 == len(paths)
+
+
+def segments(logfile: Path, start=datetime.min, end=datetime.max) -> Iterator[Segment]:
+    """Yield the shards of [logfile] that may overlap [start, end]."""
+    if SegmentedLog.is_segmented(logfile):
+        return segmented_segments(logfile, start, end)
+    if BinaryStore.is_store(logfile):
+        return store_segments(logfile, start, end)
+    return text_segments(logfile, start, end)
+
+
+def read_source(source: Source) -> bytes:
+    """Return the bytes of a shard."""
+    path, first, last = source
+    with open(path, "rb") as f:
+        f.seek(first)
+        return f.read() if last is None else f.read(last - first)
+
+
+def load_source(source: Source, data: Optional[bytes] = None) -> List[LogEntry]:
+    """Decode the logs of a shard. [data] are its bytes, if they were already read."""
+
+    if data is None:
+        data = read_source(source)
+    if source[0].endswith(SUFFIX):
+        return decode(data)
+    return [LogEntry.from_logfile(lines) for lines in data.decode().split("---\n") if lines]
+
+
+# The context of a worker process
+_ctx: Optional[Context] = None
+
+
+def _init_worker(config: str):
+    global _ctx
+    _ctx = Context.load(config)
+
+
+def _call(func, item):
+    return func(_ctx, item)
+
+
+def run(ctx: Context, func: Callable[[Context, T], object], items: List[T], jobs=1) -> list:
+    """Return [func(ctx, item) for item in items], computed by [jobs] processes.
+
+    [func] must be picklable, like a function of a module or a partial of one.
+    In the workers, ctx is loaded again from its path."""
+
+    if jobs == 1 or len(items) <= 1:
+        return [func(ctx, item) for item in items]
+
+    jobs = min(jobs, len(items))
+    # A few chunks per worker, to balance short and long days
+    chunksize = max(1, len(items) // (4 * jobs))
+    with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(str(ctx.path),)) as pool:
+        return list(pool.map(partial(_call, func), items, chunksize=chunksize))
+
+
+def imap(ctx: Context, func: Callable[[Context, T], object], items: List[T], jobs=1) -> Iterator:
+    """Yield func(ctx, item) for each item, in order, computed by [jobs] processes.
+
+    Unlike run, only a few items per process are computed ahead of the
+    one that is yielded, so results do not pile up in memory."""
+
+    if jobs == 1 or len(items) <= 1:
+        for item in items:
+            yield func(ctx, item)
+        return
+
+    jobs = min(jobs, len(items))
+    with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(str(ctx.path),)) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(_call, func, item))
+            if len(pending) >= 4 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def segment_totals(ctx: Context, item: Tuple[Source, Optional[bytes]], start: datetime, end: datetime,
+                   filters: Tuple[Union[str, Pattern, None], Optional[str], bool]) -> dict:
+    """Return the totals of each day and category of the logs of a shard,
+    clamped to [start, end] and filtered like `yatta query`.
+
+    The result can be sent between processes and stored as json:
+    {"start", "end": microseconds of the first start and last end,
+     "first", "last", "count": the same for the matching logs, and how many,
+     "days": {iso day: {category name: seconds}}, "colors": {category name: color}}"""
+
+    logs = load_source(*item)
+    if not logs:
+        return {"start": 0, "end": 0, "first": 0, "last": 0, "count": 0, "days": {}, "colors": {}}
+
+    pattern, category, keep_afk = filters
+    span = {"start": logs[0].start_us, "end": max(log.end_us for log in logs)}
+
+    logs = ctx.filter_time(logs, start, end, True)
+    if pattern:
+        logs = ctx.filter_pattern(logs, pattern)
+    if category:
+        logs = ctx.filter_category(logs, category)
+    if not keep_afk:
+        logs = ctx.exclude_categories(logs, AFK)
+    logs = list(logs)
+    if logs:
+        span.update(first=logs[0].start_us, last=logs[-1].end_us, count=len(logs))
+    else:
+        span.update(first=0, last=0, count=0)
+
+    days = ctx.group_totals(logs, "DC")
+    colors = {cat.name: cat.color for cats in days.values() for cat in cats}
+    return dict(span,
+                days={day.isoformat(): {cat.name: secs for cat, secs in cats.items()} for day, cats in days.items()},
+                colors=colors)
+
+
+def categories(ctx: Context, item: Tuple[Source, Optional[bytes]]) -> Dict[str, int]:
+    """Return the name and color of the categories of the logs of a shard."""
+    return {cat.name: cat.color for cat in {ctx.get_cat(log) for log in load_source(*item)}}
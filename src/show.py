@@ -2,13 +2,12 @@
 This module contains all function to show logs in a meaning full way,
 after they have been processed.
 """
-from collections import defaultdict
 from datetime import date, datetime
 from enum import Enum
 from itertools import groupby
 from math import ceil
 from operator import itemgetter
-from typing import List
+from typing import Dict, List, Tuple
 
 from src.context import Context
 from src.core import Category, LogEntry, HOUR, MIN, DAY, AFK
@@ -79,13 +78,26 @@ def show_total(categ: dict, category=None, **ignored):
     print("Total:", sec2str(total), "• average:", sec2str(total / len(lines)))
 
 
+def group_logs(logs, groups=None) -> Dict[Tuple[str, str], float]:
+    """Return the total duration of the logs of each name and class.
+
+    The logs can be a stream, only the totals are kept.
+    If [groups] is given, the totals are added to it."""
+
+    groups = {} if groups is None else groups
+    for log in logs:
+        key = log.name, log.klass
+        groups[key] = groups.get(key, 0) + log.duration
+    return groups
+
+
 def print_group_logs(logs, only_total=False, **ignored):
     """Print logs with idientical names/class grouped together."""
+    print_groups(group_logs(logs), only_total)
 
-    groups = defaultdict(int)
 
-    for log in logs:
-        groups[log.name, log.klass] += log.duration
+def print_groups(groups: Dict[Tuple[str, str], float], only_total=False):
+    """Print the durations returned by group_logs."""
 
     if not only_total:
         for (n, cl), dur in sorted(groups.items(), key=itemgetter(1)):
@@ -134,6 +146,49 @@ def print_time_line(ctx, grouped, **options):
     print_labels(start(0), end(0), **options)
 
 
+def rasterize(ctx: Context, logs: List[LogEntry], start: datetime, end: datetime, width: int,
+              min_sec_to_show=10) -> List[Category]:
+    """Return the category with the most time in each of [width] columns between start and end.
+
+    Columns with less than [min_sec_to_show] seconds of non-AFK time are AFK.
+    Each log is visited once and only adds its time to the columns it
+    covers, so this is O(len(logs) + width)."""
+
+    total = (end - start).total_seconds()
+    step = total / width
+
+    # First pass: categories and position of each log
+    codes = {}
+    spans = []
+    for log in logs:
+        a = max((log.start - start).total_seconds(), 0)
+        b = min((log.end - start).total_seconds(), total)
+        if a < b:
+            spans.append((a, b, codes.setdefault(ctx.get_cat(log), len(codes))))
+
+    # Second pass: seconds of each category in each column
+    secs = [[0.0] * len(codes) for _ in range(width)]
+    for a, b, code in spans:
+        first = int(a // step)
+        last = min(int(b // step), width - 1)
+        if first == last:
+            secs[first][code] += b - a
+            continue
+        secs[first][code] += (first + 1) * step - a
+        for column in range(first + 1, last):
+            secs[column][code] += step
+        secs[last][code] += b - last * step
+
+    categories = list(codes)
+    afk = codes.get(AFK)
+    cats = [AFK] * width
+    for i, column in enumerate(secs):
+        best = max((c for c in range(len(column)) if c != afk), key=column.__getitem__, default=None)
+        if best is not None and column[best] > min_sec_to_show:
+            cats[i] = categories[best]
+    return cats
+
+
 def print_one_time_line(ctx: Context, logs: List[LogEntry], start=None, end=None, width=190,
                         min_sec_to_show=10, **ignored):
     """Print all logs in a timeline form."""
@@ -142,21 +197,9 @@ def print_one_time_line(ctx: Context, logs: List[LogEntry], start=None, end=None
         start = logs[0].start
     if end is None:
         end = logs[-1].end
-    duration = end - start
 
     # Finding which category was the most at that time
-    one_step = duration / width
-    cats = [AFK] * width
-    for i in range(width):
-        pos = start + i * one_step
-        ls = [c for log in logs if (c := log.intersected(pos, pos + one_step)) is not None]
-        if ls:
-            groups = ctx.group_category(ls)
-            groups.pop(AFK, None)
-            most_cat = max(groups, key=lambda x: ctx.tot_secs(groups[x]), default=AFK)
-
-            if ctx.tot_secs(groups.get(most_cat, [])) > min_sec_to_show:
-                cats[i] = most_cat
+    cats = rasterize(ctx, logs, start, end, width, min_sec_to_show)
 
     # Print colorised categories
     groups = [(cat, len(list(group))) for cat, group in groupby(cats)]
@@ -230,7 +273,8 @@ def show_grouped(ctx, grouped: dict, kind: ViewTypes, **options):
 
     depth = 0
     g = grouped
-    while not isinstance(g, list):
+    # Leaves are lists of logs, or their total from group_totals
+    while isinstance(g, dict):
         g = next(iter((g.values())))
         depth += 1
 
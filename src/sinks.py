@@ -0,0 +1,63 @@
+"""
+This module defines the sinks that remind how long a category was
+used, for the Tracker:
+
+    tracker.add_sink(Notifier(ctx, index.totals), blocking=True)
+    tracker.add_sink(LockEnforcer(ctx, index.totals), blocking=True)
+
+They act every 15 minutes spent on a category in the day, as counted
+by a function that returns the seconds of each category between two
+times, such as DurationIndex.totals. The LockEnforcer only locks the
+screen for the categories in LOCK_EVERY_15 of the config.
+"""
+
+import os
+from datetime import date, datetime
+from typing import Callable, Dict, Tuple
+
+from src.context import Context
+from src.core import DAY, Category, LogEntry
+from src.utils import notify, start_of_day
+
+__all__ = ["Milestones", "Notifier", "LockEnforcer"]
+
+
+class Milestones:
+    """Call reached() each time the time spent on a category in a day passes a multiple of [every] seconds."""
+
+    def __init__(self, ctx: Context, durations: Callable[[datetime, datetime], Dict[Category, float]],
+                 every=15 * 60):
+        self.ctx = ctx
+        self.durations = durations
+        self.every = every
+        # Multiples of [every] already passed, for each day and category
+        self.passed: Dict[Tuple[date, Category], int] = {}
+
+    def __call__(self, log: LogEntry):
+        cat = self.ctx.get_cat(log)
+        start = start_of_day(log.start)
+        day = start.date()
+        seconds = self.durations(start, start + DAY).get(cat, 0)
+        count = int(seconds // self.every)
+        # The multiples passed before the first log we see are not reached again
+        if count > self.passed.setdefault((day, cat), count):
+            self.passed[day, cat] = count
+            self.reached(cat, seconds)
+
+    def reached(self, cat: Category, seconds: float):
+        raise NotImplementedError
+
+
+class Notifier(Milestones):
+    """Send a notification every 15 minutes spent on a category."""
+
+    def reached(self, cat: Category, seconds: float):
+        notify(f"Déjà {int(seconds) // 60}min passées sur {cat}.")
+
+
+class LockEnforcer(Milestones):
+    """Lock the screen every 15 minutes spent on a category of LOCK_EVERY_15."""
+
+    def reached(self, cat: Category, seconds: float):
+        if cat in self.ctx.lock15:
+            os.system("i3lock")
@@ -0,0 +1,243 @@
+"""
+This module implements the binary log store.
+
+Logs are stored in one file per month, in a columnar layout:
+a header, an interned string table shared by window names and classes,
+then one fixed-width column per field of LogEntry.
+
+    header   magic, version, number of entries, number of strings,
+             version of the config that computed the categories
+    strings  (n_strings + 1) uint32 offsets, then the utf-8 blob
+    start    int64 microseconds since 1970-01-01 (naive, like the logs)
+    end      int64 microseconds
+    klass    uint32 index in the string table
+    name     uint32 index in the string table
+    category uint32 index in the string table, only if the config
+             version is not zero
+
+Every column is aligned on 8 bytes, so the file can be read with a
+handful of array.frombytes calls instead of parsing text.
+
+Storing the categories means that reports on past months do not need
+to run the categorize function of the config, as long as it does not
+change. When it does, recategorize() updates the stale segments. It runs
+on demand with `yatta recategorize`, and in a background thread when
+Context.reload is given a store, as the gui does when its config is
+reloaded.
+
+Only binary stores keep categories. Text logs, which `yatta start`
+and `yatta gui` record, have no room for them, so their logs are
+categorized when they are read, with the cache of Context.get_cat.
+"""
+
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, TYPE_CHECKING
+
+from src.core import LogEntry, Logs
+
+if TYPE_CHECKING:
+    from src.context import Context
+
+MAGIC = b"YATB"
+VERSION = 2
+SUFFIX = ".ybin"
+HEADER = struct.Struct("<4sHxxII")
+CONFIG_VERSION = struct.Struct("<16s")
+NO_CONFIG = bytes(16)
+
+def month_key(date: datetime) -> str:
+    return f"{date.year:04}-{date.month:02}"
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % 8)
+
+
+def _column(typecode, values) -> bytes:
+    col = array(typecode, values)
+    if sys.byteorder == "big":
+        col.byteswap()
+    return _pad(col.tobytes())
+
+
+def _read_column(typecode, data, offset, count):
+    col = array(typecode)
+    size = count * col.itemsize
+    col.frombytes(data[offset:offset + size])
+    if sys.byteorder == "big":
+        col.byteswap()
+    return col, offset + size + (-size % 8)
+
+
+def encode(logs: Iterable[LogEntry], ctx: Optional["Context"] = None) -> bytes:
+    """Return the binary representation of the logs.
+
+    If [ctx] is given, the category of each log is stored too."""
+
+    strings: Dict[str, int] = {}
+    starts, ends, klasses, names, cats = array("q"), array("q"), array("I"), array("I"), array("I")
+    for log in logs:
+        starts.append(log.start_us)
+        ends.append(log.end_us)
+        klasses.append(strings.setdefault(log.klass, len(strings)))
+        names.append(strings.setdefault(log.name, len(strings)))
+        if ctx is not None:
+            cats.append(strings.setdefault(str(ctx.get_cat(log)), len(strings)))
+
+    blobs = [s.encode() for s in strings]
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+
+    return b"".join([
+        HEADER.pack(MAGIC, VERSION, len(starts), len(strings)),
+        CONFIG_VERSION.pack(NO_CONFIG if ctx is None else ctx.version),
+        _column("I", offsets),
+        _pad(b"".join(blobs)),
+        _column("q", starts),
+        _column("q", ends),
+        _column("I", klasses),
+        _column("I", names),
+        _column("I", cats) if ctx is not None else b"",
+    ])
+
+
+def config_version(data: bytes) -> bytes:
+    """Return the version of the config that categorized the segment."""
+    if HEADER.unpack_from(data)[1] < 2:
+        return NO_CONFIG
+    return CONFIG_VERSION.unpack_from(data, HEADER.size)[0]
+
+
+def decode(data: bytes) -> List[LogEntry]:
+    """Parse the output of encode back into a list of LogEntry."""
+
+    magic, version, count, n_strings = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a yatta binary log.")
+    if version > VERSION:
+        raise ValueError(f"Unsupported binary log version {version}.")
+
+    offset = HEADER.size
+    config = NO_CONFIG
+    if version >= 2:
+        config, = CONFIG_VERSION.unpack_from(data, offset)
+        offset += CONFIG_VERSION.size
+    offsets, offset = _read_column("I", data, offset, n_strings + 1)
+    blob = bytes(data[offset:offset + offsets[-1]])
+    offset += len(blob) + (-len(blob) % 8)
+    # Decoding each string once interns them for all the entries
+    strings = [blob[a:b].decode() for a, b in zip(offsets, offsets[1:])]
+
+    starts, offset = _read_column("q", data, offset, count)
+    ends, offset = _read_column("q", data, offset, count)
+    klasses, offset = _read_column("I", data, offset, count)
+    names, offset = _read_column("I", data, offset, count)
+    if config != NO_CONFIG:
+        cats, offset = _read_column("I", data, offset, count)
+        stored = {c: (config, strings[c]) for c in set(cats)}
+        cats = [stored[c] for c in cats]
+    else:
+        cats = [None] * count
+
+    # Entries store microseconds, like the columns
+    new = LogEntry.from_micros
+    return [new(s, strings[k], strings[n], e, c) for s, e, k, n, c in zip(starts, ends, klasses, names, cats)]
+
+
+def write_segment(path: Path, logs: Iterable[LogEntry], ctx: Optional["Context"] = None):
+    """Atomically replace the segment at [path] with the given logs."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(encode(logs, ctx))
+    os.replace(tmp, path)
+
+
+def read_segment(path: Path) -> List[LogEntry]:
+    return decode(path.read_bytes())
+
+
+class BinaryStore:
+    """A directory of monthly binary segments."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def is_store(path) -> bool:
+        from src.segments import SegmentedLog
+        return Path(path).is_dir() and not SegmentedLog.is_segmented(path)
+
+    def segments(self) -> Dict[str, Path]:
+        """Return the segment files sorted by month."""
+        return {p.stem: p for p in sorted(self.directory.glob("*" + SUFFIX))}
+
+    def load(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Logs:
+        """Load all the logs of the months that overlap [start, end].
+
+        The logs are not clamped, and the month before start is also
+        read, since its last entry may overlap start."""
+        return Logs(self.stream(start, end))
+
+    def stream(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[LogEntry]:
+        """Yield the logs of the months that overlap [start, end], one month in memory at a time."""
+
+        segments = list(self.segments().items())
+        first = month_key(start) if start is not None and start > datetime.min else ""
+        last = month_key(end) if end is not None and end < datetime.max else "~"
+
+        for i, (month, path) in enumerate(segments):
+            next_month = segments[i + 1][0] if i + 1 < len(segments) else "~"
+            if next_month < first or month > last:
+                continue
+            yield from read_segment(path)
+
+    def write(self, logs: Iterable[LogEntry], ctx: Optional["Context"] = None):
+        """Write the logs to the store, one segment per month.
+
+        Months present in the logs are entirely replaced.
+        If [ctx] is given, the categories are stored too."""
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        months: Dict[str, List[LogEntry]] = {}
+        for log in logs:
+            months.setdefault(month_key(log.start), []).append(log)
+
+        for month, month_logs in months.items():
+            write_segment(self.directory / (month + SUFFIX), month_logs, ctx)
+
+        return months
+
+    def stale(self, ctx: "Context") -> List[Path]:
+        """Return the segments whose categories were not computed by [ctx]."""
+        stale = []
+        for path in self.segments().values():
+            with open(path, "rb") as f:
+                header = f.read(HEADER.size + CONFIG_VERSION.size)
+            if config_version(header) != ctx.version:
+                stale.append(path)
+        return stale
+
+    def recategorize(self, ctx: "Context", callback=None):
+        """Store the categories given by [ctx] in every stale segment.
+
+        Segments are updated one by one, so this can be interrupted
+        and run in a background thread. [callback] is called with the
+        path of each updated segment."""
+
+        for path in self.stale(ctx):
+            write_segment(path, read_segment(path), ctx)
+            if callback:
+                callback(path)
+
+
+def convert(text_log: Path, directory: Path, ctx: Optional["Context"] = None) -> Dict[str, List[LogEntry]]:
+    """Convert a text log file into a binary store at [directory].
+
+    If [ctx] is given, the categories are stored too."""
+    return BinaryStore(directory).write(Logs.load(text_log), ctx)
@@ -0,0 +1,233 @@
+"""
+This module defines the asyncio tracker, which records the focused
+window without blocking. It is the recording loop of `yatta start`
+and of the gui, which draws the logs and reminds the time spent from
+sinks (see src.sinks):
+
+    tracker = Tracker(logs)
+    tracker.add_sink(print)
+    asyncio.run(tracker.run())
+
+or, to handle the entries yourself:
+
+    async for log in Tracker(logs):
+        ...
+
+The recording is a pipeline of stages linked by bounded queues:
+
+    sampling -> samples -> store thread -> one queue per sink -> sinks
+
+The logs are appended to the logs, which writes the file and updates
+their listeners, in a thread of their own, so that a slow disk never
+delays a sample. When the store stage falls behind, the sampling waits
+for it, so that no log is lost, and the time it waited is counted.
+Sinks are called with every log entry, each in its own task and in
+order. When a sink falls behind, its oldest logs are dropped and
+counted, since the sinks only react to the current window. The
+latency of each stage, since the sample, is measured.
+
+Ticks happen on the monotonic clock of the event loop and never drift.
+Ticks that are missed, for instance when the laptop sleeps, are counted,
+with the other health metrics of src.metrics.
+"""
+
+import asyncio
+import inspect
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import perf_counter
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple, Union
+
+from src.core import LogEntry, Logs, SEC
+from src.metrics import TrackerMetrics
+from src.samplers import Sampler, get_sampler
+
+__all__ = ["Tracker", "Ticker"]
+
+Sink = Callable[[LogEntry], Union[None, Awaitable[None]]]
+# perf_counter() of the sample and its log, or None to stop
+Item = Optional[Tuple[float, LogEntry]]
+
+
+class Ticker:
+    """Deadlines every [period] seconds of the monotonic [clock]."""
+
+    def __init__(self, period: float, clock: Callable[[], float]):
+        self.period = period
+        self.clock = clock
+        self.deadline = clock() + period
+        self.missed = 0
+
+    def remaining(self) -> float:
+        """Seconds until the current deadline."""
+        return self.deadline - self.clock()
+
+    def advance(self) -> float:
+        """Move to the next deadline, counting the ones already passed.
+
+        Returns how many seconds late the deadline was, or early if negative."""
+        late = self.clock() - self.deadline
+        missed = int(late // self.period) if late > 0 else 0
+        self.missed += missed
+        self.deadline += (missed + 1) * self.period
+        return late
+
+
+class Tracker:
+    """Sample the focused window every [time_step] seconds, and on every change."""
+
+    def __init__(self, logs: Logs, time_step=1, sampler: Optional[Sampler] = None,
+                 metrics: Optional[TrackerMetrics] = None, maxsize=64):
+        assert time_step >= 1
+        self.logs = logs
+        self.time_step = time_step
+        # Logs that can wait in each queue of the pipeline
+        self.maxsize = maxsize
+        self.sampler = sampler
+        self.metrics = metrics or TrackerMetrics()
+        self.sinks: List[Sink] = []
+        # Held by the store thread while it appends a log. Other threads hold it
+        # to read or change what the listeners of the logs keep up to date.
+        self.lock = threading.RLock()
+        self.ticker: Optional[Ticker] = None
+        self._stop = False
+
+    @property
+    def missed(self) -> int:
+        """Number of ticks without a sample."""
+        return self.ticker.missed if self.ticker else 0
+
+    def add_sink(self, sink: Sink, blocking=False):
+        """Call [sink] with every log entry.
+
+        [sink] can be a function or a coroutine function. If it may
+        block, like a subprocess call, set [blocking] to run it in a thread."""
+        if blocking:
+            func = sink
+            sink = lambda log: asyncio.to_thread(func, log)
+        self.sinks.append(sink)
+
+    def stop(self):
+        """Stop the recording, even from another thread. A stopped tracker cannot run again."""
+        self._stop = True
+
+    def _advance(self):
+        missed = self.ticker.missed
+        late = self.ticker.advance()
+        self.metrics.drift.observe(max(late, 0))
+        self.metrics.skipped += self.ticker.missed - missed
+
+    async def _sample(self) -> LogEntry:
+        self.metrics.ticks += 1
+        before = perf_counter()
+        wm_class, wm_name = await self.sampler.window_async()
+        self.metrics.sample.observe(perf_counter() - before)
+        start = datetime.now()
+        if self.ticker.remaining() <= 0:
+            self._advance()  # The sampler took longer than a tick
+        # The log lasts until the next tick, even when it
+        # comes from a change in the middle of a time step.
+        return LogEntry(start, wm_class, wm_name, start + SEC * self.ticker.remaining())
+
+    async def __aiter__(self) -> AsyncIterator[LogEntry]:
+        """Yield a log entry at each tick and at each change of the focused window."""
+
+        if self.sampler is None:
+            self.sampler = get_sampler()
+
+        self.ticker = Ticker(self.time_step, asyncio.get_running_loop().time)
+        try:
+            while not self._stop:
+                try:
+                    log = await self._sample()
+                except subprocess.CalledProcessError as e:
+                    self.metrics.errors += 1
+                    print(e)
+                except ConnectionError as e:
+                    self.metrics.errors += 1
+                    print(e, "Falling back to subprocesses.")
+                    self.sampler.close()
+                    self.sampler = get_sampler(events=False)
+                else:
+                    yield log
+
+                remaining = self.ticker.remaining()
+                if remaining > 0 and await self.sampler.wait_async(remaining):
+                    continue  # The focus changed, log it right away
+                self._advance()
+        finally:
+            self.sampler.close()
+
+    async def run(self):
+        """Store the log entries in the logs and give them to the sinks, until stop() is called."""
+
+        samples: "asyncio.Queue[Item]" = asyncio.Queue(self.maxsize)
+        queues: "List[asyncio.Queue[Item]]" = [asyncio.Queue(self.maxsize) for _ in self.sinks]
+        drains = [asyncio.create_task(self._drain(sink, queue)) for sink, queue in zip(self.sinks, queues)]
+        store = asyncio.create_task(self._store(samples, queues))
+        try:
+            async for log in self:
+                item = perf_counter(), log
+                if samples.full():
+                    # Backpressure: wait for the store stage rather than lose the log
+                    await samples.put(item)
+                    self.metrics.blocked += perf_counter() - item[0]
+                else:
+                    samples.put_nowait(item)
+                self.metrics.backlog = max(self.metrics.backlog, samples.qsize())
+        finally:
+            await samples.put(None)
+            try:
+                await store
+            finally:
+                await asyncio.gather(*drains)
+
+    async def _store(self, samples: "asyncio.Queue[Item]", queues: "List[asyncio.Queue[Item]]"):
+        """Append the sampled logs to the logs in a thread, then queue them for the sinks."""
+
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(1, thread_name_prefix="yatta-store") as executor:
+            try:
+                while (item := await samples.get()) is not None:
+                    await loop.run_in_executor(executor, self._append, item[1])
+                    self.metrics.store.observe(perf_counter() - item[0])
+                    for queue in queues:
+                        self._offer(queue, item)
+            except Exception:
+                # Nothing can be recorded anymore, but the sampling must not wait for us
+                self.stop()
+                while await samples.get() is not None:
+                    pass
+                raise
+            finally:
+                for queue in queues:
+                    self._offer(queue, None)
+                await loop.run_in_executor(executor, self.logs.close)
+
+    def _append(self, log: LogEntry):
+        with self.lock:
+            self.metrics.append(self.logs, log)
+
+    def _offer(self, queue: "asyncio.Queue[Item]", item: Item):
+        """Queue [item] for a sink, dropping its oldest log if the sink fell behind."""
+        if queue.full():
+            queue.get_nowait()
+            self.metrics.dropped += 1
+        queue.put_nowait(item)
+
+    async def _drain(self, sink: Sink, queue: "asyncio.Queue[Item]"):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            sampled, log = item
+            try:
+                result = sink(log)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                # One sink failing must not stop the recording
+                print(f"Sink {getattr(sink, '__name__', sink)} failed:", repr(e))
+            self.metrics.sink.observe(perf_counter() - sampled)
@@ -1,11 +1,42 @@
 """
 General utility function not specific to any aspect of app tracking.
 """
+import fcntl
 import subprocess
+from collections import OrderedDict
 from datetime import timedelta, datetime
 from typing import Tuple
 
-__all__ = ["sec2str", "int_to_rgb", "contrast", "fmt", "notify", "start_of_day"]
+__all__ = ["sec2str", "int_to_rgb", "contrast", "fmt", "notify", "start_of_day", "LRUCache",
+           "EPOCH", "MICRO", "to_micros", "from_micros", "lock"]
+
+EPOCH = datetime(1970, 1, 1)
+MICRO = timedelta(microseconds=1)
+
+
+def to_micros(date: datetime) -> int:
+    """Convert a naive datetime to microseconds since EPOCH, exactly."""
+    return (date - EPOCH) // MICRO
+
+
+def from_micros(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+
+
+def lock(path):
+    """Take an exclusive lock on [path] and return the open file that holds it.
+
+    The lock is released when the file is closed, or when the process dies.
+    Raises BlockingIOError if another process holds it."""
+
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        raise
+    return f
 
 
 def start_of_day(date: datetime, start_hour=4):
@@ -86,3 +117,43 @@ def fmt(s, fg=None, bg=None, reset=True):
 
 def notify(title, msg=""):
     subprocess.call(["notify-send", title, msg, "-a", "yatta.py"])
+
+
+class LRUCache(OrderedDict):
+    """A dict that keeps only the [maxsize] most recently used items.
+
+    get() counts the hits and misses, and the items dropped are counted
+    in evictions."""
+
+    def __init__(self, maxsize=4096):
+        super().__init__()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        super().clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0
+        return (f"{self.hits} hits, {self.misses} misses ({rate:.0%}), "
+                f"{len(self)}/{self.maxsize} entries, {self.evictions} evictions")
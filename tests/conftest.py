@@ -0,0 +1,18 @@
+import pytest
+
+from src.context import Context
+from src.core import Category
+
+CODE = Category("Code", 0xffffff)
+CHAT = Category("Chat", 0xffa500)
+
+
+def categorize(log):
+    return CODE if "nvim" in log.name else CHAT
+
+
+@pytest.fixture
+def ctx():
+    """A config where the windows of nvim are CODE, and all the others CHAT."""
+    # The version has the size of the digest of a real config, like the stores keep it
+    return Context(categorize, lambda e: 0, version=b"test config v1.0", categories={"Code": CODE, "Chat": CHAT})
@@ -0,0 +1,61 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import src.arrays
+from src.arrays import LogArray
+from src.core import LogEntry
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "python"])
+def numpy(request, monkeypatch):
+    if request.param and not src.arrays.HAS_NUMPY:
+        pytest.skip("numpy is not installed")
+    monkeypatch.setattr(src.arrays, "HAS_NUMPY", request.param)
+    return request.param
+
+
+def random_logs(seed=0, count=500):
+    """Logs over a few days, some of them around 4am when days change."""
+    rng = random.Random(seed)
+    logs, t = [], datetime(2024, 2, 28, 3, 30)
+    for _ in range(count):
+        t += timedelta(minutes=rng.choice([0, 1, 10, 45]))
+        end = t + timedelta(seconds=rng.uniform(1, 600))
+        logs.append(LogEntry(t, rng.choice(["kitty", "firefox"]), rng.choice(["nvim", "Alice", "docs"]), end))
+        t = end
+    return logs
+
+
+def totals(ctx, groups):
+    """The totals of the groups of Context.group_by, one log at a time."""
+    if isinstance(groups, list):
+        return ctx.tot_secs(groups)
+    return {key: totals(ctx, group) for key, group in groups.items()}
+
+
+def approx(result):
+    if isinstance(result, dict):
+        return {key: approx(group) for key, group in result.items()}
+    return pytest.approx(result)
+
+
+@pytest.mark.parametrize("classifications", ["", "C", "D", "CD", "DC"])
+def test_same_as_group_by(ctx, numpy, classifications):
+    logs = random_logs()
+    assert ctx.group_totals(logs, classifications) == approx(totals(ctx, ctx.group_by(logs, classifications)))
+
+
+def test_days_change_at_4am(ctx, numpy):
+    day = datetime(2024, 3, 1, 4)
+    logs = [LogEntry(day - timedelta(seconds=2), "kitty", "nvim", day - timedelta(seconds=1)),
+            LogEntry(day, "kitty", "nvim", day + timedelta(seconds=3))]
+    assert LogArray(logs, ctx).totals("D") == {(day - timedelta(days=1)).date(): 1, day.date(): 3}
+
+
+def test_no_logs(ctx, numpy):
+    array = LogArray([], ctx)
+    assert (array.totals(""), array.totals("C"), array.totals("DC")) == (0, {}, {})
+    with pytest.raises(ValueError):
+        array.totals("X")
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+from src.cache import QueryCache
+from src.core import LogEntry, Logs
+from src.utils import start_of_day
+from tests.conftest import CHAT, CODE
+
+
+def write_logs(file):
+    today = start_of_day(datetime.now())
+    logs = []
+    for days in (3, 2, 1):
+        day = today - timedelta(days=days)
+        logs.append(LogEntry(day + timedelta(hours=1), "kitty", "nvim", day + timedelta(hours=2)))
+        logs.append(LogEntry(day + timedelta(hours=3), "telegram", "Alice", day + timedelta(hours=3, minutes=30)))
+    with Logs(file=file) as written:
+        for log in logs:
+            written.append(log)
+    return logs
+
+
+def test_span_of_the_matching_logs(tmp_path, ctx):
+    file = tmp_path / "log"
+    logs = write_logs(file)
+    everything = (datetime.min, datetime.max, "C")
+
+    for _ in range(2):  # Computed, then cached
+        cache = QueryCache.open(file, ctx)
+        totals, first, last, count = cache.totals(file, *everything)
+        assert totals == {CODE: 3 * 3600, CHAT: 3 * 1800}
+        assert (first, last, count) == (logs[0].start, logs[-1].end, 6)
+    # The last day is still written, so it is never cached
+    assert cache.hits == 2
+
+    _, first, last, count = QueryCache.open(file, ctx).totals(file, *everything, category="Code")
+    assert (first, last, count) == (logs[0].start, logs[-2].end, 3)
+
+
+def test_no_matching_logs(tmp_path, ctx):
+    file = tmp_path / "log"
+    write_logs(file)
+    cache = QueryCache.open(file, ctx)
+    assert cache.totals(file, datetime.min, datetime.max, "C", "nothing like this") == ({}, None, None, 0)
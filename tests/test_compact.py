@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.compact import CompactStats, TextOutput, compact, verify
+from src.core import LogEntry, Logs
+from src.shards import segments
+
+# Days, and so the shards of a text log, start at 4am
+T = datetime(2024, 3, 1, 4)
+SEC = timedelta(seconds=1)
+
+
+def write(file, logs):
+    with Logs(file=file) as written:
+        for log in logs:
+            written.append(log)
+
+
+def every_second(start, end, name, klass="kitty"):
+    """The logs that the tracker samples for one window between [start] and [end] seconds after T."""
+    return [LogEntry(T + i * SEC, klass, name, T + (i + 1) * SEC) for i in range(start, end)]
+
+
+def spans(logs):
+    return [(log.name, (log.start - T) / SEC, (log.end - T) / SEC) for log in logs]
+
+
+def test_stitches_the_shards(tmp_path, ctx):
+    file = tmp_path / "log"
+    day = 24 * 3600
+    logs = (every_second(-5, 5, "nvim")  # Over the first 4am
+            + every_second(10, 15, "docs", "firefox")
+            + every_second(day - 3, day + 2, "docs", "firefox")  # Alone in its day, and over the next 4am
+            + every_second(day + 2, 2 * day + 3, "nvim"))
+    # The file is appended to, like the tracker does, without merging
+    file.write_text("".join(f"---\n{log.start.isoformat()}\n{log.klass}\n{log.name}\n{log.end.isoformat()}\n"
+                            for log in logs))
+    assert len(list(segments(file))) == 4
+
+    stats = compact(ctx, file)
+    assert spans(Logs.load(file)) == [("nvim", -5, 5), ("docs", 10, 15), ("docs", day - 3, day + 2),
+                                      ("nvim", day + 2, 2 * day + 3)]
+    assert (stats.read, stats.written) == (len(logs), 4)
+
+
+def test_verify_rejects_other_totals(tmp_path, ctx):
+    file = tmp_path / "log"
+    write(file, every_second(0, 10, "nvim") + every_second(10, 20, "docs"))
+    stats = compact(ctx, file)
+    verify(file, stats)
+
+    for change in [dict(total=stats.total + 1), dict(written=stats.written + 1), dict(last=stats.last - 1)]:
+        wrong = CompactStats(**dict(vars(stats), **change))
+        with pytest.raises(ValueError):
+            verify(file, wrong)
+
+
+def test_failed_verify_keeps_the_log(tmp_path, ctx, monkeypatch):
+    file = tmp_path / "log"
+    day = 24 * 3600
+    write(file, every_second(0, 10, "nvim") + every_second(10, 20, "docs") + every_second(day, day + 5, "a"))
+    Logs.load(file, T, T + SEC)  # Builds the time index
+    index = tmp_path / "log.idx"
+    before = file.read_bytes(), index.read_bytes()
+
+    # An output that loses a log
+    write_log = TextOutput.write
+    monkeypatch.setattr(TextOutput, "write", lambda self, log: None if log.name == "docs" else write_log(self, log))
+    with pytest.raises(ValueError):
+        compact(ctx, file)
+
+    assert (file.read_bytes(), index.read_bytes()) == before
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["log", "log.idx", "log.lock"]
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.compact import merged
+from src.core import LogEntry, Logs
+
+T = datetime(2024, 3, 1, 12)
+SEC = timedelta(seconds=1)
+
+
+def log(start, name, duration=1, klass="kitty"):
+    """A log starting [start] seconds after T."""
+    return LogEntry(T + start * SEC, klass, name, T + (start + duration) * SEC)
+
+
+def spans(logs):
+    return [(l.name, (l.start - T) / SEC, (l.end - T) / SEC) for l in logs]
+
+
+CASES = {
+    "same window extends": (
+        [log(0, "a"), log(1, "a"), log(2, "a")],
+        [("a", 0, 3)],
+    ),
+    "small gap extends": (
+        [log(0, "a"), log(1.5, "a")],
+        [("a", 0, 2.5)],
+    ),
+    "other window cuts": (
+        # A change in the middle of a time step
+        [log(0, "a"), log(0.4, "b")],
+        [("a", 0, 0.4), ("b", 0.4, 1.4)],
+    ),
+    "other window after a gap": (
+        [log(0, "a"), log(5, "b")],
+        [("a", 0, 1), ("b", 5, 6)],
+    ),
+    "same window after a gap": (
+        [log(0, "a"), log(5, "a")],
+        [("a", 0, 1), ("a", 5, 6)],
+    ),
+    "shorter log inside": (
+        [log(0, "a", 10), log(2, "a")],
+        [("a", 0, 10)],
+    ),
+    "clock back an hour": (
+        [log(0, "a"), log(-3600, "b")],
+        [("a", 0, 1), ("b", -3600, -3599)],
+    ),
+    "clock back a little": (
+        [log(0, "a", 3), log(-0.5, "b")],
+        [("a", 0, 3), ("b", -0.5, 0.5)],
+    ),
+}
+
+
+@pytest.mark.parametrize("logs, expected", CASES.values(), ids=CASES.keys())
+def test_merge(logs, expected):
+    merged_logs = Logs()
+    for entry in logs:
+        merged_logs.merge(entry)
+    assert spans(merged_logs) == expected
+    assert all(l.duration >= 0 for l in merged_logs)
+
+
+@pytest.mark.parametrize("logs, expected", CASES.values(), ids=CASES.keys())
+def test_compact_merges_like_logs(logs, expected):
+    assert spans(merged(logs)) == expected
+
+
+def test_listeners_see_every_change():
+    logs = Logs()
+    changes = []
+    logs.listeners.append(lambda entry, previous_end: changes.append((entry.name, (previous_end - T) / SEC)))
+    for entry in [log(0, "a"), log(1, "a"), log(1.5, "b")]:
+        logs.merge(entry)
+    # Added, extended, cut, added
+    assert changes == [("a", 0), ("a", 1), ("a", 2), ("b", 1.5)]
@@ -0,0 +1,101 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.core import LogEntry, Logs
+from src.durations import DurationIndex
+from tests.conftest import CHAT, CODE
+
+T = datetime(2024, 3, 1, 12)
+SEC = timedelta(seconds=1)
+
+
+def log(start, name, duration=1):
+    return LogEntry(T + start * SEC, "kitty", name, T + (start + duration) * SEC)
+
+
+def expected(ctx, logs, start, end, category=None):
+    """The total of the logs clamped to the range, one by one."""
+    logs = ctx.filter_time(logs, start, end)
+    if category is not None:
+        logs = ctx.filter_category(logs, category.name)
+    return ctx.tot_secs(logs)
+
+
+def random_logs(seed=0, count=300):
+    rng = random.Random(seed)
+    logs, t = [], 0
+    for _ in range(count):
+        t += rng.choice([0, 0, 0.5, 3])
+        duration = rng.uniform(0.1, 20)
+        logs.append(log(t, rng.choice(["nvim", "Alice"]), duration))
+        t += duration
+    return logs
+
+
+def ranges(seed=1, count=200):
+    rng = random.Random(seed)
+    for _ in range(count):
+        a, b = sorted(rng.uniform(-10, 4000) for _ in range(2))
+        yield T + a * SEC, T + b * SEC
+
+
+def test_range_totals(ctx):
+    logs = random_logs()
+    index = DurationIndex(ctx, logs)
+    for start, end in ranges():
+        assert index.total(start, end) == pytest.approx(expected(ctx, logs, start, end))
+        totals = index.totals(start, end)
+        for cat in (CODE, CHAT):
+            assert index.total(start, end, cat) == pytest.approx(expected(ctx, logs, start, end, cat))
+            assert totals.get(cat, 0) == pytest.approx(index.total(start, end, cat))
+    assert index.total() == pytest.approx(ctx.tot_secs(logs))
+
+
+def test_logs_out_of_order(ctx):
+    logs = random_logs()
+    shuffled = logs[:]
+    random.Random(2).shuffle(shuffled)
+    index = DurationIndex(ctx, shuffled)
+    for start, end in ranges():
+        assert index.total(start, end) == pytest.approx(expected(ctx, logs, start, end))
+        assert index.total(start, end, CODE) == pytest.approx(expected(ctx, logs, start, end, CODE))
+
+
+def test_follows_the_logs(ctx):
+    logs = Logs()
+    index = DurationIndex(ctx)
+    index.track(logs)
+    # Merged, cut, after a gap, and the clock going back
+    for entry in [log(0, "nvim"), log(1, "nvim"), log(1.5, "Alice"), log(10, "Alice"), log(11, "Alice"),
+                  log(-100, "nvim", 50), log(-49, "nvim")]:
+        logs.merge(entry)
+    assert len(index) == len(logs)
+    for start, end in [(None, None), (T, T + 5 * SEC), (T - 75 * SEC, T + 10.5 * SEC)]:
+        for cat in (CODE, CHAT):
+            assert index.total(start, end, cat) == pytest.approx(
+                expected(ctx, logs, start or datetime.min, end or datetime.max, cat))
+
+    index.untrack(logs)
+    logs.merge(log(12, "Alice"))
+    assert index.total(category=CHAT) == pytest.approx(3)
+
+
+def test_clock_going_back_for_long(ctx):
+    logs = Logs()
+    index = DurationIndex(ctx)
+    index.track(logs)
+    for t in range(1000, 1100):
+        logs.merge(log(t, "nvim"))
+    # More logs out of order than the index keeps aside, some of them merged
+    for t in range(0, 3 * DurationIndex.MAX_PENDING):
+        logs.merge(log(t, "Alice" if t % 5 else "nvim", 0.5))
+        logs.merge(log(t + 0.5, "Alice" if t % 5 else "nvim", 0.5))
+    assert len(index) == len(logs)
+    assert 0 < len(index._pending) <= DurationIndex.MAX_PENDING
+    for start, end in list(ranges(count=50)) + [(None, None)]:
+        totals = index.totals(start, end)
+        for cat in (CODE, CHAT):
+            assert totals.get(cat, 0) == pytest.approx(
+                expected(ctx, logs, start or datetime.min, end or datetime.max, cat))
@@ -0,0 +1,116 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.context import Context
+from src.core import LogEntry, Logs
+from src.index import TimeIndex, load_range
+from src.utils import to_micros
+
+# Days start at 4am
+DAY = datetime(2024, 3, 1, 4)
+SEC = timedelta(seconds=1)
+LOGS = [LogEntry(start, "kitty", "nvim", start + SEC) for start in [
+    DAY - timedelta(hours=1),  # In the day of February 29
+    DAY - 2 * SEC,
+    DAY,
+    DAY + timedelta(hours=8),
+    DAY + timedelta(hours=23, minutes=30),  # March 2 at 3:30, still in the day of March 1
+    DAY + timedelta(days=1),
+    DAY + timedelta(days=3, hours=2),  # A day without logs before
+]]
+
+
+def write(file, logs):
+    with Logs(file=file) as written:
+        for log in logs:
+            written.append(log)
+
+
+def starts(file, index):
+    """The start of the log at each offset of the index."""
+    data = file.read_bytes()
+    return [datetime.fromisoformat(data[offset:].split(b"\n")[1].decode()) for offset in index.offsets]
+
+
+def test_days_and_offsets(tmp_path):
+    file = tmp_path / "log"
+    write(file, LOGS)
+    index = TimeIndex.open(file)
+    days = [DAY - timedelta(days=1), DAY, DAY + timedelta(days=1), DAY + timedelta(days=3)]
+    assert list(index.days) == [to_micros(day) for day in days]
+    assert starts(file, index) == [LOGS[0].start, LOGS[2].start, LOGS[5].start, LOGS[6].start]
+
+    # Loaded back from the .idx file
+    loaded = TimeIndex.open(file)
+    assert (loaded.days, loaded.offsets, loaded.scanned) == (index.days, index.offsets, index.scanned)
+
+
+def test_span_at_day_boundaries(tmp_path):
+    file = tmp_path / "log"
+    write(file, LOGS)
+    index = TimeIndex.open(file)
+    feb29, mar1, mar2, mar4 = index.offsets
+
+    assert index.span(None, None) == (0, None)
+    assert index.span(datetime.min, datetime.max) == (0, None)
+    assert index.span(DAY, DAY) == (mar1, mar2)
+    assert index.span(DAY - SEC, DAY) == (feb29, mar2)
+    assert index.span(DAY, DAY + timedelta(days=1) - SEC) == (mar1, mar2)
+    assert index.span(DAY, DAY + timedelta(days=1)) == (mar1, mar4)
+    # Between two days with logs
+    assert index.span(DAY + timedelta(days=2), DAY + timedelta(days=2, hours=1)) == (mar4, mar4)
+    assert index.span(DAY + timedelta(days=3), None) == (mar4, None)
+    # After the last day, nothing is left to read
+    assert index.span(DAY + timedelta(days=4), None) == (index.scanned, None)
+
+
+@pytest.mark.parametrize("start, end", [
+    (DAY, DAY),
+    (DAY - SEC, DAY + SEC),
+    (DAY - 2 * SEC, DAY - SEC),
+    (DAY + timedelta(hours=23, minutes=30, seconds=0.5), DAY + timedelta(days=1)),
+    (DAY + timedelta(days=2), DAY + timedelta(days=3)),
+    (DAY + timedelta(days=4), DAY + timedelta(days=5)),
+    (datetime.min, DAY),
+    (DAY, datetime.max),
+])
+def test_load_range(tmp_path, start, end):
+    file = tmp_path / "log"
+    write(file, LOGS)
+    loaded = list(Context.filter_time(load_range(file, start, end), start, end))
+    assert loaded == list(Context.filter_time(LOGS, start, end))
+
+
+def test_rebuilt_after_append_and_replace(tmp_path):
+    file = tmp_path / "log"
+    write(file, LOGS[:3])
+    index = TimeIndex.open(file)
+    assert len(index.days) == 2
+
+    # Appended logs are indexed, in the last day and in new days
+    write(file, LOGS[3:])
+    index = TimeIndex.open(file)
+    fresh = TimeIndex(file)
+    fresh.update()
+    assert (index.days, index.offsets, index.scanned) == (fresh.days, fresh.offsets, fresh.scanned)
+    assert starts(file, index) == [LOGS[0].start, LOGS[2].start, LOGS[5].start, LOGS[6].start]
+
+    # A log replaced by another file, as compress does, is indexed again
+    replacement = tmp_path / "replacement"
+    write(replacement, LOGS[5:])
+    os.replace(replacement, file)
+    index = TimeIndex.open(file)
+    assert starts(file, index) == [LOGS[5].start, LOGS[6].start]
+    assert list(load_range(file, DAY, DAY + timedelta(days=1))) == LOGS[5:6]
+
+    # And so is a truncated log
+    write(replacement, LOGS[6:])
+    file.write_bytes(replacement.read_bytes())
+    index = TimeIndex.open(file)
+    assert (list(index.offsets), starts(file, index)) == ([0], [LOGS[6].start])
+
+    file.write_bytes(b"")
+    assert len(TimeIndex.open(file).days) == 0
+    assert list(load_range(file)) == []
@@ -0,0 +1,96 @@
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.core import LogEntry, Logs
+from src.metrics import Histogram, MetricsExporter, TrackerMetrics, parse, quantile, read_metrics
+
+T = datetime(2024, 3, 1, 12)
+
+# A sample line of the text format: a name, optional labels, and a value
+SAMPLE = re.compile(r'[a-z_]+(\{le="[^"]+"\})? -?[0-9.e+-]+|[a-z_]+\{le="\+Inf"\} [0-9]+')
+
+
+def metrics():
+    metrics = TrackerMetrics()
+    for value in [0.0001, 0.001, 0.003, 0.003, 0.2, 30]:
+        metrics.sample.observe(value)
+    logs = Logs()
+    for start, name in [(0, "nvim"), (1, "nvim"), (5, "Alice")]:
+        metrics.append(logs, LogEntry(T + timedelta(seconds=start), "kitty", name, T + timedelta(seconds=start + 1)))
+    metrics.ticks, metrics.skipped, metrics.dropped = 10, 2, 1
+    return metrics
+
+
+def test_exposition_format():
+    text = metrics().render()
+    assert text.endswith("\n")
+
+    # Every metric has its help and type just before its samples
+    names = []
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            names.append(line.split()[2])
+        elif line.startswith("# TYPE "):
+            _, _, name, kind = line.split()
+            assert name == names[-1] and kind in ("counter", "gauge", "histogram")
+        else:
+            assert SAMPLE.fullmatch(line), line
+            assert line.split("{")[0].split()[0].startswith(names[-1]), line
+    assert len(names) == len(set(names))
+    assert {"yatta_sample_seconds", "yatta_sink_dropped_total", "yatta_merge_ratio"} <= set(names)
+    # Names end in their unit, or in _total for counters
+    assert all(name.endswith(("_total", "_seconds", "_ratio", "_max")) for name in names)
+
+
+def test_histogram_buckets():
+    histogram = Histogram("h", "A histogram.", buckets=(0.001, 0.01, 1.0))
+    for value in [0.0005, 0.001, 0.002, 0.5, 2, 3]:
+        histogram.observe(value)
+    assert histogram.render() == [
+        "# HELP h A histogram.",
+        "# TYPE h histogram",
+        'h_bucket{le="0.001"} 2',  # The bounds are included
+        'h_bucket{le="0.01"} 3',
+        'h_bucket{le="1.0"} 4',
+        'h_bucket{le="+Inf"} 6',
+        "h_sum 5.5035",
+        "h_count 6",
+    ]
+
+
+def test_parse_and_quantile():
+    samples = parse(metrics().render())
+    assert samples["yatta_ticks_total"] == 10
+    assert samples["yatta_logs_total"] == 3
+    assert samples["yatta_logs_merged_total"] == 1
+    assert samples["yatta_merge_ratio"] == pytest.approx(1 / 3)
+    assert samples['yatta_sample_seconds_bucket{le="+Inf"}'] == samples["yatta_sample_seconds_count"] == 6
+    assert samples["yatta_write_seconds_count"] == 3
+
+    assert quantile(samples, "yatta_sample_seconds", 0.3) == 0.001
+    assert quantile(samples, "yatta_sample_seconds", 0.5) == 0.005
+    assert quantile(samples, "yatta_sample_seconds", 0.8) == 0.25
+    assert quantile(samples, "yatta_sample_seconds", 1) == float("inf")
+    # A histogram without values
+    assert quantile(samples, "yatta_sink_seconds", 0.99) == 0.0005
+
+
+def test_exporter_file(tmp_path):
+    path = tmp_path / "metrics.prom"
+    exporter = MetricsExporter(metrics(), path).start()
+    exporter.metrics.ticks += 1
+    # The last metrics are written when it stops
+    exporter.stop()
+    assert parse(read_metrics(path))["yatta_ticks_total"] == 11
+
+
+def test_exporter_socket(tmp_path):
+    path = tmp_path / "metrics.sock"
+    exporter = MetricsExporter(metrics(), path).start()
+    try:
+        assert parse(read_metrics(path))["yatta_ticks_skipped_total"] == 2
+    finally:
+        exporter.stop()
+    assert not path.exists()
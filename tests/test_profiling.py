@@ -0,0 +1,21 @@
+import json
+
+import src.profiling
+from src.profiling import Profiler
+
+
+def test_spans_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.profiling, "MAX_SPANS", 10)
+    output = tmp_path / "trace.json"
+    profiler = Profiler(output=output)
+    with profiler:
+        # Like the frames of the gui
+        for _ in range(25):
+            with profiler.stage("draw"):
+                pass
+        list(profiler.iterate("numbers", range(5)))
+
+    draw = profiler.stages["draw"]
+    assert (draw.calls, len(draw.spans)) == (25, 10)
+    events = json.loads(output.read_text())["traceEvents"]
+    assert [event["tid"] for event in events if event["ph"] == "X"] == [0] + [1] * 10 + [2]
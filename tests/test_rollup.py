@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+from src.core import LogEntry, Logs
+from src.rollup import DailyRollup
+from src.store import BinaryStore
+from src.utils import start_of_day
+from tests.conftest import CHAT, CODE
+
+
+def day_logs():
+    today = start_of_day(datetime.now())
+    yesterday = today - timedelta(days=1)
+    return [
+        LogEntry(yesterday + timedelta(hours=2), "kitty", "nvim", yesterday + timedelta(hours=3)),
+        LogEntry(yesterday + timedelta(hours=5), "telegram", "Alice", yesterday + timedelta(hours=5, minutes=30)),
+    ]
+
+
+def test_saved_next_to_the_log(tmp_path, ctx):
+    file = tmp_path / "log"
+    with Logs(file=file) as logs:
+        for log in day_logs():
+            logs.append(log)
+
+    rollup = DailyRollup.open(file, ctx)
+    yesterday = (start_of_day(datetime.now()) - timedelta(days=1)).date()
+    assert rollup.day(yesterday) == {CODE: 3600, CHAT: 1800}
+    assert (tmp_path / "log.rollup").exists()
+    assert DailyRollup.open(file, ctx).day(yesterday) == {CODE: 3600, CHAT: 1800}
+
+
+def test_binary_store_in_memory(tmp_path, monkeypatch, ctx):
+    monkeypatch.chdir(tmp_path)
+    store = BinaryStore(tmp_path / "log.d")
+    store.write(day_logs())
+    logs = store.load()
+
+    rollup = DailyRollup.open(logs.file, ctx)
+    rollup.track(logs)
+    today = start_of_day(datetime.now())
+    logs.merge(LogEntry(today, "kitty", "nvim", today + timedelta(seconds=10)))
+    assert rollup.day(today.date()) == {CODE: 10}
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["log.d"]
@@ -0,0 +1,110 @@
+import random
+from pathlib import Path
+
+import pytest
+
+from src.context import Context
+from src.core import Category, LogEntry, UNCAT
+from src.rules import RuleEngine, parse_rules
+
+RULES_FILE = Path(__file__).parent.parent / "data" / "config.yatta"
+
+
+def sequential(rules, name):
+    """The first rule that matches, tried one by one like the configs did before the engine."""
+    folded = name.casefold()
+    for cat, rule in rules:
+        if rule in folded if isinstance(rule, str) else rule.search(name):
+            return cat
+    return None
+
+
+def categories_of(text):
+    names = [line.strip().strip(":") for line in text.splitlines()
+             if line.strip() and not line.startswith((" ", "#"))]
+    return {name: Category(name, i) for i, name in enumerate(names)}
+
+
+def names_for(rules, count=2000, seed=0):
+    """Names that contain one or two rules, with other cases, and names that contain none."""
+    rng = random.Random(seed)
+    pieces = [rule for _, rule in rules if isinstance(rule, str)]
+    pieces += ["20240101_main.cc", "2024-q3.yaml", "Ex_GT_Ch04.pdf", "Sheet3", "week12.pdf", "SHEET3",
+               "nvim", "Mozilla Firefox", "", "ﬁle", "ß"]
+    names = []
+    for _ in range(count):
+        parts = rng.sample(pieces, rng.randint(0, 2))
+        parts = [p.upper() if rng.random() < 0.3 else p for p in parts]
+        parts.insert(rng.randint(0, len(parts)), "".join(rng.choices("abcdefghij -_.", k=rng.randint(0, 8))))
+        names.append(" ".join(parts))
+    return names
+
+
+def test_config_rules():
+    text = RULES_FILE.read_text()
+    rules = parse_rules(text, categories_of(text))
+    engine = RuleEngine(rules)
+    for name in names_for(rules):
+        assert engine.match(name) == sequential(rules, name), name
+
+
+RULES = """
+FIRST:
+    abc
+ R  Sheet\\d
+SECOND:
+    b
+ r  week\\d+
+    sheet
+THIRD:
+    abcd
+ r  ^$
+"""
+
+
+@pytest.mark.parametrize("name", [
+    "abcd", "xbx", "Sheet1", "sheet1", "SHEET1", "WEEK12", "nothing", "", "ABC week2", "sheet", "a sheet b",
+])
+def test_priorities(name):
+    rules = parse_rules(RULES, categories_of(RULES))
+    assert RuleEngine(rules).match(name) == sequential(rules, name)
+
+
+def test_regex_that_cannot_be_combined():
+    # Global flags cannot go inside the alternation
+    text = "A:\n r  (?i)^zoom\nB:\n    meeting\n R  \\d(\\d)\\1\n"
+    rules = parse_rules(text, categories_of(text))
+    engine = RuleEngine(rules)
+    for name in ["Zoom meeting", "a meeting", "a zoom", "1233", "1234", "zoom"]:
+        assert engine.match(name) == sequential(rules, name), name
+
+
+def test_default_category():
+    text = "CODE:\n    nvim\n"
+    engine = RuleEngine(parse_rules(text, categories_of(text)))
+    assert engine(LogEntry.from_micros(0, "kitty", "nvim yatta", 1)).name == "CODE"
+    assert engine(LogEntry.from_micros(0, "kitty", "htop", 1)) is UNCAT
+
+
+def test_unknown_category():
+    with pytest.raises(KeyError):
+        parse_rules("NOPE:\n    a\n", {})
+    with pytest.raises(AssertionError):
+        parse_rules("    a\n", {})
+
+
+def test_config_with_rules(tmp_path):
+    (tmp_path / "rules.yatta").write_text(RULES)
+    config = tmp_path / "config.py"
+    config.write_text('from src.core import Category\n\n'
+                      'FIRST, SECOND, THIRD = Category("FIRST", 1), Category("SECOND", 2), Category("THIRD", 3)\n'
+                      'RULES = "rules.yatta"\n'
+                      'DEFAULT = THIRD\n')
+    ctx = Context.load(config)
+    assert ctx.cache_key == ("name",)
+    assert ctx.get_cat(LogEntry.from_micros(0, "kitty", "Sheet1", 1)).name == "FIRST"
+    assert ctx.get_cat(LogEntry.from_micros(0, "kitty", "htop", 1)).name == "THIRD"
+
+    # The rules are part of the version of the config, which the caches depend on
+    (tmp_path / "rules.yatta").write_text(RULES.replace("abcd", "htop"))
+    assert Context.load(config).version != ctx.version
@@ -0,0 +1,154 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from src.samplers import SwaySampler
+
+WINDOW_EVENT = 3 | 0x80000000
+WORKSPACE_EVENT = 0 | 0x80000000
+
+TREE = {
+    "type": "root",
+    "nodes": [
+        {"type": "output", "nodes": [
+            {"type": "workspace", "nodes": [
+                {"type": "con", "app_id": "firefox", "name": "Mozilla Firefox", "focused": False},
+            ], "floating_nodes": [
+                {"type": "floating_con", "app_id": None, "name": "Telegram", "focused": True},
+            ]},
+        ]},
+    ],
+}
+
+
+class FakeSway:
+    """A sway IPC socket that answers GET_TREE and SUBSCRIBE, and sends events on demand."""
+
+    def __init__(self, path, tree=TREE):
+        self.path = str(path)
+        self.tree = tree
+        self.subscriber = None
+        self.subscribed = threading.Event()
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        header = SwaySampler._recv_exactly(conn, SwaySampler.HEADER.size)
+        magic, length, kind = SwaySampler.HEADER.unpack(header)
+        assert magic == SwaySampler.MAGIC
+        payload = SwaySampler._recv_exactly(conn, length)
+        if kind == SwaySampler.GET_TREE:
+            self.send(conn, kind, self.tree)
+            conn.close()
+        elif kind == SwaySampler.SUBSCRIBE:
+            assert json.loads(payload) == ["window", "workspace"]
+            self.send(conn, kind, {"success": True})
+            self.subscriber = conn
+            self.subscribed.set()
+
+    @staticmethod
+    def send(conn, kind, data, chunk=None, magic=SwaySampler.MAGIC):
+        payload = json.dumps(data).encode()
+        message = SwaySampler.HEADER.pack(magic, len(payload), kind) + payload
+        if chunk is None:
+            conn.sendall(message)
+        else:
+            for i in range(0, len(message), chunk):
+                conn.sendall(message[i:i + chunk])
+
+    def event(self, kind, data, **kwargs):
+        assert self.subscribed.wait(5)
+        self.send(self.subscriber, kind, data, **kwargs)
+
+    def close(self):
+        if self.subscriber is not None:
+            self.subscriber.close()
+        self.server.close()
+
+
+@pytest.fixture
+def sway(tmp_path):
+    fake = FakeSway(tmp_path / "sway.sock")
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def sampler(sway):
+    sampler = SwaySampler(sway.path).start()
+    yield sampler
+    sampler.close()
+
+
+def focus(app_id, name, change="focus", focused=True):
+    return {"change": change, "container": {"app_id": app_id, "name": name, "focused": focused}}
+
+
+def test_query_finds_the_focused_window(sampler):
+    # app_id is None for xwayland windows, and jq printed null
+    assert sampler.window() == ("null", "Telegram")
+    assert not sampler.wait(0.05)
+
+
+def test_follows_focus_and_title(sway, sampler):
+    sampler.window()
+    sway.event(WINDOW_EVENT, focus("kitty", "nvim"))
+    assert sampler.wait(5)
+    assert sampler.window() == ("kitty", "nvim")
+
+    sway.event(WINDOW_EVENT, focus("kitty", "nvim src/core.py", change="title"))
+    assert sampler.wait(5)
+    assert sampler.window() == ("kitty", "nvim src/core.py")
+
+
+def test_ignores_other_windows(sway, sampler):
+    sampler.window()
+    sway.event(WINDOW_EVENT, focus("firefox", "Loading...", change="title", focused=False))
+    sway.event(WINDOW_EVENT, focus("firefox", "Mozilla Firefox", change="close", focused=False))
+    assert not sampler.wait(0.2)
+    assert sampler.window() == ("null", "Telegram")
+
+
+def test_close_and_empty_workspace(sway, sampler):
+    sampler.window()
+    sway.event(WINDOW_EVENT, focus(None, "Telegram", change="close"))
+    assert sampler.wait(5)
+    assert sampler.window() == ("", "")
+
+    sway.event(WORKSPACE_EVENT, {"change": "focus", "current": {"type": "workspace", "name": "2", "focused": True}})
+    assert sampler.wait(5)
+    assert sampler.window() == ("null", "2")
+
+
+def test_messages_split_in_pieces(sway, sampler):
+    sampler.window()
+    sway.event(WINDOW_EVENT, focus("kitty", "é" * 100), chunk=3)
+    assert sampler.wait(5)
+    assert sampler.window() == ("kitty", "é" * 100)
+
+
+def test_lost_connection(sway, sampler):
+    sway.subscribed.wait(5)
+    sway.subscriber.close()
+    sampler._thread.join(5)
+    with pytest.raises(ConnectionError):
+        sampler.window()
+
+
+def test_invalid_magic(sway, sampler):
+    sway.event(WINDOW_EVENT, focus("kitty", "nvim"), magic=b"i3-xxx")
+    sampler._thread.join(5)
+    with pytest.raises(ConnectionError):
+        sampler.window()
@@ -0,0 +1,115 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.context import Context
+from src.core import LogEntry, Logs
+from src.search import NameIndex, Pattern, search
+
+T = datetime(2024, 3, 1, 2)  # Before 4am, in the day of February 29
+NAMES = ["nvim src/core.py", "NVIM README.md", "Mozilla Firefox", "docs v2 - Mozilla Firefox", "Telegram",
+         "Été à Paris", "week12.pdf", "Sheet3", "ab", ""]
+
+
+def random_logs(seed=0, count=400):
+    """Logs over a few days, with a clock that goes back once."""
+    rng = random.Random(seed)
+    logs, t = [], T
+    for i in range(count):
+        t += timedelta(minutes=rng.choice([1, 5, 30, 90]))
+        if i == count // 2:
+            t -= timedelta(hours=30)
+        logs.append(LogEntry(t, rng.choice(["kitty", "firefox"]), rng.choice(NAMES), t + timedelta(seconds=30)))
+    return logs
+
+
+def write(file, logs):
+    with Logs(file=file) as written:
+        for log in logs:
+            written.append(log)
+
+
+def brute_force(file, pattern, start, end):
+    """The logs in the range whose name matches, testing every log."""
+    logs = Context.filter_time(Logs.load(file), start, end)
+    return [(log.start, log.name) for log in Context.filter_pattern(logs, pattern)]
+
+
+def searched(file, pattern, start=datetime.min, end=datetime.max):
+    logs = Context.filter_time(search(file, pattern, start, end), start, end)
+    return [(log.start, log.name) for log in logs]
+
+
+PATTERNS = [
+    Pattern("nvim"),
+    Pattern("nvim", ignore_case=True),
+    Pattern("été", ignore_case=True),
+    Pattern("Firefox"),
+    Pattern("not there"),
+    Pattern("ab"),
+    Pattern("nvim|Telegram", regex=True),
+    Pattern("docs( v2)? - Mozilla", regex=True),
+    Pattern("(?:v2 )?- Mozilla", regex=True),
+    Pattern("(?i)nvim.*\\.py", regex=True),
+    Pattern("readme", ignore_case=True, regex=True),
+    Pattern("week\\d+", regex=True),
+    Pattern("^$", regex=True),
+    Pattern("Sh(eet)*3", regex=True),
+    Pattern("Sh(eet)+3", regex=True),
+]
+
+
+@pytest.mark.parametrize("pattern", PATTERNS, ids=str)
+def test_same_as_testing_every_log(tmp_path, pattern):
+    file = tmp_path / "log"
+    write(file, random_logs())
+    assert searched(file, pattern) == brute_force(file, pattern, datetime.min, datetime.max)
+
+
+@pytest.mark.parametrize("days", [(0, 1), (1, 2), (0.5, 1.5), (2, 3), (3, 10)])
+def test_days_of_a_range(tmp_path, days):
+    file = tmp_path / "log"
+    write(file, random_logs())
+    start, end = T + timedelta(days=days[0]), T + timedelta(days=days[1])
+    for pattern in PATTERNS:
+        assert searched(file, pattern, start, end) == brute_force(file, pattern, start, end), pattern
+
+
+def test_literals():
+    assert Pattern("Sheet3").literals() == ["sheet3"]
+    assert Pattern("ab(cd)?ef", regex=True).literals() == ["ab", "ef"]
+    assert Pattern("ab(cd)+ef", regex=True).literals() == ["ab", "cd", "ef"]
+    assert Pattern("nvim|Telegram", regex=True).literals() == []
+    assert Pattern("(?i)NVIM\\s+core", regex=True).literals() == ["nvim", "core"]
+
+
+def test_without_the_regex_parser(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.search._regex_parser", lambda: None)
+    file = tmp_path / "log"
+    write(file, random_logs())
+    for pattern in PATTERNS:
+        assert pattern.literals() == ([] if pattern.regex else [pattern.text.casefold()])
+        assert searched(file, pattern) == brute_force(file, pattern, datetime.min, datetime.max), pattern
+
+
+def test_follows_the_log(tmp_path):
+    file = tmp_path / "log"
+    logs = random_logs()
+    write(file, logs[:100])
+    assert searched(file, Pattern("Telegram"))
+
+    # Appended logs are indexed
+    later = logs[-1].end + timedelta(days=1)
+    with Logs(file=file) as written:
+        written.append(LogEntry(later, "kitty", "new window", later + timedelta(seconds=5)))
+    assert searched(file, Pattern("new window")) == [(later, "new window")]
+
+    # A log replaced by another file, as compress does, is indexed again
+    replacement = tmp_path / "replacement"
+    write(replacement, [LogEntry(T, "kitty", "only this", T + timedelta(seconds=5))])
+    os.replace(replacement, file)
+    assert searched(file, Pattern("Telegram")) == []
+    assert searched(file, Pattern("only")) == [(T, "only this")]
+    assert NameIndex.open(file).strings == ["kitty", "only this"]
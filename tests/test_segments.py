@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.context import Context
+from src.core import LogEntry, Logs
+from src.segments import SegmentedLog, SegmentWriter, split
+
+# The month changes on April 1 at 4am
+ROTATION = datetime(2024, 4, 1, 4)
+HOUR = timedelta(hours=1)
+LOGS = [
+    LogEntry(ROTATION - 30 * HOUR, "kitty", "nvim", ROTATION - 29 * HOUR),
+    LogEntry(ROTATION - 2 * HOUR, "firefox", "docs", ROTATION - HOUR),
+    LogEntry(ROTATION - HOUR, "kitty", "nvim", ROTATION + 2 * HOUR),  # Over the rotation
+    LogEntry(ROTATION + 2 * HOUR, "telegram", "Alice", ROTATION + 3 * HOUR),
+    LogEntry(ROTATION + 30 * HOUR, "kitty", "nvim", ROTATION + 31 * HOUR),
+]
+RANGES = [
+    (datetime.min, datetime.max),
+    (ROTATION - HOUR / 2, ROTATION),
+    (ROTATION, ROTATION + HOUR),
+    (ROTATION + HOUR, ROTATION + 2 * HOUR),
+    (ROTATION - 3 * HOUR, ROTATION + 40 * HOUR),
+    (ROTATION + 24 * HOUR, datetime.max),
+    (datetime.min, ROTATION - 29.5 * HOUR),
+]
+
+
+def record(directory, logs, period="month"):
+    SegmentedLog.create(directory, period)
+    writer = SegmentWriter(directory)
+    for log in logs:
+        writer.write(log)
+    return writer
+
+
+def test_rotation(tmp_path):
+    directory = tmp_path / "log"
+    writer = record(directory, LOGS)
+    writer.close()
+
+    log = SegmentedLog.open(directory)
+    assert list(log.segments) == ["2024-03", "2024-04"]
+    march = log.segments["2024-03"]
+    # The log over the rotation stays in the segment it starts in, with its end
+    assert (march["count"], march["end"]) == (3, LOGS[2].end_us)
+    assert log.check("2024-03")
+    # The segment that can still be written is not sealed
+    assert log.check("2024-04") is None
+    # Only the first log of a segment bounds its start
+    assert log.overlapping(ROTATION, ROTATION + HOUR) == [log.path("2024-03")]
+    assert log.overlapping(ROTATION, ROTATION + 2 * HOUR) == [log.path("2024-03"), log.path("2024-04")]
+    assert log.overlapping(ROTATION + 3 * HOUR, None) == [log.path("2024-04")]
+
+
+@pytest.mark.parametrize("start, end", RANGES)
+@pytest.mark.parametrize("period", ["day", "month"])
+def test_reads_across_the_rotation(tmp_path, period, start, end):
+    directory = tmp_path / "log"
+    record(directory, LOGS, period).close()
+    loaded = list(Context.filter_time(Logs.load(directory, start, end), start, end))
+    assert loaded == list(Context.filter_time(LOGS, start, end))
+
+
+def test_reads_while_recording(tmp_path):
+    directory = tmp_path / "log"
+    writer = record(directory, LOGS)
+    writer.flush()
+    # The end of the last log is not written yet
+    assert list(Logs.load(directory))[:-1] == LOGS[:-1]
+    writer.close()
+    assert list(Logs.load(directory)) == LOGS
+
+
+def test_clock_going_back(tmp_path):
+    directory = tmp_path / "log"
+    late = LogEntry(ROTATION - 3 * HOUR, "kitty", "late", ROTATION - 2.5 * HOUR)
+    record(directory, LOGS + [late]).close()
+
+    # March is written again, then sealed again when April is
+    assert SegmentedLog.open(directory).check("2024-03") is None
+    writer = SegmentWriter(directory)
+    writer.write(LOGS[-1])
+    writer.close()
+    log = SegmentedLog.open(directory)
+    assert (log.check("2024-03"), log.segments["2024-03"]["count"]) == (True, 4)
+    by_start = lambda log: log.start
+    assert sorted(Logs.load(directory), key=by_start) == sorted(LOGS + [late, LOGS[-1]], key=by_start)
+
+
+def test_split(tmp_path):
+    directory = tmp_path / "log"
+    log = split(iter(LOGS), directory, "day")
+    assert list(log.segments) == ["2024-03-30", "2024-03-31", "2024-04-01", "2024-04-02"]
+    assert [log.check(name) for name in log.segments] == [True, True, True, None]
+    assert list(Logs.load(directory)) == LOGS
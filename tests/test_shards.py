@@ -0,0 +1,75 @@
+import random
+import shutil
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.cache import QueryCache
+from src.compact import compact
+from src.context import Context
+from src.core import LogEntry, Logs
+from src.search import Pattern
+from src.shards import categories, run, segments
+
+# Workers load the config from its path, so it must be a real file
+CONFIG = """
+from src.core import Category
+
+CODE = Category("Code", 0xffffff)
+CHAT = Category("Chat", 0xffa500)
+
+
+def categorize(log):
+    return CODE if "nvim" in log.name else CHAT
+"""
+
+
+@pytest.fixture
+def ctx(tmp_path):
+    config = tmp_path / "config.py"
+    config.write_text(CONFIG)
+    return Context.load(config)
+
+
+@pytest.fixture
+def logfile(tmp_path):
+    """A text log of a few days, with merged and cut logs."""
+    rng = random.Random(0)
+    file = tmp_path / "log"
+    t = datetime(2024, 3, 1, 2)
+    with Logs(file=file) as written:
+        for _ in range(2000):
+            t += timedelta(seconds=rng.choice([0, 0, 1, 60, 600]))
+            end = t + timedelta(seconds=rng.choice([1, 1, 5, 300]))
+            written.append(LogEntry(t, rng.choice(["kitty", "firefox"]), rng.choice(["nvim", "Alice", "docs"]), end))
+            t = end
+    assert len(list(segments(file))) > 2
+    return file
+
+
+def copy(file, name):
+    return shutil.copy(file, file.with_name(name))
+
+
+@pytest.mark.parametrize("filters", [(None, None, False), ("nvim", None, True),
+                                     (Pattern("ALICE", True), "Chat", False)])
+@pytest.mark.parametrize("group_by", ["C", "D", "DC"])
+def test_parallel_totals(ctx, logfile, filters, group_by):
+    start, end = datetime(2024, 3, 1, 12), datetime.max
+    one = QueryCache.open(logfile, ctx).totals(logfile, start, end, group_by, *filters, jobs=1)
+    assert one[-1]
+    other = copy(logfile, "other")
+    assert QueryCache.open(other, ctx).totals(other, start, end, group_by, *filters, jobs=2) == one
+
+
+def test_parallel_categories(ctx, logfile):
+    items = [(source, None) for source, _ in segments(logfile)]
+    assert run(ctx, categories, items, 2) == run(ctx, categories, items, 1)
+
+
+def test_parallel_compact(ctx, logfile):
+    other = copy(logfile, "other")
+    one = compact(ctx, logfile, jobs=1)
+    two = compact(ctx, other, jobs=2)
+    assert (two.read, two.written, two.total) == (one.read, one.written, one.total)
+    assert other.read_bytes() == logfile.read_bytes()
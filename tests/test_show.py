@@ -0,0 +1,64 @@
+import dataclasses
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.core import AFK, LogEntry
+from src.show import rasterize
+from tests.conftest import CHAT, CODE
+
+T = datetime(2024, 3, 1, 9)
+NAMES = {"nvim": CODE, "Alice": CHAT, "lock": AFK}
+
+
+@pytest.fixture
+def ctx(ctx):
+    return dataclasses.replace(ctx, categorize=lambda log: NAMES[log.name])
+
+
+def timeline(ctx, logs, start, end, width, min_sec_to_show=10):
+    """The timeline as print_one_time_line computed it, clamping every log to every column."""
+    one_step = (end - start) / width
+    cats = [AFK] * width
+    for i in range(width):
+        pos = start + i * one_step
+        ls = [c for log in logs if (c := log.intersected(pos, pos + one_step)) is not None]
+        if ls:
+            groups = ctx.group_category(ls)
+            groups.pop(AFK, None)
+            most_cat = max(groups, key=lambda x: ctx.tot_secs(groups[x]), default=AFK)
+            if ctx.tot_secs(groups.get(most_cat, [])) > min_sec_to_show:
+                cats[i] = most_cat
+    return cats
+
+
+def random_logs(seed, count=300):
+    """Short and long logs, with gaps."""
+    rng = random.Random(seed)
+    logs, t = [], T
+    for _ in range(count):
+        t += timedelta(seconds=rng.choice([0, 0, 7, 300]))
+        end = t + timedelta(seconds=rng.uniform(0.5, rng.choice([20, 600, 5000])))
+        logs.append(LogEntry(t, "kitty", rng.choice(list(NAMES)), end))
+        t = end
+    return logs
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("width", [1, 7, 190])
+def test_same_as_the_old_timeline(ctx, seed, width):
+    logs = random_logs(seed)
+    start, end = logs[0].start, logs[-1].end
+    # The whole day, and a range that cuts logs
+    for a, b in [(start, end), (start + (end - start) / 3, start + (end - start) / 2)]:
+        assert rasterize(ctx, logs, a, b, width) == timeline(ctx, logs, a, b, width)
+
+
+def test_min_sec_to_show(ctx):
+    logs = [LogEntry(T, "kitty", "nvim", T + timedelta(seconds=30)),
+            LogEntry(T + timedelta(seconds=30), "kitty", "lock", T + timedelta(seconds=60)),
+            LogEntry(T + timedelta(seconds=60), "kitty", "Alice", T + timedelta(seconds=65))]
+    end = T + timedelta(seconds=80)
+    assert rasterize(ctx, logs, T, end, 4) == timeline(ctx, logs, T, end, 4) == [CODE, AFK, AFK, AFK]
+    assert rasterize(ctx, logs, T, end, 4, 4) == timeline(ctx, logs, T, end, 4, 4) == [CODE, CODE, AFK, CHAT]
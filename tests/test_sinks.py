@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from src.core import LogEntry
+from src.sinks import LockEnforcer, Milestones
+from tests.conftest import CHAT, CODE
+
+T = datetime(2024, 3, 1, 12)
+
+
+class Recorded(Milestones):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    def reached(self, cat, seconds):
+        self.calls.append((cat, seconds))
+
+
+def test_every_multiple_once(ctx):
+    seconds = {CODE: 880.0}
+    sink = Recorded(ctx, lambda start, end: seconds)
+    log = LogEntry(T, "kitty", "nvim", T + timedelta(seconds=1))
+
+    for total in [880, 899.5, 900.2, 901, 1799, 2750]:
+        seconds[CODE] = total
+        sink(log)
+    assert sink.calls == [(CODE, 900.2), (CODE, 2750)]
+
+
+def test_lock_only_some_categories(monkeypatch, ctx):
+    ctx.lock15 = (CODE,)
+    commands = []
+    monkeypatch.setattr("os.system", commands.append)
+    sink = LockEnforcer(ctx, lambda start, end: {CODE: 0, CHAT: 0})
+    sink.reached(CHAT, 900)
+    sink.reached(CODE, 900)
+    assert commands == ["i3lock"]
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.context import Context
+from src.core import LogEntry, UNCAT
+from src.store import BinaryStore, CONFIG_VERSION, HEADER, MAGIC, NO_CONFIG, config_version, decode, encode
+
+T = datetime(2024, 3, 1, 12)
+
+CONFIG = """
+from src.core import Category
+CODE = Category("Code", 0xffffff)
+CHAT = Category("Chat", 0xffa500)
+
+def categorize(log):
+    return CODE if {word!r} in log.name else CHAT
+"""
+
+
+def logs():
+    return [LogEntry(T + timedelta(days=days), "kitty", name, T + timedelta(days=days, hours=1))
+            for days in (0, 40) for name in ("nvim", "docs")]
+
+
+def test_reload_recategorizes_the_store(tmp_path):
+    config = tmp_path / "config.py"
+    config.write_text(CONFIG.format(word="nvim"))
+    ctx = Context.load(str(config))
+    store = BinaryStore(tmp_path / "log.d")
+    store.write(logs(), ctx)
+    assert [log.stored_cat[1] for log in store.load()] == ["Code", "Chat"] * 2
+
+    config.write_text(CONFIG.format(word="docs"))
+    assert ctx.reload() is None
+    assert len(store.stale(ctx)) == 2
+
+    ctx.reload(store.directory).join(5)
+    assert store.stale(ctx) == []
+    assert [log.stored_cat[1] for log in store.load()] == ["Chat", "Code"] * 2
+    # A text log has no categories to update
+    assert ctx.reload(tmp_path / "log") is None
+
+
+def fields(logs):
+    return [(log.start_us, log.end_us, log.klass, log.name) for log in logs]
+
+
+def various_logs():
+    names = ["nvim", "", "Été à Paris — ✓", "docs\tv2", "nvim"]
+    return [LogEntry(T + timedelta(minutes=i), "kitty" if i % 2 else "firefox", name,
+                     T + timedelta(minutes=i, seconds=30, microseconds=i))
+            for i, name in enumerate(names * 3)]
+
+
+@pytest.mark.parametrize("logs", [[], various_logs()], ids=["empty", "logs"])
+def test_round_trip(logs):
+    data = encode(logs)
+    assert len(data) % 8 == 0
+    assert config_version(data) == NO_CONFIG
+    decoded = decode(data)
+    assert fields(decoded) == fields(logs)
+    assert all(log.stored_cat is None for log in decoded)
+
+
+def test_round_trip_with_categories(ctx):
+    logs = various_logs()
+    data = encode(logs, ctx)
+    assert config_version(data) == ctx.version
+    decoded = decode(data)
+    assert fields(decoded) == fields(logs)
+    assert [log.stored_cat for log in decoded] == [(ctx.version, ctx.get_cat(log).name) for log in logs]
+
+    # The stored categories are used while the version of the config is the same
+    ctx.categorize = lambda log: UNCAT
+    assert [ctx.get_cat(log) for log in decoded] == [ctx.categories[log.stored_cat[1]] for log in decoded]
+    ctx.version = b"other"
+    assert all(ctx.get_cat(log) is UNCAT for log in decoded)
+
+
+def test_reads_version_1():
+    logs = various_logs()
+    v2 = encode(logs)
+    # Version 1 had no config version after the header, and no categories
+    v1 = HEADER.pack(MAGIC, 1, *HEADER.unpack_from(v2)[2:]) + v2[HEADER.size + CONFIG_VERSION.size:]
+    assert config_version(v1) == NO_CONFIG
+    decoded = decode(v1)
+    assert fields(decoded) == fields(logs)
+    assert all(log.stored_cat is None for log in decoded)
+
+
+def test_rejects_other_files():
+    data = encode(various_logs())
+    with pytest.raises(ValueError):
+        decode(b"XXXX" + data[4:])
+    with pytest.raises(ValueError):
+        decode(HEADER.pack(MAGIC, 3, 0, 0) + data[HEADER.size:])
+
+
+def test_store_by_month(tmp_path, ctx):
+    store = BinaryStore(tmp_path / "log.d")
+    store.write(logs(), ctx)
+    assert list(store.segments()) == ["2024-03", "2024-04"]
+    assert fields(store.load()) == fields(logs())
+    # The month before the range is read too, since its last log may overlap it
+    assert len(store.load(T + timedelta(days=40))) == 4
+    assert len(store.load(T + timedelta(days=80))) == 2
+    assert len(store.load(None, T)) == 2
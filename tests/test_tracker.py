@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+
+from src.core import Logs
+from src.tracker import Ticker, Tracker
+
+
+class FakeSampler:
+    """A sampler whose focus changes at every wait, through [windows]."""
+
+    def __init__(self, windows, delay=0.0):
+        self.windows = list(windows)
+        self.delay = delay
+        self.closed = False
+
+    async def window_async(self):
+        await asyncio.sleep(self.delay)
+        return self.windows[0]
+
+    async def wait_async(self, timeout):
+        if len(self.windows) > 1:
+            self.windows.pop(0)
+            return True
+        # No more changes, like a real sampler until the next tick
+        await asyncio.sleep(timeout)
+        return False
+
+    def close(self):
+        self.closed = True
+
+
+def run(tracker, count):
+    """Run the tracker until it stored [count] logs."""
+    received = []
+
+    def sink(log):
+        received.append(log)
+        if len(received) == count:
+            tracker.stop()
+
+    tracker.add_sink(sink)
+    asyncio.run(tracker.run())
+    return received
+
+
+def test_logs_and_sinks():
+    sampler = FakeSampler([("kitty", "nvim"), ("kitty", "nvim"), ("firefox", "docs"), ("kitty", "nvim")])
+    logs = Logs()
+    order = []
+    tracker = Tracker(logs, sampler=sampler)
+    tracker.add_sink(lambda log: order.append(log.name))
+
+    async def slow(log):
+        await asyncio.sleep(0.01)
+        order.append("slow " + log.name)
+
+    tracker.add_sink(slow)
+    tracker.add_sink(lambda log: 1 / 0)  # Does not stop the others
+    received = run(tracker, 4)
+
+    assert [log.name for log in received] == ["nvim", "nvim", "docs", "nvim"]
+    assert [log.name for log in logs] == ["nvim", "docs", "nvim"]
+    # Each sink gets the logs in order
+    assert [o for o in order if not o.startswith("slow")] == ["nvim", "nvim", "docs", "nvim"]
+    assert [o for o in order if o.startswith("slow")] == ["slow nvim", "slow nvim", "slow docs", "slow nvim"]
+    assert tracker.metrics.logs == 4 and tracker.metrics.merged == 1
+    assert sampler.closed
+
+
+def test_slow_sampler_never_makes_negative_logs():
+    # Each sample takes longer than the time step
+    tracker = Tracker(Logs(), sampler=FakeSampler([("a", "1"), ("a", "2"), ("a", "3")], delay=1.2))
+    received = run(tracker, 3)
+    assert all(log.duration > 0 for log in received)
+    assert all(log.duration > 0 for log in tracker.logs)
+    assert tracker.metrics.drift.count >= 1
+
+
+class SlowLogs(Logs):
+    """Logs that take a while to write, in the store thread."""
+
+    def append(self, log):
+        time.sleep(0.02)
+        super().append(log)
+
+
+def test_store_backpressure_loses_no_log():
+    windows = [("kitty", str(i)) for i in range(20)]
+    tracker = Tracker(SlowLogs(), sampler=FakeSampler(windows), maxsize=2)
+    received = run(tracker, 20)
+
+    assert [log.name for log in tracker.logs] == [name for _, name in windows]
+    assert [log.name for log in received] == [name for _, name in windows]
+    # The sampling waited for the store thread instead of queueing everything
+    assert tracker.metrics.blocked > 0
+    assert tracker.metrics.backlog == 2
+    assert tracker.metrics.store.count == 20 and tracker.metrics.dropped == 0
+
+
+def test_slow_sink_drops_its_oldest_logs():
+    windows = [("kitty", str(i)) for i in range(20)]
+    tracker = Tracker(Logs(), sampler=FakeSampler(windows), maxsize=2)
+    seen = []
+
+    async def slow(log):
+        await asyncio.sleep(0.02)
+        seen.append(log.name)
+
+    tracker.add_sink(slow)
+    run(tracker, 20)
+
+    assert len(tracker.logs) == 20
+    assert tracker.metrics.dropped > 0
+    assert len(seen) < 20
+    # The last log is always seen, in order
+    assert seen[-1] == "19" and seen == sorted(seen, key=int)
+    # Both sinks handled or dropped every log
+    assert tracker.metrics.sink.count + tracker.metrics.dropped == 2 * len(tracker.logs)
+
+
+def test_stop_from_another_thread():
+    tracker = Tracker(Logs(), sampler=FakeSampler([("a", "1")]))
+    tracker.stop()  # Before it even started
+    thread = threading.Thread(target=asyncio.run, args=(tracker.run(),))
+    start = time.perf_counter()
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert time.perf_counter() - start < 1
+
+
+def test_ticker_counts_missed_deadlines():
+    now = [0.0]
+    ticker = Ticker(1, lambda: now[0])
+    now[0] = 0.5
+    assert ticker.remaining() == 0.5
+    now[0] = 3.2
+    assert abs(ticker.advance() - 2.2) < 1e-9
+    assert ticker.missed == 2
+    assert abs(ticker.remaining() - 0.8) < 1e-9
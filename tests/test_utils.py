@@ -0,0 +1,15 @@
+from src.utils import LRUCache
+
+
+def test_lru_cache_counts():
+    cache = LRUCache(2)
+    cache["a"], cache["b"] = 1, 2
+    assert cache.get("a") == 1  # a is now the most recent
+    cache["c"] = 3
+    assert cache.get("b") is None
+    assert list(cache) == ["a", "c"]
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 1, 1)
+    assert cache.stats() == "1 hits, 1 misses (50%), 2/2 entries, 1 evictions"
+
+    cache.clear()
+    assert (cache.hits, cache.misses, cache.evictions, len(cache)) == (0, 0, 0, 0)
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.core import LogEntry, Logs, LogWriter
+
+T = datetime(2024, 3, 1, 12)
+SEC = timedelta(seconds=1)
+
+
+def log(start, name, duration=1, klass="kitty"):
+    """A log starting [start] seconds after T."""
+    return LogEntry(T + start * SEC, klass, name, T + (start + duration) * SEC)
+
+
+def spans(logs):
+    return [(l.name, (l.start - T) / SEC, (l.end - T) / SEC) for l in logs]
+
+
+def test_writer_recovers_the_end(tmp_path):
+    file = tmp_path / "log"
+    writer = LogWriter(file, flush_lines=1)
+    first, last = log(0, "a"), log(1, "b")
+    writer.write(first)
+    writer.write(last)
+    last.end = T + 30 * SEC
+    writer.flush()
+    # yatta is killed: the end of the last log is only in the marker
+    writer._handle.close()
+    writer._lock.close()
+    assert writer.marker.exists()
+
+    LogWriter(file).close()
+    assert not writer.marker.exists()
+    assert spans(Logs.load(file)) == [("a", 0, 1), ("b", 1, 30)]
+
+
+def test_writer_keeps_a_complete_log(tmp_path):
+    file = tmp_path / "log"
+    with Logs(file=file) as logs:
+        logs.append(log(0, "a", 5))
+    content = file.read_text()
+    # A marker left from a previous run does not end the log twice
+    (tmp_path / "log.end").write_text((T + 60 * SEC).isoformat())
+
+    LogWriter(file).close()
+    assert file.read_text() == content
+    assert not (tmp_path / "log.end").exists()
+
+
+def test_writer_ignores_a_marker_before_the_start(tmp_path):
+    file = tmp_path / "log"
+    file.write_text(f"---\n{T.isoformat()}\nkitty\na\n")
+    (tmp_path / "log.end").write_text((T - SEC).isoformat())
+
+    LogWriter(file).close()
+    # Without an end, the log lasts one second
+    assert spans(Logs.load(file)) == [("a", 0, 1)]
+
+
+def test_writer_locks_the_log(tmp_path):
+    file = tmp_path / "log"
+    writer = LogWriter(file)
+    with pytest.raises(RuntimeError):
+        LogWriter(file)
+    writer.close()
+    LogWriter(file).close()